@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from app.tickers import ticker_field
+
+# ------------------------
+# Agrégats quotidiens des Roll par sous-jacent
+# ------------------------
+
+# Une ligne par (Date, UndTkr, racine du ticker), calculée sur les lignes de
+# synthèse des Roll (Roll et Roll Client) d'une journée ; la table est tenue à
+# jour par app.history.save_day
+ROLL_STRUCTURES = ['Roll', 'Roll Client']
+AGGREGATE_KEYS = ['Date', 'UndTkr', 'Racine']
+AGGREGATE_COLUMNS = AGGREGATE_KEYS + ['rolls', 'roll_clients', 'roll_client_share', 'notional', 'avg_level']
+
+
+def empty_aggregates():
+    return pd.DataFrame({name: pd.Series(dtype='datetime64[ns]' if name == 'Date' else float)
+                         for name in AGGREGATE_COLUMNS})
+
+
+def daily_roll_aggregates(df):
+    """
+    Agrégats des Roll d'une journée (sortie du traitement ou partition de
+    l'historique) : nombre de Roll, nombre et part de Roll Client, Notional
+    cumulé et Level moyen des lignes de synthèse.
+    """
+    rolls = df[df['Structure'].isin(ROLL_STRUCTURES)]
+    if rolls.empty:
+        return empty_aggregates()
+    rolls = pd.DataFrame({
+        'Date': pd.to_datetime(rolls['Date']).dt.normalize(),
+        'UndTkr': rolls['UndTkr'].astype(object),
+        'Racine': ticker_field(rolls['Ticker'], 'root'),
+        'roll_client': (rolls['Structure'] == 'Roll Client').to_numpy(dtype=np.int64),
+        'notional': pd.to_numeric(rolls['Notional'], errors='coerce'),
+        'level': pd.to_numeric(rolls['Level'], errors='coerce'),
+    })
+    grouped = rolls.groupby(AGGREGATE_KEYS, dropna=False, sort=True)
+    aggregates = grouped.agg(rolls=('roll_client', 'size'), roll_clients=('roll_client', 'sum'),
+                             notional=('notional', 'sum'), avg_level=('level', 'mean')).reset_index()
+    aggregates['roll_client_share'] = aggregates['roll_clients'] / aggregates['rolls']
+    return aggregates[AGGREGATE_COLUMNS]
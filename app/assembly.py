@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+
+from app.tickers import ticker_field
+
+# ------------------------
+# Assemblage des lignes Roll (résumé + legs)
+# ------------------------
+
+# Colonnes recopiées depuis la première leg dans la ligne résumé
+SUMMARY_FIRST_LEG_COLUMNS = ['Size', 'Price', 'Volume', '1DChg', 'UndTkr', '1PtVal',
+                             'Exch', 'UndCmpName', 'UndPrc', 'Date']
+HELPER_COLUMNS = ['roll_counter', 'order', 'contract_year', 'contract_month']
+
+
+def build_roll_rows(df_roll_sorted, date_code):
+    """
+    Construit le bloc Roll final à partir des legs triées : une ligne résumé
+    (Merge Roll, avec calcul du "Level") par roll ayant au moins deux legs,
+    suivie de ses legs (L1 à Lk pour les structures de plus de deux legs). Les
+    rolls groupés (-L0) deviennent directement des "Roll".
+
+    Toutes les étapes sont faites par colonnes (groupby cumcount) plutôt que
+    roll par roll ; le résultat est identique à l'ancienne construction ligne à ligne.
+    """
+    by_roll = df_roll_sorted.groupby('roll_counter', sort=False)
+    position = by_roll.cumcount().to_numpy()
+    group_size = by_roll['roll_counter'].transform('size').to_numpy()
+    row1 = df_roll_sorted[(position == 0) & (group_size >= 2)]
+    row2 = df_roll_sorted[(position == 1) & (group_size >= 2)]
+
+    if len(row1):
+        summary = {
+            'Time': row1['Time'].to_numpy(),
+            'Level': (row2['Price'].to_numpy() / row1['Price'].to_numpy() - 1) * 100,
+            'Ticker': row1['Ticker'].to_numpy() + ticker_field(row2['Ticker'], 'contract'),
+            'Notional': (row1['Notional'].to_numpy() + row2['Notional'].to_numpy()) / 2,
+        }
+        for col in SUMMARY_FIRST_LEG_COLUMNS:
+            summary[col] = row1[col].to_numpy()
+        summary['FutName'] = row1['FutName'].to_numpy() + row2['FutName'].str[-5:].to_numpy()
+        if (group_size > 2).any():
+            _multi_leg_summary(summary, df_roll_sorted[group_size > 2], position[group_size > 2],
+                               (group_size[position == 0] > 2)[group_size[position == 0] >= 2])
+        roll_numbers = row1['roll_counter'].to_numpy()
+        summary['Structure_ID'] = [f"{date_code}-R-{r}" for r in roll_numbers]
+        summary['Structure'] = "Roll"
+        summary['roll_counter'] = roll_numbers
+        summary['order'] = 0
+        # Même inférence de types que la construction à partir de dictionnaires
+        df_summary = pd.DataFrame(summary).infer_objects()
+    else:
+        df_summary = pd.DataFrame()
+
+    df_legs = df_roll_sorted.assign(
+        order=pd.to_numeric(df_roll_sorted['Structure_ID'].str.extract(r'-L(\d+)$', expand=False),
+                            errors='coerce').fillna(2).astype(int)
+    ).infer_objects()
+
+    df_roll_final = pd.concat([df_summary, df_legs], ignore_index=True)
+    df_roll_final = df_roll_final.sort_values(by=['roll_counter', 'order'])
+    df_roll_final = df_roll_final.drop(columns=HELPER_COLUMNS, errors='ignore')
+    mask_l0 = df_roll_final['Structure_ID'].str.contains("-L0", na=False)
+    df_roll_final.loc[mask_l0, 'Structure_ID'] = df_roll_final.loc[mask_l0, 'Structure_ID'].str.replace("-L0", "", regex=False)
+    df_roll_final.loc[mask_l0, 'Structure'] = "Roll"
+    return df_roll_final
+
+
+def _multi_leg_summary(summary, legs, position, is_multi):
+    """
+    Corrige en place les lignes résumé des structures de plus de deux legs
+    (`is_multi`, aligné sur le résumé) à partir de leurs legs triées par
+    échéance : Level entre la première et la dernière leg, Ticker et FutName
+    complétés de l'échéance de chaque leg suivante, Notional moyen des legs.
+    """
+    by_roll = legs.groupby('roll_counter', sort=False)
+    first, last = by_roll['Price'].transform('first'), by_roll['Price'].transform('last')
+    level = ((last / first - 1) * 100)[position == 0].to_numpy()
+    following = legs[position > 0]
+    contracts = pd.Series(ticker_field(following['Ticker'], 'contract'), index=following.index)
+    suffixes = following['FutName'].str[-5:]
+    tickers = contracts.groupby(following['roll_counter'], sort=False).agg(''.join)
+    fut_names = suffixes.groupby(following['roll_counter'], sort=False).agg(''.join)
+    roll_numbers = legs['roll_counter'][position == 0].to_numpy()
+    for column, values in [
+        ('Level', level),
+        ('Ticker', legs['Ticker'][position == 0].to_numpy() + tickers.reindex(roll_numbers).to_numpy()),
+        ('Notional', by_roll['Notional'].mean().reindex(roll_numbers).to_numpy()),
+        ('FutName', legs['FutName'][position == 0].to_numpy() + fut_names.reindex(roll_numbers).to_numpy()),
+    ]:
+        column_values = np.array(summary[column], dtype=object if column in ('Ticker', 'FutName') else float)
+        column_values[is_multi] = values
+        summary[column] = column_values
+
+
+def excel_row_numbers(df, first_row=2):
+    """
+    Numéros de ligne Excel (en-tête en ligne 1) sous forme de chaînes, alignés
+    sur df ; `first_row` est la ligne de la première ligne de df.
+    """
+    return pd.Series(np.arange(len(df)) + first_row, index=df.index).astype(str)
@@ -0,0 +1,194 @@
+import argparse
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+
+from app.export import EXPORT_FORMATS, write_output
+from app.history import HISTORY_DIR, atomic_write, file_lock, save_day
+from app.ingestion import SCHEMA_SALT
+from app.parse_cache import content_key
+from app.pipeline import process_grid_files
+from app.profiling import RUN_LOG, RunProfile, append_run
+
+# ------------------------
+# Traitement par lot des dossiers data/raw/AAAAMMJJ
+# ------------------------
+
+# python -m app.batch [--raw-dir data/raw] [--out-dir data/processed] [--workers N] [--force]
+#                     [--format xlsx parquet arrow csv]
+RAW_DIR = "data/raw"
+OUTPUT_DIR = "data/processed"
+BATCH_MANIFEST = "batch_manifest.json"
+DATE_FOLDER = re.compile(r"^\d{8}$")
+
+
+def find_date_folders(raw_dir=RAW_DIR):
+    """
+    Retourne {AAAAMMJJ: [fichiers .xlsx]} pour chaque dossier daté de `raw_dir`.
+    """
+    folders = {}
+    for entry in sorted(os.scandir(raw_dir), key=lambda e: e.name):
+        if not entry.is_dir() or not DATE_FOLDER.match(entry.name):
+            continue
+        files = sorted(os.path.join(entry.path, name) for name in os.listdir(entry.path)
+                       if name.lower().endswith(".xlsx") and not name.startswith("~$"))
+        if files:
+            folders[entry.name] = files
+    return folders
+
+
+def inputs_fingerprint(paths):
+    """
+    Empreinte des fichiers d'une date (noms et contenus) : elle change dès qu'un
+    fichier est ajouté, retiré ou modifié.
+    """
+    parts = []
+    for path in paths:
+        with open(path, "rb") as f:
+            parts.append(f"{os.path.basename(path)}:{content_key(f.read(), SCHEMA_SALT)}")
+    return content_key("\n".join(parts).encode())
+
+
+def read_batch_manifest(output_dir=OUTPUT_DIR):
+    path = os.path.join(output_dir, BATCH_MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_batch_manifest(manifest, output_dir):
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+
+    atomic_write(os.path.join(output_dir, BATCH_MANIFEST), write)
+
+
+def output_paths(key, output_dir=OUTPUT_DIR, formats=("xlsx",)):
+    return {fmt: os.path.join(output_dir, key + EXPORT_FORMATS[fmt]) for fmt in formats}
+
+
+def record_date(key, paths, fingerprint, rows, output_dir=OUTPUT_DIR):
+    """
+    Inscrit dans le manifeste une date traitée avec succès et l'enregistre.
+    Le manifeste est relu sous verrou : les dates inscrites entre-temps par un
+    autre lot ou par la surveillance (app.watch) sont conservées.
+    """
+    with file_lock(os.path.join(output_dir, f"{BATCH_MANIFEST}.lock")):
+        manifest = read_batch_manifest(output_dir)
+        manifest[key] = {
+            "fingerprint": fingerprint,
+            "files": [os.path.basename(path) for path in paths],
+            "rows": rows,
+            "processed_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        _write_batch_manifest(manifest, output_dir)
+
+
+def process_date(key, paths, output_dir=OUTPUT_DIR, history_dir=HISTORY_DIR, profile=None, formats=("xlsx",),
+                 max_workers=1):
+    """
+    Traite les fichiers d'une date : fichier AAAAMMJJ.<ext> dans `output_dir`
+    pour chacun des `formats` (voir app.export.EXPORT_FORMATS) et partition
+    correspondante dans l'historique.
+    Retourne (lignes, messages d'erreur) ; lignes vaut None en cas d'échec.
+    """
+    profile = profile or RunProfile()
+    messages = []
+    trade_date = pd.to_datetime(key, format="%Y%m%d")
+    files = [(os.path.basename(path), path) for path in paths]
+    # Par défaut lecture séquentielle des fichiers : les dates sont déjà traitées en parallèle
+    processed = process_grid_files(files, trade_date, report_error=messages.append, max_workers=max_workers,
+                                   profile=profile)
+    if processed is None:
+        return None, messages
+    with profile.stage("historique", rows_in=len(processed)):
+        save_day(processed, history_dir)
+    with profile.stage("export", rows_in=len(processed)):
+        for fmt, path in output_paths(key, output_dir, formats).items():
+            atomic_write(path, lambda tmp: write_output(processed, tmp, fmt))
+    return len(processed), messages
+
+
+def _process_date_safe(key, paths, output_dir, history_dir, formats):
+    # Le profil revient au processus parent, seul à écrire dans le journal
+    profile = RunProfile(source="batch", trade_date=key, files=len(paths))
+    try:
+        rows, messages = process_date(key, paths, output_dir, history_dir, profile, formats)
+    except Exception as e:
+        rows, messages = None, [f"Erreur lors du traitement : {e}"]
+    return rows, messages, profile.to_dict()
+
+
+def run_batch(raw_dir=RAW_DIR, output_dir=OUTPUT_DIR, history_dir=HISTORY_DIR,
+              workers=None, force=False, log=print, run_log=RUN_LOG, formats=("xlsx",)):
+    """
+    Traite toutes les dates de `raw_dir` dont les fichiers ont changé depuis le
+    dernier passage ou dont un des `formats` de sortie manque (toutes si
+    `force`), en parallèle sur `workers` processus.
+    Le manifeste est mis à jour après chaque date réussie : un lot interrompu
+    reprend là où il s'est arrêté. Le profil de chaque date est ajouté à `run_log`.
+    Retourne {AAAAMMJJ: "ok" | "ignoré" | "échec"}.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = read_batch_manifest(output_dir)
+    status = {}
+    pending = {}
+    for key, paths in find_date_folders(raw_dir).items():
+        fingerprint = inputs_fingerprint(paths)
+        previous = manifest.get(key, {})
+        up_to_date = (previous.get("fingerprint") == fingerprint
+                      and all(os.path.exists(path) for path in output_paths(key, output_dir, formats).values()))
+        if up_to_date and not force:
+            status[key] = "ignoré"
+        else:
+            pending[key] = (paths, fingerprint)
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(pending))) as pool:
+            futures = {pool.submit(_process_date_safe, key, paths, output_dir, history_dir, formats): key
+                       for key, (paths, _) in pending.items()}
+            for future in as_completed(futures):
+                key = futures[future]
+                rows, messages, run = future.result()
+                append_run(run, run_log)
+                for message in messages:
+                    log(f"{key} : {message}")
+                if rows is None:
+                    status[key] = "échec"
+                    continue
+                status[key] = "ok"
+                record_date(key, pending[key][0], pending[key][1], rows, output_dir)
+                log(f"{key} : {rows} lignes")
+    return dict(sorted(status.items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Traitement par lot des dossiers data/raw/AAAAMMJJ")
+    parser.add_argument("--raw-dir", default=RAW_DIR)
+    parser.add_argument("--out-dir", default=OUTPUT_DIR)
+    parser.add_argument("--history-dir", default=None,
+                        help="historique Parquet (par défaut <out-dir>/history)")
+    parser.add_argument("--workers", type=int, default=None, help="nombre de dates traitées en parallèle")
+    parser.add_argument("--force", action="store_true", help="retraiter aussi les dates inchangées")
+    parser.add_argument("--format", nargs="+", choices=list(EXPORT_FORMATS), default=["xlsx"], dest="formats",
+                        help="formats du fichier traité (hors xlsx, formules Bloomberg laissées vides)")
+    args = parser.parse_args(argv)
+
+    history_dir = args.history_dir or os.path.join(args.out_dir, "history")
+    run_log = os.path.join(args.out_dir, os.path.basename(RUN_LOG))
+    status = run_batch(args.raw_dir, args.out_dir, history_dir, args.workers, args.force, run_log=run_log,
+                       formats=args.formats)
+    counts = {label: list(status.values()).count(label) for label in ("ok", "ignoré", "échec")}
+    print(f"{counts['ok']} date(s) traitée(s), {counts['ignoré']} inchangée(s), {counts['échec']} en échec")
+    return 1 if counts["échec"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+# ------------------------
+# Détection des Roll-Client
+# ------------------------
+
+def same_leg_value(column):
+    """
+    Règle Roll-Client : les legs du roll partagent la même valeur de `column`.
+    """
+    return lambda legs: legs[column].nunique() == 1
+
+
+# Une ligne de synthèse "Roll" devient "Roll Client" si l'une des règles est vérifiée
+ROLL_CLIENT_RULES = [same_leg_value('Price'), same_leg_value('Notional')]
+
+
+def classify_roll_clients(df, rules=ROLL_CLIENT_RULES):
+    """
+    Transforme en place les lignes de synthèse 'Roll' en 'Roll Client' lorsque le roll
+    a exactement deux 'Leg' et qu'au moins une des règles est vérifiée.
+
+    La clé de regroupement (AAAAMMJJ-R-n) est calculée une seule fois, sur les seules
+    lignes Roll/Leg ; chaque règle est évaluée par colonne sur le groupby des legs.
+    """
+    structure = df['Structure']
+    in_scope = structure.isin(['Roll', 'Leg'])
+    roll_group = df.loc[in_scope, 'Structure_ID'].str.extract(r'(\d{8}-R-\d+)', expand=False)
+    is_leg = structure[in_scope] == 'Leg'
+
+    # Clé NaN hors legs : le groupby les ignore sans copier le DataFrame
+    legs = df.groupby(roll_group.where(is_leg).reindex(df.index))
+    is_client = legs.size() == 2
+    matches_rule = False
+    for rule in rules:
+        matches_rule = matches_rule | rule(legs)
+    client_groups = is_client[is_client & matches_rule].index
+
+    is_summary = ~is_leg & roll_group.isin(client_groups)
+    df.loc[is_summary[is_summary].index, 'Structure'] = 'Roll Client'
+    return df
@@ -0,0 +1,120 @@
+import io
+import os
+import sys
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from app.history import atomic_write
+
+# ------------------------
+# Cours de clôture locaux (à la place des formules BDH)
+# ------------------------
+
+# python -m app.closing_prices export1.csv [export2.xlsx ...]
+# Un cours PX_CLOSE_1D par (ticker de l'indice sous-jacent, date de trade),
+# c'est-à-dire la valeur que renverrait BDH(UndTkr & " Index", "PX_CLOSE_1D", Date, Date)
+CLOSING_PRICES_PATH = "data/closing_prices.parquet"
+# Noms de colonnes acceptés dans les exports de cours
+COLUMN_ALIASES = {
+    'Ticker': ['Ticker', 'UndTkr', 'Security'],
+    'Date': ['Date'],
+    'Close': ['PX_CLOSE_1D', 'Closing1d', 'Close'],
+}
+# Lignes dont la colonne Closing1d porte une formule BDH
+CLOSING_STRUCTURES = ['Roll', 'Roll Client', 'Outright']
+
+
+def read_price_export(source, name=""):
+    """
+    Lit un export de cours (CSV ou xlsx, chemin ou bytes) avec une colonne
+    ticker, une colonne Date et une colonne PX_CLOSE_1D (voir COLUMN_ALIASES).
+    Retourne un DataFrame (Ticker, Date, Close).
+    """
+    name = name or (source if isinstance(source, str) else "")
+    data = io.BytesIO(source) if isinstance(source, bytes) else source
+    df = pd.read_csv(data) if name.lower().endswith(".csv") else pd.read_excel(data)
+    columns = {}
+    for target, aliases in COLUMN_ALIASES.items():
+        found = [alias for alias in aliases if alias in df.columns]
+        if not found:
+            raise ValueError(f"Colonne {target} introuvable (noms acceptés : {', '.join(aliases)})")
+        columns[target] = df[found[0]]
+    prices = pd.DataFrame(columns)
+    # Les tickers sont ceux de la colonne UndTkr, sans le suffixe " Index" de BDH
+    prices['Ticker'] = prices['Ticker'].astype(str).str.strip().str.replace(r"\s+Index$", "", regex=True)
+    prices['Date'] = pd.to_datetime(prices['Date'], errors='coerce').dt.normalize()
+    prices['Close'] = pd.to_numeric(prices['Close'], errors='coerce')
+    return prices.dropna().reset_index(drop=True)
+
+
+def import_price_exports(sources, path=CLOSING_PRICES_PATH):
+    """
+    Ajoute les exports de cours (couples (nom, chemin ou bytes)) au fichier
+    local ; un cours déjà présent pour le même (ticker, date) est remplacé.
+    Retourne le nombre de cours lus.
+    """
+    new = pd.concat([read_price_export(source, name) for name, source in sources], ignore_index=True)
+    frames = [pd.read_parquet(path), new] if os.path.exists(path) else [new]
+    merged = (pd.concat(frames, ignore_index=True)
+                .drop_duplicates(['Ticker', 'Date'], keep='last')
+                .sort_values(['Ticker', 'Date'])
+                .reset_index(drop=True))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    atomic_write(path, lambda tmp: merged.to_parquet(tmp, index=False))
+    return len(new)
+
+
+def load_closing_prices(path=CLOSING_PRICES_PATH):
+    """
+    Cours indexés par (Ticker, Date), ou None sans fichier local. Le fichier
+    n'est relu que s'il a changé.
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    return _read_closing_prices(path, mtime)
+
+
+@lru_cache(maxsize=4)
+def _read_closing_prices(path, mtime):
+    prices = pd.read_parquet(path)
+    return prices.set_index(['Ticker', 'Date'])['Close'].sort_index()
+
+
+def fill_closing_prices(df, prices=None):
+    """
+    Remplace, pour les lignes dont le cours est connu, la formule BDH de
+    "Closing1d" par le cours et la formule "Level" des Outright par
+    Price / Closing1d ; les autres lignes gardent leurs formules.
+    `prices` : résultat de load_closing_prices (fichier local par défaut).
+    """
+    prices = load_closing_prices() if prices is None else prices
+    if prices is None or not len(prices):
+        return df
+    rows = df.index[df['Structure'].isin(CLOSING_STRUCTURES).to_numpy()]
+    if not len(rows):
+        return df
+    keys = pd.MultiIndex.from_arrays([
+        df.loc[rows, 'UndTkr'].astype(str).to_numpy(),
+        pd.to_datetime(df.loc[rows, 'Date']).dt.normalize().to_numpy(),
+    ])
+    closes = prices.reindex(keys).to_numpy(dtype=float)
+    found = ~np.isnan(closes)
+    hits = rows[found]
+    df.loc[hits, 'Closing1d'] = closes[found]
+    outrights = hits[(df.loc[hits, 'Structure'] == 'Outright').to_numpy()]
+    if len(outrights):
+        df.loc[outrights, 'Level'] = (df.loc[outrights, 'Price'].to_numpy(dtype=float)
+                                      / df.loc[outrights, 'Closing1d'].to_numpy(dtype=float))
+    return df
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage : python -m app.closing_prices export1.csv [export2.xlsx ...]")
+        sys.exit(1)
+    count = import_price_exports([(os.path.basename(path), path) for path in sys.argv[1:]])
+    print(f"{count} cours importés dans {CLOSING_PRICES_PATH}")
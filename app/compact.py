@@ -0,0 +1,61 @@
+import re
+
+import pandas as pd
+
+from app.trade_dates import DATE_IN_TIME
+
+# ------------------------
+# Représentation compacte de la journée en cours de traitement
+# ------------------------
+
+# Colonnes texte très répétées (quelques centaines de valeurs distinctes par
+# journée) : une catégorie stocke chaque valeur une fois et un code par ligne
+CATEGORY_COLUMNS = ['Ticker', 'UndTkr', 'Exch', 'FutName', 'UndCmpName']
+# Colonnes de travail retirées avant l'assemblage du fichier traité
+COMPACT_COLUMNS = ['seconds']
+# Date en tête d'une cellule Time texte (voir app.trade_dates)
+TIME_DATE_PREFIX = re.compile(rf"^\s*{DATE_IN_TIME}[ T]+")
+
+
+def parse_times(times):
+    """
+    Cellules Time (texte HH:MM:SS, heure ou date-heure) en datetime, NaT sans
+    heure. Une date en tête d'un texte ("AAAA-MM-JJ HH:MM:SS", "MM/JJ/AAAA
+    HH:MM:SS") est ignorée : seule l'heure compte, la date de trade étant
+    déterminée à part (voir app.trade_dates.group_by_date).
+    """
+    parsed = pd.to_datetime(times, format='%H:%M:%S', errors='coerce')
+    # Seules les cellules non reconnues sont reprises : aucun coût pour un fichier HH:MM:SS
+    failed = parsed.isna().to_numpy() & times.notna().to_numpy()
+    if failed.any():
+        clock = times[failed].map(lambda v: TIME_DATE_PREFIX.sub("", v) if isinstance(v, str) else v)
+        parsed[failed] = pd.to_datetime(clock, format='%H:%M:%S', errors='coerce')
+    return parsed
+
+
+def compact_trades(df):
+    """
+    Normalise les colonnes de travail de la journée : 'Time' (voir parse_times)
+    en datetime.time pour la sortie et en secondes depuis minuit (colonne
+    'seconds', NaN sans heure) pour l'appariement et les tris, colonnes de
+    CATEGORY_COLUMNS en catégories.
+    """
+    parsed = parse_times(df['Time'])
+    df['Time'] = parsed.dt.time
+    df['seconds'] = (parsed - parsed.dt.normalize()).dt.total_seconds()
+    for name in CATEGORY_COLUMNS:
+        if name in df.columns:
+            df[name] = df[name].astype('category')
+    return df
+
+
+def expand_compact(df):
+    """
+    Revient aux types de la sortie : catégories en objets (NaN si absent),
+    colonnes de travail retirées.
+    """
+    df = df.drop(columns=COMPACT_COLUMNS, errors='ignore')
+    for name in CATEGORY_COLUMNS:
+        if name in df.columns and isinstance(df[name].dtype, pd.CategoricalDtype):
+            df[name] = df[name].astype(object)
+    return df
@@ -0,0 +1,122 @@
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from app.ingestion import GRID_SCHEMA
+from app.parse_cache import CACHE_MAX_BYTES, evict
+
+# ------------------------
+# Élimination des trades en double entre fichiers grid
+# ------------------------
+
+# Empreintes des lignes de chaque fichier, nommées par l'empreinte de son
+# contenu (voir parse_cache) : un fichier déjà vu n'est pas réhaché. Même
+# éviction que le cache des fichiers lus (les moins récemment utilisées)
+HASH_CACHE_DIR = "data/cache/hashes"
+
+
+def trade_keys(df):
+    """
+    Clé 64 bits de chaque ligne : empreinte des colonnes du fichier grid
+    (nombres comparés en float, colonnes absentes vides) combinée au rang de
+    la ligne parmi ses copies identiques du même fichier. Deux exports qui se
+    recouvrent donnent les mêmes clés pour les mêmes trades, et deux trades
+    identiques d'un même fichier restent distincts.
+    """
+    row_hashes = _row_hashes(df)
+    return _combine(row_hashes, _copy_ranks(row_hashes))
+
+
+def _row_hashes(df):
+    columns = {}
+    for name, kind in GRID_SCHEMA.items():
+        values = df[name] if name in df.columns else pd.Series(np.nan, index=df.index)
+        columns[name] = values.astype(float) if kind != 'text' and values.dtype.kind in 'iuf' else values
+    return pd.util.hash_pandas_object(pd.DataFrame(columns, index=df.index), index=False).to_numpy()
+
+
+def _copy_ranks(row_hashes):
+    return pd.Series(row_hashes).groupby(row_hashes).cumcount().to_numpy()
+
+
+def _combine(row_hashes, copies):
+    return pd.util.hash_pandas_object(pd.DataFrame({'row': row_hashes, 'copy': copies}), index=False).to_numpy()
+
+
+def file_trade_keys(df, key=None, cache_dir=HASH_CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    """
+    trade_keys(df), repris du cache disque si le fichier (empreinte `key` de
+    son contenu) a déjà été haché. Le cache est ramené sous `max_bytes` après
+    chaque ajout.
+    """
+    if key is None:
+        return trade_keys(df)
+    path = os.path.join(cache_dir, f"{key}.npy")
+    try:
+        keys = np.load(path)
+        if len(keys) == len(df):
+            # Date de modification = dernier accès, pour l'éviction
+            os.utime(path)
+            return keys
+    except (OSError, ValueError):
+        pass
+    keys = trade_keys(df)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, keys)
+    os.replace(tmp_path, path)
+    evict(cache_dir, max_bytes, suffix=".npy")
+    return keys
+
+
+def drop_duplicate_trades(dataframes, seen=None, cache_dir=HASH_CACHE_DIR):
+    """
+    Retire de chaque DataFrame (dans l'ordre) les trades déjà présents dans
+    un DataFrame précédent ou dans `seen` (clés d'un traitement antérieur).
+    L'empreinte du contenu (attrs['content_key'], voir read_grid_files) sert
+    au cache des clés ; elle est retirée des DataFrames.
+    Retourne (DataFrames sans doublons, lignes retirées par DataFrame,
+    clés de tous les trades retenus, `seen` compris).
+    """
+    known = np.array([], dtype=np.uint64) if seen is None else np.asarray(seen, dtype=np.uint64)
+    kept, dropped = [], []
+    for df in dataframes:
+        keys = file_trade_keys(df, df.attrs.pop('content_key', None), cache_dir)
+        duplicate = np.isin(keys, known)
+        dropped.append(int(duplicate.sum()))
+        kept.append(df[~duplicate].reset_index(drop=True) if duplicate.any() else df)
+        known = np.concatenate([known, keys[~duplicate]])
+    return kept, dropped, known
+
+
+def drop_duplicate_chunk(df, known, file_hashes):
+    """
+    drop_duplicate_trades pour une lecture par blocs (voir app.streaming) :
+    retire du bloc `df` les trades dont la clé est dans `known` (clés triées
+    des fichiers précédents). `file_hashes` (empreintes triées des lignes des
+    blocs déjà lus du même fichier) donne le rang des copies identiques comme
+    si le fichier était lu en entier ; les clés sont donc celles de trade_keys.
+    Retourne (bloc sans doublons, lignes retirées, clés des lignes retenues,
+    file_hashes à jour).
+    """
+    row_hashes = _row_hashes(df)
+    copies = _copy_ranks(row_hashes)
+    if len(file_hashes):
+        copies = copies + (np.searchsorted(file_hashes, row_hashes, side='right')
+                           - np.searchsorted(file_hashes, row_hashes, side='left'))
+    keys = _combine(row_hashes, copies)
+    position = np.searchsorted(known, keys)
+    duplicate = known[np.minimum(position, len(known) - 1)] == keys if len(known) else np.zeros(len(keys), bool)
+    kept = df[~duplicate].reset_index(drop=True) if duplicate.any() else df
+    return kept, int(duplicate.sum()), keys[~duplicate], merge_sorted(file_hashes, row_hashes)
+
+
+def merge_sorted(sorted_values, values):
+    """
+    Tableau trié de `sorted_values` (déjà trié) et de `values`.
+    """
+    # Tri stable (timsort) : deux suites déjà triées se fusionnent en temps linéaire
+    return np.sort(np.concatenate([sorted_values, np.sort(values)]), kind='stable')
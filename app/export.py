@@ -0,0 +1,195 @@
+import datetime
+import math
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from app.history import NUMERIC_COLUMNS, columnar_values
+
+# ------------------------
+# Export Excel en une seule passe
+# ------------------------
+
+# Mêmes conventions que DataFrame.to_excel (en-tête, dates, valeurs manquantes)
+DATETIME_FORMAT = "YYYY-MM-DD HH:MM:SS"
+DATE_FORMAT = "YYYY-MM-DD"
+
+# Format appliqué aux colonnes du fichier traité
+OUTPUT_NUMBER_FORMATS = {"Level": "0.000"}
+
+CHUNK_ROWS = 10000
+
+
+def _excel_value(val):
+    """
+    Convertit une valeur pandas/numpy en (valeur, format) pour openpyxl.
+    """
+    if val is None or val is pd.NaT or val is pd.NA:
+        return "", None
+    if isinstance(val, (bool, np.bool_)):
+        return bool(val), None
+    if isinstance(val, (int, np.integer)):
+        return int(val), None
+    if isinstance(val, (float, np.floating)):
+        if math.isnan(val):
+            return "", None
+        if math.isinf(val):
+            return ("inf" if val > 0 else "-inf"), None
+        return float(val), None
+    if isinstance(val, datetime.datetime):
+        return val, DATETIME_FORMAT
+    if isinstance(val, datetime.date):
+        return val, DATE_FORMAT
+    if isinstance(val, datetime.timedelta):
+        return val.total_seconds() / 86400, "0"
+    if isinstance(val, str):
+        return val, None
+    return str(val), None
+
+
+@lru_cache(maxsize=None)
+def header_styles():
+    """
+    Police, bordure et alignement de l'en-tête. openpyxl n'est importé qu'au
+    premier export : l'application démarre sans lui.
+    """
+    from openpyxl.styles import Alignment, Border, Font, Side
+
+    thin = Side(style="thin")
+    return Font(bold=True), Border(left=thin, right=thin, top=thin, bottom=thin), \
+        Alignment(horizontal="center", vertical="top")
+
+
+def write_excel(df, destination, number_formats=None, sheet_name="Sheet1"):
+    """
+    Écrit `df` dans un classeur xlsx en mode write-only d'openpyxl, ligne par
+    ligne et par blocs de CHUNK_ROWS : les chaînes commençant par "=" sont
+    écrites comme formules et `number_formats` ({colonne: format}) est appliqué
+    à toutes les lignes de données de la colonne, y compris les cellules vides.
+    Le rendu est celui de to_excel suivi du post-traitement openpyxl, sans
+    relecture du classeur.
+    """
+    chunks = (df.iloc[start:start + CHUNK_ROWS] for start in range(0, len(df), CHUNK_ROWS))
+    write_excel_chunks(chunks, df.columns, destination, number_formats, sheet_name)
+
+
+def write_excel_chunks(chunks, columns, destination, number_formats=None, sheet_name="Sheet1"):
+    """
+    Comme write_excel, à partir d'une suite de DataFrames ayant tous les
+    colonnes `columns` dans cet ordre : seul le bloc en cours est en mémoire.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+
+    number_formats = number_formats or {}
+    header_font, header_border, header_alignment = header_styles()
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+
+    header = []
+    for name in columns:
+        cell = WriteOnlyCell(ws, value=str(name))
+        cell.font = header_font
+        cell.border = header_border
+        cell.alignment = header_alignment
+        header.append(cell)
+    ws.append(header)
+
+    column_formats = [number_formats.get(name) for name in columns]
+    for chunk in chunks:
+        values_by_column = [chunk.iloc[:, k].tolist() for k in range(chunk.shape[1])]
+        for values in zip(*values_by_column):
+            row = []
+            for val, column_format in zip(values, column_formats):
+                val, fmt = _excel_value(val)
+                fmt = column_format or fmt
+                if fmt is None:
+                    # Comme openpyxl en mode normal : une cellule vide sans style n'est pas écrite
+                    row.append(None if val == "" else val)
+                else:
+                    cell = WriteOnlyCell(ws, value=val)
+                    cell.number_format = fmt
+                    row.append(cell)
+            ws.append(row)
+
+    wb.save(destination)
+
+
+# ------------------------
+# Exports sans formules (Parquet, Arrow IPC, CSV)
+# ------------------------
+
+# Format -> extension du fichier. Hors xlsx, les formules (Closing1d, Level
+# des Outright) sont des valeurs manquantes : elles dépendent de Bloomberg.
+EXPORT_FORMATS = {"xlsx": ".xlsx", "parquet": ".parquet", "arrow": ".arrow", "csv": ".csv"}
+
+
+def to_arrow_table(df):
+    """
+    Table Arrow du fichier traité, construite colonne par colonne : seules les
+    colonnes objet et NUMERIC_COLUMNS sont converties (voir
+    app.history.to_columnar), les autres sont reprises sans copie du DataFrame.
+    """
+    arrays = {}
+    for name in df.columns:
+        values = df[name]
+        if values.dtype == object or name in NUMERIC_COLUMNS:
+            values = columnar_values(values, name in NUMERIC_COLUMNS)
+        arrays[str(name)] = pa.array(values, from_pandas=True)
+    return pa.table(arrays)
+
+
+def write_parquet(df, destination):
+    pq.write_table(to_arrow_table(df), destination)
+
+
+def write_arrow(df, destination):
+    # Format fichier Arrow IPC (lisible par pyarrow.ipc.open_file ou pandas.read_feather)
+    table = to_arrow_table(df)
+    with pa.ipc.new_file(destination, table.schema) as writer:
+        writer.write_table(table)
+
+
+def write_csv(df, destination):
+    chunks = (df.iloc[start:start + CHUNK_ROWS] for start in range(0, len(df), CHUNK_ROWS))
+    write_csv_chunks(chunks, df.columns, destination)
+
+
+def write_csv_chunks(chunks, columns, destination):
+    """
+    Écrit un CSV (UTF-8) bloc par bloc dans `destination` (chemin ou fichier
+    texte) : seul le bloc en cours est converti et en mémoire.
+    """
+    def write(f):
+        f.write(pd.DataFrame(columns=columns).to_csv(index=False))
+        for chunk in chunks:
+            chunk = chunk.copy()
+            for name in chunk.columns:
+                if chunk[name].dtype == object:
+                    chunk[name] = chunk[name].mask(chunk[name].map(lambda v: isinstance(v, str) and v.startswith("=")))
+            chunk.to_csv(f, index=False, header=False)
+
+    if isinstance(destination, str):
+        with open(destination, "w", encoding="utf-8", newline="") as f:
+            write(f)
+    else:
+        write(destination)
+
+
+def write_output(df, destination, fmt="xlsx"):
+    """
+    Écrit le fichier traité au format `fmt` (voir EXPORT_FORMATS).
+    """
+    if fmt == "xlsx":
+        write_excel(df, destination, number_formats=OUTPUT_NUMBER_FORMATS)
+    elif fmt == "parquet":
+        write_parquet(df, destination)
+    elif fmt == "arrow":
+        write_arrow(df, destination)
+    elif fmt == "csv":
+        write_csv(df, destination)
+    else:
+        raise ValueError(f"Format d'export inconnu : {fmt}")
@@ -0,0 +1,552 @@
+import json
+import numbers
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from app.aggregates import daily_roll_aggregates, empty_aggregates
+from app.dedup import trade_keys
+from app.ingestion import restore_text_nulls
+from app.tickers import ticker_field
+
+# ------------------------
+# Historique des données traitées, partitionné par date
+# ------------------------
+
+# Un fichier Parquet par date de trade (AAAAMMJJ.parquet) et un manifeste
+# décrivant les partitions présentes, avec l'index de leurs groupes de lignes
+# (voir row_group_index et app.query) : une entrée JSON par date dans manifest/
+HISTORY_DIR = "data/processed/history"
+MANIFEST_DIR = "manifest"
+LEGACY_CSV = "data/processed/processed_data.csv"
+HISTORY_ROW_GROUP = 2000
+# Agrégats quotidiens des Roll (voir app.aggregates) : un fichier par date
+# dans aggregates/ (date=AAAAMMJJ.parquet)
+AGGREGATES_DIR = "aggregates"
+# Ancien format : manifeste et agrégats de toutes les dates dans un seul
+# fichier, réécrit à chaque enregistrement ; éclaté au premier enregistrement
+MANIFEST_NAME = "manifest.json"
+AGGREGATES_NAME = "roll_aggregates.parquet"
+
+
+def date_key(value):
+    """
+    Clé de partition AAAAMMJJ d'une date (Timestamp, date ou chaîne).
+    """
+    return pd.Timestamp(value).strftime('%Y%m%d')
+
+
+def partition_path(key, history_dir=HISTORY_DIR):
+    return os.path.join(history_dir, f"{key}.parquet")
+
+
+# Colonnes toujours en float64 dans les formats colonne, quel que soit leur
+# contenu du jour (formules, "", cours locaux) : même schéma pour toutes les dates
+NUMERIC_COLUMNS = ['Level', 'Closing1d']
+
+
+def to_columnar(df):
+    """
+    Prépare un DataFrame de sortie pour un format colonne (Parquet/Arrow) :
+    les formules Excel ("=...") deviennent des valeurs manquantes, les colonnes
+    objet mêlant nombres et texte sont converties en nombres si possible,
+    sinon en texte. Les colonnes NUMERIC_COLUMNS sont toujours en float64.
+    """
+    df = df.copy()
+    for name in df.columns:
+        if df[name].dtype == object or name in NUMERIC_COLUMNS:
+            df[name] = columnar_values(df[name], name in NUMERIC_COLUMNS)
+    return df
+
+
+def columnar_values(values, numeric=False):
+    """
+    Conversion de to_columnar pour une colonne objet (Series). Avec `numeric`,
+    tout ce qui n'est pas un nombre (formule, "", texte) devient NaN et la
+    colonne est en float64.
+    """
+    if numeric:
+        is_number = values.map(lambda v: isinstance(v, numbers.Real) and not isinstance(v, bool))
+        return pd.to_numeric(values.where(is_number), errors='coerce').astype(float)
+    is_formula = values.map(lambda v: isinstance(v, str) and v.startswith("="))
+    if is_formula.any():
+        values = values.mask(is_formula)
+    types = set(type(v) for v in values.dropna())
+    if str in types and len(types) > 1:
+        # Nombres et cellules vides ("") : Closing1d rempli par app.closing_prices
+        is_empty = values.map(lambda v: isinstance(v, str) and v == "")
+        if values[~is_empty].map(lambda v: not isinstance(v, str)).all():
+            values = values.mask(is_empty)
+            types.discard(str)
+    if not types:
+        values = values.astype(float)
+    elif all(issubclass(t, numbers.Real) and not issubclass(t, bool) for t in types):
+        values = pd.to_numeric(values)
+    elif len(types) > 1:
+        values = values.map(lambda v: v if pd.isna(v) else str(v))
+    return values
+
+
+def atomic_write(path, write):
+    """
+    Appelle write(chemin_temporaire) puis remplace `path` en une opération atomique.
+    """
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _manifest_lock(history_dir):
+    return file_lock(os.path.join(history_dir, f"{MANIFEST_NAME}.lock"))
+
+
+def _manifest_entry_path(key, history_dir):
+    return os.path.join(history_dir, MANIFEST_DIR, f"{key}.json")
+
+
+def _aggregates_path(key, history_dir):
+    return os.path.join(history_dir, AGGREGATES_DIR, f"date={key}.parquet")
+
+
+def _stored_keys(directory, prefix, suffix, start=None, end=None):
+    # Dates AAAAMMJJ des fichiers prefixAAAAMMJJsuffix de `directory` (hors fichiers temporaires)
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    keys = [name[len(prefix):-len(suffix)] for name in names if name.startswith(prefix) and name.endswith(suffix)]
+    keys = [key for key in keys if len(key) == 8 and key.isdigit()]
+    if start is not None:
+        keys = [key for key in keys if key >= date_key(start)]
+    if end is not None:
+        keys = [key for key in keys if key <= date_key(end)]
+    return sorted(keys)
+
+
+# Le détenteur d'un verrou rafraîchit sa date de modification à ce rythme ;
+# sans rafraîchissement depuis LOCK_STALE_SECONDS, le verrou est orphelin
+LOCK_HEARTBEAT_SECONDS = 5
+LOCK_STALE_SECONDS = 60
+
+
+@contextmanager
+def file_lock(lock_path, stale_after=LOCK_STALE_SECONDS):
+    """
+    Verrou entre processus : fichier `lock_path` créé en exclusif (fonctionne
+    aussi sous Windows), contenant le pid et un jeton propres au détenteur.
+    Tant que le verrou est tenu, un thread rafraîchit sa date de modification
+    toutes les LOCK_HEARTBEAT_SECONDS secondes : un traitement long garde
+    donc son verrou. Le verrou n'est repris que si son détenteur est mort ou
+    ne l'a pas rafraîchi depuis `stale_after` secondes (processus bloqué ou
+    sur une autre machine).
+    """
+    token = f"{os.getpid()} {uuid.uuid4().hex}"
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            holder = _lock_holder(lock_path)
+            if holder is not None and _lock_is_stale(lock_path, holder, stale_after):
+                # Retiré seulement s'il contient toujours le jeton jugé orphelin
+                _remove_lock(lock_path, holder)
+                continue
+            time.sleep(0.05)
+            continue
+        try:
+            os.write(fd, token.encode())
+        finally:
+            os.close(fd)
+        break
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_refresh_lock, args=(lock_path, token, stop), daemon=True)
+    heartbeat.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        heartbeat.join()
+        _remove_lock(lock_path, token)
+
+
+def _lock_holder(lock_path):
+    # Jeton "pid aléatoire" du détenteur ; "" pendant son écriture, None si le verrou a disparu
+    try:
+        with open(lock_path, encoding="ascii") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _lock_is_stale(lock_path, holder, stale_after):
+    try:
+        age = time.time() - os.path.getmtime(lock_path)
+    except FileNotFoundError:
+        return False
+    if age > stale_after:
+        return True
+    if not holder:
+        return False
+    return not _pid_alive(int(holder.split()[0]))
+
+
+def _pid_alive(pid):
+    if os.name == "nt":
+        # os.kill(pid, 0) terminerait le processus sous Windows : seul le rafraîchissement compte
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _refresh_lock(lock_path, token, stop):
+    while not stop.wait(LOCK_HEARTBEAT_SECONDS):
+        if _lock_holder(lock_path) != token:
+            return
+        try:
+            os.utime(lock_path)
+        except FileNotFoundError:
+            return
+
+
+def _remove_lock(lock_path, token):
+    if _lock_holder(lock_path) != token:
+        return
+    try:
+        os.remove(lock_path)
+    except FileNotFoundError:
+        pass
+
+
+def read_manifest(history_dir=HISTORY_DIR, start=None, end=None):
+    """
+    Retourne le manifeste {AAAAMMJJ: {"rows": ..., "saved_at": ...}} (vide si
+    absent), limité aux dates entre `start` et `end` (inclus, optionnels) :
+    seules les entrées de ces dates sont lues.
+    """
+    manifest = {}
+    legacy = os.path.join(history_dir, MANIFEST_NAME)
+    if os.path.exists(legacy):
+        # Historique pas encore éclaté (voir _split_legacy_files)
+        with open(legacy, encoding="utf-8") as f:
+            manifest = {key: entry for key, entry in json.load(f).items()
+                        if (start is None or key >= date_key(start)) and (end is None or key <= date_key(end))}
+    for key in _stored_keys(os.path.join(history_dir, MANIFEST_DIR), "", ".json", start, end):
+        try:
+            with open(_manifest_entry_path(key, history_dir), encoding="utf-8") as f:
+                manifest[key] = json.load(f)
+        except FileNotFoundError:
+            continue
+    return dict(sorted(manifest.items()))
+
+
+def manifest_version(history_dir=HISTORY_DIR):
+    """
+    Identifiant de la version du manifeste (date de modification de manifest/,
+    changée par chaque remplacement d'une entrée), None s'il est absent : une
+    clé de cache qui change à chaque enregistrement.
+    """
+    versions = []
+    for path in (os.path.join(history_dir, MANIFEST_DIR), os.path.join(history_dir, MANIFEST_NAME)):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        versions.append((stat.st_mtime_ns, stat.st_size))
+    return tuple(versions) or None
+
+
+def _write_manifest_entry(key, entry, history_dir):
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, indent=1, sort_keys=True)
+
+    os.makedirs(os.path.join(history_dir, MANIFEST_DIR), exist_ok=True)
+    atomic_write(_manifest_entry_path(key, history_dir), write)
+
+
+def _write_aggregates(key, aggregates, history_dir):
+    path = _aggregates_path(key, history_dir)
+    if not len(aggregates):
+        # Aucun Roll ce jour : pas de fichier, un ancien fichier de la date est retiré
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return
+    aggregates = aggregates.sort_values(['UndTkr', 'Racine'], kind='stable').reset_index(drop=True)
+    os.makedirs(os.path.join(history_dir, AGGREGATES_DIR), exist_ok=True)
+    atomic_write(path, lambda tmp: aggregates.to_parquet(tmp, index=False))
+
+
+def _split_legacy_files(history_dir):
+    """
+    Sous le verrou du manifeste : éclate l'ancien manifest.json et l'ancien
+    roll_aggregates.parquet en fichiers par date, puis les supprime. Une
+    entrée déjà écrite au nouveau format est plus récente et conservée.
+    """
+    legacy = os.path.join(history_dir, MANIFEST_NAME)
+    if os.path.exists(legacy):
+        with open(legacy, encoding="utf-8") as f:
+            entries = json.load(f)
+        for key, entry in entries.items():
+            if not os.path.exists(_manifest_entry_path(key, history_dir)):
+                _write_manifest_entry(key, entry, history_dir)
+        os.remove(legacy)
+    legacy = os.path.join(history_dir, AGGREGATES_NAME)
+    if os.path.exists(legacy):
+        table = pd.read_parquet(legacy)
+        for date, aggregates in table.groupby('Date'):
+            key = date_key(date)
+            if not os.path.exists(_aggregates_path(key, history_dir)):
+                _write_aggregates(key, aggregates, history_dir)
+        os.remove(legacy)
+
+
+def _max_or_none(values):
+    value = pd.to_numeric(values, errors='coerce').max()
+    return None if pd.isna(value) else float(value)
+
+
+def row_group_index(df, sizes):
+    """
+    Index d'une partition : pour chaque groupe de lignes (tailles `sizes`),
+    racines de ticker (voir app.tickers) et Structures présentes, Size et
+    Notional maximaux. Permet à app.query de ne lire que les groupes utiles.
+    """
+    roots = pd.Series(ticker_field(df['Ticker'], 'root'), index=df.index) if 'Ticker' in df.columns else None
+    index = []
+    for start, size in zip(np.cumsum([0] + list(sizes[:-1])), sizes):
+        block = slice(int(start), int(start + size))
+        index.append({
+            "roots": [] if roots is None else sorted(str(r) for r in roots.iloc[block].dropna().unique()),
+            "structures": sorted(str(v) for v in df['Structure'].iloc[block].dropna().unique())
+                          if 'Structure' in df.columns else [],
+            "max_size": _max_or_none(df['Size'].iloc[block]) if 'Size' in df.columns else None,
+            "max_notional": _max_or_none(df['Notional'].iloc[block]) if 'Notional' in df.columns else None,
+        })
+    return index
+
+
+def _manifest_entry(df, sizes, intraday_update=None):
+    entry = {"rows": len(df), "saved_at": datetime.now().isoformat(timespec="seconds"),
+             "row_groups": row_group_index(df, sizes)}
+    if intraday_update is not None:
+        entry["intraday_update"] = intraday_update
+    return entry
+
+
+def _row_group_sizes(df):
+    return [min(HISTORY_ROW_GROUP, len(df) - start) for start in range(0, len(df), HISTORY_ROW_GROUP)]
+
+
+def save_day(new_data, history_dir=HISTORY_DIR, intraday_update=None):
+    """
+    Enregistre les données d'une date de trade dans sa partition, en remplaçant
+    atomiquement la partition existante, ainsi que son entrée du manifeste et
+    ses agrégats. Le coût ne dépend que de la date traitée, pas de la taille
+    de l'historique. Retourne la clé de partition AAAAMMJJ.
+    `intraday_update` : numéro de la dernière mise à jour intrajournalière
+    comprise dans `new_data` (voir save_day_changes).
+    """
+    os.makedirs(history_dir, exist_ok=True)
+    key = date_key(new_data['Date'].iloc[0])
+    columnar = to_columnar(new_data)
+    entry = _manifest_entry(columnar, _row_group_sizes(columnar), intraday_update)
+    aggregates = daily_roll_aggregates(columnar)
+    with _manifest_lock(history_dir):
+        # Partition, agrégats et manifeste écrits ensemble : deux enregistrements
+        # de la même date ne peuvent pas laisser une partition et un index différents
+        _split_legacy_files(history_dir)
+        _write_day(key, columnar, entry, aggregates, history_dir)
+    return key
+
+
+def _write_day(key, columnar, entry, aggregates, history_dir):
+    atomic_write(partition_path(key, history_dir),
+                 lambda tmp: columnar.to_parquet(tmp, index=False, row_group_size=HISTORY_ROW_GROUP))
+    _write_aggregates(key, aggregates, history_dir)
+    _write_manifest_entry(key, entry, history_dir)
+
+
+def save_day_changes(changed, replaced, intraday_update, history_dir=HISTORY_DIR):
+    """
+    Enregistre une mise à jour intrajournalière sans reconstruire la journée :
+    les lignes `replaced` (legs Outright enregistrées avant d'être appariées)
+    sont retirées de la partition et les lignes `changed` (fichier traité
+    des seules lignes modifiées) ajoutées à la fin.
+    N'écrit rien et retourne False si la partition ne contient pas exactement
+    la mise à jour `intraday_update` - 1 (ou l'une des lignes `replaced`) :
+    la journée entière doit alors être enregistrée avec save_day.
+    """
+    os.makedirs(history_dir, exist_ok=True)
+    key = date_key(changed['Date'].iloc[0])
+    added = to_columnar(changed)
+    with _manifest_lock(history_dir):
+        _split_legacy_files(history_dir)
+        entry = read_manifest(history_dir, key, key).get(key, {})
+        if entry.get("intraday_update") != intraday_update - 1:
+            return False
+        existing = pd.read_parquet(partition_path(key, history_dir))
+        kept = _without_rows(existing, to_columnar(replaced))
+        if kept is None:
+            return False
+        columnar = pd.concat([kept, added], ignore_index=True)
+        entry = _manifest_entry(columnar, _row_group_sizes(columnar), intraday_update)
+        _write_day(key, columnar, entry, daily_roll_aggregates(columnar), history_dir)
+    return True
+
+
+def _without_rows(table, rows):
+    # Retire de `table` une ligne Outright de même contenu (colonnes du fichier
+    # grid, textes manquants ramenés à NaN des deux côtés) par ligne de `rows` ;
+    # None s'il en manque une
+    if not len(rows):
+        return table
+    outright = table.index[table['Structure'] == 'Outright']
+    candidates = pd.Series(outright, index=trade_keys(restore_text_nulls(table.loc[outright].reset_index(drop=True))))
+    keys = trade_keys(restore_text_nulls(rows.reset_index(drop=True)))
+    if not pd.Index(keys).isin(candidates.index).all():
+        return None
+    return table.drop(index=candidates.loc[keys].to_numpy())
+
+
+def read_roll_aggregates(start=None, end=None, history_dir=HISTORY_DIR):
+    """
+    Agrégats quotidiens des Roll (voir app.aggregates) entre `start` et `end`
+    (inclus, optionnels), sans relire les partitions : seuls les fichiers de
+    ces dates sont lus.
+    """
+    frames = []
+    legacy = os.path.join(history_dir, AGGREGATES_NAME)
+    if os.path.exists(legacy):
+        filters = []
+        if start is not None:
+            filters.append(('Date', '>=', pd.Timestamp(start)))
+        if end is not None:
+            filters.append(('Date', '<=', pd.Timestamp(end)))
+        frames.append(pd.read_parquet(legacy, filters=filters or None))
+    keys = _stored_keys(os.path.join(history_dir, AGGREGATES_DIR), "date=", ".parquet", start, end)
+    if frames and keys:
+        frames[0] = frames[0][~frames[0]['Date'].isin(pd.to_datetime(keys, format='%Y%m%d'))]
+    for key in keys:
+        try:
+            frames.append(pd.read_parquet(_aggregates_path(key, history_dir)))
+        except FileNotFoundError:
+            continue
+    frames = [frame for frame in frames if len(frame)]
+    if not frames:
+        return empty_aggregates()
+    table = pd.concat(frames, ignore_index=True)
+    return table.sort_values(['Date', 'UndTkr', 'Racine'], kind='stable').reset_index(drop=True)
+
+
+def rebuild_roll_aggregates(history_dir=HISTORY_DIR):
+    """
+    Recalcule les agrégats de toutes les partitions (historique enregistré
+    avant leur introduction). Retourne le nombre de dates.
+    """
+    keys = sorted(read_manifest(history_dir))
+    for key in keys:
+        aggregates = daily_roll_aggregates(pd.read_parquet(partition_path(key, history_dir)))
+        with _manifest_lock(history_dir):
+            _split_legacy_files(history_dir)
+            _write_aggregates(key, aggregates, history_dir)
+    return len(keys)
+
+
+def index_history(history_dir=HISTORY_DIR):
+    """
+    Ajoute au manifeste l'index des partitions enregistrées avant son
+    introduction. Retourne les dates indexées.
+    """
+    indexed = []
+    for key, entry in read_manifest(history_dir).items():
+        if "row_groups" in entry:
+            continue
+        parquet = pq.ParquetFile(partition_path(key, history_dir))
+        sizes = [parquet.metadata.row_group(i).num_rows for i in range(parquet.num_row_groups)]
+        new_entry = _manifest_entry(parquet.read().to_pandas(), sizes)
+        with _manifest_lock(history_dir):
+            _split_legacy_files(history_dir)
+            entry = read_manifest(history_dir, key, key).get(key, {})
+            _write_manifest_entry(key, dict(entry, row_groups=new_entry["row_groups"]), history_dir)
+        indexed.append(key)
+    return indexed
+
+
+def saved_dates(history_dir=HISTORY_DIR):
+    """
+    Dates (datetime.date) présentes dans l'historique, triées.
+    """
+    return sorted(datetime.strptime(key, '%Y%m%d').date() for key in read_manifest(history_dir))
+
+
+def load_history(start=None, end=None, history_dir=HISTORY_DIR):
+    """
+    Charge les partitions comprises entre `start` et `end` (inclus, optionnels).
+    """
+    keys = sorted(read_manifest(history_dir, start, end))
+    frames = [pd.read_parquet(partition_path(k, history_dir)) for k in keys]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+def migrate_csv_history(csv_path=LEGACY_CSV, history_dir=HISTORY_DIR):
+    """
+    Reprend l'ancien fichier processed_data.csv dans l'historique partitionné
+    (une partition par date). Le CSV n'est pas modifié ; la migration peut être
+    relancée sans doublon. Retourne la liste des dates migrées.
+    """
+    try:
+        legacy = pd.read_csv(csv_path)
+    except (FileNotFoundError, pd.errors.EmptyDataError):
+        return []
+    if legacy.empty or 'Date' not in legacy.columns:
+        return []
+    # Le CSV a tout aplati en texte : on retrouve les types de la sortie de process_files
+    legacy['Date'] = pd.to_datetime(legacy['Date'])
+    if 'Time' in legacy.columns:
+        legacy['Time'] = pd.to_datetime(legacy['Time'], format='%H:%M:%S', errors='coerce').dt.time
+    if 'Level' in legacy.columns:
+        level = legacy['Level'].mask(legacy['Level'].astype(str).str.startswith("="))
+        legacy['Level'] = pd.to_numeric(level, errors='coerce')
+    # Une même date a pu être ajoutée plusieurs fois à l'ancien CSV : chaque
+    # sauvegarde forme un bloc contigu, seul le dernier bloc de la date est repris
+    block = (legacy['Date'] != legacy['Date'].shift()).cumsum()
+    last_block = block.groupby(legacy['Date']).transform('max')
+    legacy = legacy[block == last_block]
+    migrated = []
+    for _, day in legacy.groupby(legacy['Date'].dt.strftime('%Y%m%d')):
+        migrated.append(save_day(day.reset_index(drop=True), history_dir))
+    return migrated
+
+
+if __name__ == "__main__":
+    # python -m app.history migrate [chemin_csv] | index
+    if len(sys.argv) >= 2 and sys.argv[1] == "migrate":
+        dates = migrate_csv_history(*sys.argv[2:3])
+        print(f"{len(dates)} date(s) migrée(s) vers {HISTORY_DIR}")
+    elif len(sys.argv) >= 2 and sys.argv[1] == "index":
+        dates = index_history()
+        print(f"{len(dates)} date(s) indexée(s)")
+    elif len(sys.argv) >= 2 and sys.argv[1] == "aggregates":
+        print(f"Agrégats recalculés pour {rebuild_roll_aggregates()} date(s)")
+    else:
+        print("Usage : python -m app.history migrate [chemin_csv] | index | aggregates")
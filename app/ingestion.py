@@ -0,0 +1,223 @@
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+
+from app.parse_cache import cache_get, cache_put, content_key
+
+# ------------------------
+# Chargement des fichiers grid Bloomberg
+# ------------------------
+
+# Colonnes utilisées par le traitement et leur type : les autres colonnes
+# (OpenInt, ...) ne sont pas lues
+GRID_SCHEMA = {
+    'Time': 'text',
+    'Ticker': 'text',
+    'Notional': 'number',
+    'Size': 'number',
+    'Price': 'number',
+    'Volume': 'number',
+    '1DChg': 'number',
+    'UndTkr': 'text',
+    '1PtVal': 'number',
+    'Exch': 'text',
+    'FutName': 'text',
+    'UndCmpName': 'text',
+    'UndPrc': 'number',
+}
+
+# Toute modification du schéma invalide le cache des fichiers déjà lus
+SCHEMA_SALT = repr(sorted(GRID_SCHEMA.items())).encode()
+
+MAX_WORKERS = min(8, os.cpu_count() or 1)
+
+# Pool de lecture gardé d'un appel à l'autre, dans le processus principal
+# seulement (application, surveillance) et un seul à la fois : (processus, pool)
+_read_pool = None
+_read_pool_lock = threading.Lock()
+
+
+def read_grid_file(source):
+    """
+    Lit la première feuille d'un fichier grid (chemin ou contenu en bytes) en
+    mode lecture seule d'openpyxl, en ne conservant que les colonnes de GRID_SCHEMA.
+    Les colonnes numériques sont converties (valeurs non numériques comme
+    'n.a.' -> NaN), les colonnes texte gardent leurs valeurs.
+    """
+    # Import à l'usage : l'application démarre sans openpyxl (voir app.jobs.warm_worker)
+    from openpyxl import load_workbook
+
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        positions = _grid_positions(next(rows, ()))
+        records = []
+        for row in rows:
+            record = [row[i] if i < len(row) else None for i, _ in positions]
+            if any(value is not None for value in record):
+                records.append(record)
+    finally:
+        wb.close()
+    return _records_frame(records, positions)
+
+
+def iter_grid_chunks(source, chunk_rows=10000):
+    """
+    Variante de read_grid_file par blocs : parcourt la première feuille avec
+    l'itérateur read-only d'openpyxl et produit des DataFrames d'au plus
+    `chunk_rows` lignes, sans jamais charger le fichier entier.
+    Le type int64 des colonnes numériques est décidé bloc par bloc.
+    """
+    from openpyxl import load_workbook
+
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        positions = _grid_positions(next(rows, ()))
+        records = []
+        for row in rows:
+            record = [row[i] if i < len(row) else None for i, _ in positions]
+            if any(value is not None for value in record):
+                records.append(record)
+            if len(records) == chunk_rows:
+                yield _records_frame(records, positions)
+                records = []
+        if records:
+            yield _records_frame(records, positions)
+    finally:
+        wb.close()
+
+
+def _grid_positions(header):
+    # Positions (index, nom) des colonnes de GRID_SCHEMA dans l'en-tête
+    positions = [(i, name) for i, name in enumerate(header) if name in GRID_SCHEMA]
+    if not positions:
+        raise ValueError("aucune des colonnes attendues n'a été trouvée")
+    return positions
+
+
+def _records_frame(records, positions):
+    columns = [name for _, name in positions]
+    data = np.array(records, dtype=object).reshape(len(records), len(columns))
+    return pd.DataFrame({name: _convert_column(data[:, k], GRID_SCHEMA[name])
+                         for k, name in enumerate(columns)})
+
+
+def _convert_column(values, kind):
+    if kind == 'text':
+        return pd.Series(values, dtype=object).where(pd.notna(values), np.nan)
+    numbers = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce')
+    # Comme read_excel : une colonne entièrement composée d'entiers reste en int64
+    if numbers.dtype.kind == 'f' and len(numbers) and numbers.notna().all() and (numbers % 1 == 0).all():
+        numbers = numbers.astype('int64')
+    return numbers
+
+
+def _read_grid_file_safe(source):
+    try:
+        return read_grid_file(source), None
+    except Exception as e:
+        return None, e
+
+
+def _read_source(source):
+    if isinstance(source, bytes):
+        return source
+    with open(source, 'rb') as f:
+        return f.read()
+
+
+def restore_text_nulls(df):
+    """
+    Feather et Parquet restituent les textes manquants en None : on revient à
+    NaN comme à la lecture des fichiers.
+    """
+    for name in df.columns:
+        if GRID_SCHEMA.get(name) == 'text':
+            df[name] = _convert_column(df[name].to_numpy(dtype=object), 'text')
+    return df
+
+
+def _parse_in_pool(sources, max_workers):
+    global _read_pool
+    max_workers = min(max_workers, MAX_WORKERS)
+    if multiprocessing.parent_process() is not None:
+        # Processus de traitement (voir app.jobs) ou de lot : pool arrêté dès la lecture finie
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(sources))) as pool:
+            return list(pool.map(_read_grid_file_safe, sources))
+    with _read_pool_lock:
+        if _read_pool is None or _read_pool[0] != max_workers:
+            if _read_pool is not None:
+                _read_pool[1].shutdown(wait=False)
+            _read_pool = (max_workers, ProcessPoolExecutor(max_workers=max_workers))
+        pool = _read_pool[1]
+    try:
+        return list(pool.map(_read_grid_file_safe, sources))
+    except BrokenProcessPool:
+        # Processus de lecture arrêté brutalement : un nouveau pool au prochain appel
+        with _read_pool_lock:
+            if _read_pool is not None and _read_pool[1] is pool:
+                _read_pool = None
+        raise
+
+
+def read_grid_files(files, max_workers=MAX_WORKERS, use_cache=True):
+    """
+    Lit en parallèle (pool de processus) une liste de fichiers grid.
+    `files` est une liste de couples (nom, source) où source est un chemin ou
+    le contenu du fichier en bytes.
+    Les fichiers déjà lus (même contenu) sont repris du cache disque partagé
+    (voir parse_cache) ; seuls les fichiers nouveaux ou modifiés sont analysés.
+    Retourne (dataframes, erreurs) : les DataFrames lus dans l'ordre des
+    fichiers et la liste des couples (nom, exception) des fichiers en échec.
+    """
+    names = [name for name, _ in files]
+    results = [None] * len(files)
+    contents = [None] * len(files)
+    keys = [None] * len(files)
+    to_parse = []
+    for k, (_, source) in enumerate(files):
+        try:
+            contents[k] = _read_source(source)
+        except Exception as e:
+            results[k] = (None, e)
+            continue
+        if use_cache:
+            keys[k] = content_key(contents[k], SCHEMA_SALT)
+            cached = cache_get(keys[k])
+            if cached is not None:
+                results[k] = (restore_text_nulls(cached), None)
+                continue
+        to_parse.append(k)
+
+    sources = [contents[k] for k in to_parse]
+    if len(sources) > 1 and max_workers > 1:
+        parsed = _parse_in_pool(sources, max_workers)
+    else:
+        parsed = [_read_grid_file_safe(source) for source in sources]
+    for k, (df, error) in zip(to_parse, parsed):
+        results[k] = (df, error)
+        if use_cache and error is None:
+            cache_put(keys[k], df)
+
+    dataframes = []
+    errors = []
+    for name, key, (df, error) in zip(names, keys, results):
+        if error is None:
+            if key is not None:
+                # Empreinte du contenu, reprise par le dédoublonnage (voir app.dedup)
+                df.attrs['content_key'] = key
+            dataframes.append(df)
+        else:
+            errors.append((name, error))
+    return dataframes, errors
@@ -0,0 +1,315 @@
+import json
+import os
+from datetime import datetime
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from app.compact import expand_compact
+from app.dedup import drop_duplicate_trades
+from app.history import HISTORY_DIR, atomic_write, date_key, file_lock, save_day, save_day_changes, to_columnar
+from app.ingestion import MAX_WORKERS, SCHEMA_SALT, read_grid_files, restore_text_nulls
+from app.matching import EXTENDED_WINDOW, GROUPED_TICKER_LEN, match_roll_pairs, time_to_seconds
+from app.parse_cache import content_key
+from app.pipeline import MORNING, assemble_day, label_structures, prepare_trades
+from app.profiling import RunProfile
+
+# ------------------------
+# Traitement intrajournalier incrémental
+# ------------------------
+
+# Un dossier par date (AAAAMMJJ) :
+# - state.json : compteur de roll, fichiers intégrés, parties et legs ouvertes ;
+# - trades-NNNN.parquet : lignes ajoutées par la mise à jour NNNN, avec leur Structure_ID ;
+# - relabel-NNNN.parquet : legs ouvertes appariées par la mise à jour NNNN ;
+# - open-SEAU-NNNN.parquet : lignes avec prix encore libres (Outright), par seau de temps ;
+# - trade-keys-NNNN.npy : clés des trades intégrés (voir app.dedup).
+# state.json est écrit en dernier : une mise à jour interrompue n'est pas prise en compte.
+# Les mises à jour d'une même date sont exécutées l'une après l'autre (state.lock).
+INTRADAY_DIR = "data/processed/intraday"
+STATE_NAME = "state.json"
+LOCK_NAME = "state.lock"
+# Une ligne ne peut être appariée qu'à une ligne du même seau ou d'un seau voisin
+OPEN_BUCKET_SECONDS = EXTENDED_WINDOW
+OPEN_COLUMNS = ['seq', 'Ticker', 'Size', 'Price', 'seconds']
+
+
+def day_dir(trade_date, state_dir=INTRADAY_DIR):
+    return os.path.join(state_dir, date_key(trade_date))
+
+
+def read_state(directory):
+    """
+    État d'une journée ({} si aucune mise à jour n'a encore été faite).
+    """
+    path = os.path.join(directory, STATE_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_state(state, directory):
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=1)
+
+    atomic_write(os.path.join(directory, STATE_NAME), write)
+
+
+def append_grid_files(files, trade_date, state_dir=INTRADAY_DIR, report_error=print,
+                      max_workers=MAX_WORKERS, profile=None, report_info=None):
+    """
+    Ajoute des fichiers grid (couples (nom, chemin ou bytes)) à la journée
+    `trade_date` sans retraiter les fichiers déjà intégrés : seules les
+    nouvelles lignes sont appariées, entre elles et avec les legs encore libres
+    de leur fenêtre de temps. Les Structure_ID déjà attribués ne changent pas ;
+    les nouveaux rolls suivent le dernier numéro attribué.
+    Un fichier de même contenu qu'un fichier déjà intégré est ignoré, et les
+    trades déjà intégrés par un autre fichier sont retirés (voir app.dedup,
+    nombre par fichier transmis à `report_info`).
+
+    Deux mises à jour de la même date (processus de traitement différents) ne
+    s'entremêlent pas : la seconde attend la fin de la première.
+
+    Retourne {"rows": lignes ajoutées, "rolls": nouveaux rolls, "skipped": noms
+    des fichiers ignorés, "update": numéro de la mise à jour (voir
+    update_output)}, ou None si aucun fichier n'est exploitable.
+    """
+    directory = day_dir(trade_date, state_dir)
+    os.makedirs(directory, exist_ok=True)
+    with file_lock(os.path.join(directory, LOCK_NAME)):
+        return _append(directory, files, trade_date, report_error, max_workers, profile, report_info)
+
+
+def _append(directory, files, trade_date, report_error, max_workers, profile, report_info):
+    profile = profile or RunProfile()
+    report_info = report_info or report_error
+    state = read_state(directory) or {"roll_counter": 0, "next_seq": 0, "updates": 0,
+                                      "files": [], "parts": [], "relabels": [], "open": {}}
+    date_code = trade_date.strftime('%Y%m%d')
+
+    with profile.stage("lecture", rows_in=len(files)) as stage:
+        # Fichiers repérés par l'empreinte de leur contenu : deux envois de même nom restent distincts
+        fresh, names, skipped = [], {}, []
+        for name, source in files:
+            if not isinstance(source, bytes):
+                with open(source, 'rb') as f:
+                    source = f.read()
+            key = content_key(source, SCHEMA_SALT)
+            if key in state["files"] or key in names:
+                skipped.append(name)
+                continue
+            fresh.append((name, source))
+            names[key] = name
+        dataframes, errors = read_grid_files(fresh, max_workers=max_workers)
+        # Même empreinte que ci-dessus (voir read_grid_files) ; retirée par le dédoublonnage
+        keys = [df.attrs['content_key'] for df in dataframes]
+        stage.rows_out = sum(len(df) for df in dataframes)
+    for name, e in errors:
+        report_error(f"Erreur lors du chargement de {name}: {e}")
+    if not dataframes:
+        if skipped and not errors:
+            return {"rows": 0, "rolls": 0, "skipped": skipped, "update": state.get("updates", 0)}
+        report_error("Aucun fichier valide n'a été chargé.")
+        return None
+
+    with profile.stage("dédoublonnage", rows_in=stage.rows_out) as stage:
+        seen = np.load(os.path.join(directory, state["trade_keys"])) if state.get("trade_keys") else None
+        dataframes, dropped, known = drop_duplicate_trades(dataframes, seen)
+        stage.rows_out = sum(len(df) for df in dataframes)
+    for key, count in zip(keys, dropped):
+        if count:
+            report_info(f"{names[key]} : {count} trade(s) déjà intégré(s) ignoré(s).")
+
+    with profile.stage("préparation", rows_in=stage.rows_out) as stage:
+        # seq : position dans la concaténation de tous les fichiers de la journée
+        offset = state["next_seq"]
+        for df in dataframes:
+            df['seq'] = offset + np.arange(len(df))
+            offset += len(df)
+        new = prepare_trades(dataframes, trade_date)
+        if new is None:
+            report_error("La colonne 'Time' est introuvable dans les fichiers.")
+            return None
+        stage.rows_out = len(new)
+
+    with profile.stage("appariement", rows_in=len(new)) as stage:
+        # Tickers en texte comme dans les legs ouvertes relues
+        priced = new[new['Price'].notna()].astype({'Ticker': object})
+        dated = priced['seconds'].dropna()
+        touched = _buckets_between(dated.min() - EXTENDED_WINDOW, dated.max() + EXTENDED_WINDOW) if len(dated) else []
+        open_legs = _load_open(directory, state, touched)
+        block = _processing_order(pd.concat([open_legs, priced[OPEN_COLUMNS]], ignore_index=True))
+        roll_numbers, legs = match_roll_pairs(
+            block['Ticker'].to_numpy(),
+            block['Size'].to_numpy(dtype=float),
+            block['Price'].to_numpy(dtype=float),
+            block['seconds'].to_numpy(dtype=float),
+            first_roll=state["roll_counter"] + 1,
+        )
+        matched = legs >= 0
+        labels = pd.Series([f"{date_code}-R-{r}-L{leg}" for r, leg in zip(roll_numbers[matched], legs[matched])],
+                           index=block['seq'].to_numpy()[matched], dtype=object)
+        new_rolls = int(roll_numbers.max(initial=state["roll_counter"])) - state["roll_counter"]
+
+        new['Structure_ID'] = new['seq'].map(labels).fillna("")
+        new = label_structures(new, date_code)
+        relabeled = open_legs[open_legs['seq'].isin(labels.index)]
+        still_open = pd.concat([
+            open_legs[~open_legs['seq'].isin(labels.index)],
+            priced[~priced['seq'].isin(labels.index) & priced['seconds'].notna()
+                   & (priced['Ticker'].astype(str).str.len() != GROUPED_TICKER_LEN)][OPEN_COLUMNS],
+        ], ignore_index=True)
+        stage.rows_out = int(matched.sum())
+
+    with profile.stage("état", rows_in=len(new)):
+        update = state["updates"] + 1
+        part = f"trades-{update:04d}.parquet"
+        stored = to_columnar(expand_compact(new.drop(columns=['Date', 'Structure'])))
+        atomic_write(os.path.join(directory, part), lambda tmp: stored.to_parquet(tmp, index=False))
+        state["parts"].append(part)
+        if len(relabeled):
+            relabel = f"relabel-{update:04d}.parquet"
+            relabel_df = pd.DataFrame({'seq': relabeled['seq'].to_numpy(),
+                                       'Structure_ID': labels[relabeled['seq']].to_numpy()})
+            atomic_write(os.path.join(directory, relabel), lambda tmp: relabel_df.to_parquet(tmp, index=False))
+            state["relabels"].append(relabel)
+
+        obsolete = [state["open"].pop(str(b)) for b in touched if str(b) in state["open"]]
+        buckets = np.floor(still_open['seconds'].to_numpy() / OPEN_BUCKET_SECONDS)
+        for bucket in np.unique(buckets):
+            name = f"open-{int(bucket)}-{update:04d}.parquet"
+            rows = still_open[buckets == bucket]
+            atomic_write(os.path.join(directory, name), lambda tmp: rows.to_parquet(tmp, index=False))
+            state["open"][str(int(bucket))] = name
+
+        obsolete += [state["trade_keys"]] if state.get("trade_keys") else []
+        trade_keys_name = f"trade-keys-{update:04d}.npy"
+        atomic_write(os.path.join(directory, trade_keys_name), partial(_save_array, known))
+        state["trade_keys"] = trade_keys_name
+
+        state["roll_counter"] += new_rolls
+        state["next_seq"] = offset
+        state["updates"] = update
+        state["files"].extend(keys)
+        state["last_update"] = datetime.now().isoformat(timespec="seconds")
+        _write_state(state, directory)
+        for name in obsolete:
+            os.remove(os.path.join(directory, name))
+
+    return {"rows": len(new), "rolls": new_rolls, "skipped": skipped, "update": update}
+
+
+def _save_array(array, path):
+    with open(path, "wb") as f:
+        np.save(f, array)
+
+
+def _buckets_between(lo, hi):
+    return list(range(int(np.floor(lo / OPEN_BUCKET_SECONDS)), int(np.floor(hi / OPEN_BUCKET_SECONDS)) + 1))
+
+
+def _load_open(directory, state, buckets):
+    # Legs libres des seaux de la fenêtre des nouvelles lignes uniquement
+    frames = [pd.read_parquet(os.path.join(directory, state["open"][str(b)]))
+              for b in buckets if str(b) in state["open"]]
+    if not frames:
+        return pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in
+                             zip(OPEN_COLUMNS, ['int64', object, float, float, float])})
+    return restore_text_nulls(pd.concat(frames, ignore_index=True))
+
+
+def _processing_order(df):
+    # Même ordre que prepare_trades : avant 8h puis à partir de 8h, heures
+    # décroissantes, position décroissante en cas d'égalité
+    sort_order = np.where(df['seconds'].to_numpy() >= MORNING, 0, 1)
+    return (df.assign(sort_order=sort_order)
+              .sort_values(['sort_order', 'seconds', 'seq'], ascending=False, kind='stable')
+              .drop(columns=['sort_order'])
+              .reset_index(drop=True))
+
+
+def load_day(trade_date, state_dir=INTRADAY_DIR, state=None):
+    """
+    Lignes de la journée avec leurs Structure_ID et Structure (comme après
+    l'appariement du traitement complet), ou None si la journée est vide.
+    `state` : état lu au préalable (voir read_state), pour des lignes qui
+    correspondent exactement à ses mises à jour.
+    """
+    directory = day_dir(trade_date, state_dir)
+    state = read_state(directory) if state is None else state
+    if not state.get("parts"):
+        return None
+    trades = pd.concat([pd.read_parquet(os.path.join(directory, part)) for part in state["parts"]],
+                       ignore_index=True)
+    trades = restore_text_nulls(trades)
+    for relabel in state["relabels"]:
+        relabel_df = pd.read_parquet(os.path.join(directory, relabel))
+        new_ids = trades['seq'].map(pd.Series(relabel_df['Structure_ID'].to_numpy(), index=relabel_df['seq']))
+        trades['Structure_ID'] = new_ids.fillna(trades['Structure_ID'])
+    return _labeled(trades, trade_date)
+
+
+def _labeled(trades, trade_date):
+    trades['seconds'] = time_to_seconds(trades['Time'])
+    trades = _processing_order(trades).drop(columns=['seq', 'seconds'])
+    trades.insert(trades.columns.get_loc('Structure_ID'), 'Date', trade_date)
+    return label_structures(trades, trade_date.strftime('%Y%m%d'))
+
+
+def day_output(trade_date, state_dir=INTRADAY_DIR, profile=None, state=None):
+    """
+    Fichier traité de la journée à partir de l'état incrémental (voir assemble_day).
+    """
+    final_df = load_day(trade_date, state_dir, state)
+    if final_df is None:
+        return None
+    return assemble_day(final_df, trade_date, profile)
+
+
+def update_output(trade_date, update, state_dir=INTRADAY_DIR, profile=None):
+    """
+    Fichier traité des seules lignes ajoutées ou modifiées par la mise à jour
+    `update` (voir append_grid_files) : ses nouvelles lignes et les legs des
+    mises à jour précédentes qu'elle a appariées. Une mise à jour n'apparie
+    que des legs libres : les Roll de ce fichier sont complets.
+    Retourne (fichier traité, legs réappariées telles qu'avant la mise à
+    jour), ou None si la mise à jour n'a pas ajouté de lignes.
+    """
+    directory = day_dir(trade_date, state_dir)
+    state = read_state(directory)
+    part = f"trades-{update:04d}.parquet"
+    if part not in state.get("parts", []):
+        return None
+    trades = pd.read_parquet(os.path.join(directory, part))
+    previous = trades.iloc[:0]
+    relabel = f"relabel-{update:04d}.parquet"
+    if relabel in state["relabels"]:
+        relabel_df = pd.read_parquet(os.path.join(directory, relabel))
+        # Seules les parties dont les numéros de ligne (seq) couvrent les legs sont lues
+        seqs = relabel_df['seq'].tolist()
+        earlier = state["parts"][:state["parts"].index(part)]
+        previous = pd.concat([pd.read_parquet(os.path.join(directory, name), filters=[('seq', 'in', seqs)])
+                              for name in earlier], ignore_index=True)
+        new_ids = previous['seq'].map(pd.Series(relabel_df['Structure_ID'].to_numpy(), index=relabel_df['seq']))
+        trades = pd.concat([trades, previous.assign(Structure_ID=new_ids)], ignore_index=True)
+    changed = _labeled(restore_text_nulls(trades), trade_date)
+    previous = _labeled(restore_text_nulls(previous), trade_date)
+    return assemble_day(changed, trade_date, profile), previous
+
+
+def save_update(trade_date, update, changed, previous, state_dir=INTRADAY_DIR, history_dir=HISTORY_DIR):
+    """
+    Enregistre dans l'historique la mise à jour `update` à partir de ses seules
+    lignes modifiées (voir update_output et app.history.save_day_changes).
+    Si la partition n'est pas celle de la mise à jour précédente (première
+    mise à jour, traitement complet de la date entre-temps, mises à jour
+    enregistrées dans le désordre), la journée entière est réenregistrée.
+    """
+    if save_day_changes(changed, previous, update, history_dir):
+        return
+    # État relu une seule fois : les lignes enregistrées sont exactement celles de ses mises à jour
+    state = read_state(day_dir(trade_date, state_dir))
+    save_day(day_output(trade_date, state_dir, state=state), history_dir, intraday_update=state["updates"])
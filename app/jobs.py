@@ -0,0 +1,434 @@
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import uuid
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from functools import partial
+
+import pandas as pd
+
+from app.export import EXPORT_FORMATS, write_output
+from app.history import HISTORY_DIR, atomic_write, save_day
+from app.intraday import INTRADAY_DIR, append_grid_files, day_output, save_update, update_output
+from app.pipeline import process_grid_files
+from app.preview import write_preview
+from app.profiling import RUN_LOG, RunProfile, append_run
+
+# ------------------------
+# Traitements en arrière-plan pour l'application
+# ------------------------
+
+# Un dossier par traitement : status.json (état, étape en cours, messages),
+# puis result.parquet (aperçu, voir app.preview) et un fichier output.<ext> par
+# format demandé une fois terminé.
+JOB_DIR = "data/processed/jobs"
+STATUS_NAME = "status.json"
+RESULT_PREVIEW = "result.parquet"
+OUTPUT_NAME = "output"
+# Traitement de plusieurs dates : un fichier par date dans days/, réunis dans output.zip
+DAYS_DIR = "days"
+ARCHIVE_NAME = "output.zip"
+# Traitements exécutés en même temps, tous utilisateurs confondus
+MAX_JOB_WORKERS = 2
+# Au-delà, les nouveaux traitements sont refusés jusqu'à ce que la file se vide
+MAX_PENDING_JOBS = 8
+# Les résultats sont supprimés après ce délai
+JOB_TTL_SECONDS = 24 * 3600
+
+QUEUED, RUNNING, DONE, FAILED = "en attente", "en cours", "terminé", "échec"
+# Étapes d'un traitement, dans l'ordre (voir app.pipeline), pour l'avancement
+JOB_STAGES = ["lecture", "dédoublonnage", "préparation", "appariement", "tri", "synthèse",
+              "formules", "roll-client", "historique", "export"]
+INTRADAY_STAGES = JOB_STAGES[:4] + ["état"] + JOB_STAGES[4:]
+
+_pool = None
+_futures = {}
+# Réentrant : un rappel de fin peut s'exécuter pendant la soumission
+_lock = threading.RLock()
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def _get_pool():
+    # Processus démarrés par "spawn" : le serveur Streamlit a déjà des threads
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=MAX_JOB_WORKERS,
+                                    mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _submit(fn, *args):
+    # Un processus de la file mort (mémoire épuisée, arrêt forcé) rend la file
+    # inutilisable : elle est remplacée et la soumission retentée une fois
+    global _pool
+    with _lock:
+        try:
+            return _get_pool().submit(fn, *args)
+        except BrokenProcessPool:
+            _pool.shutdown(wait=False)
+            _pool = None
+            return _get_pool().submit(fn, *args)
+
+
+def _failure_message(error):
+    if isinstance(error, BrokenProcessPool):
+        return ("Le processus de traitement s'est arrêté brutalement (mémoire insuffisante ?) : "
+                "relancez le traitement.")
+    return f"Erreur lors du traitement : {error}"
+
+
+def warm_pool(on_ready=None):
+    """
+    Démarre les processus de traitement sans attendre la première demande :
+    chacun charge les modules du traitement (voir warm_worker), si bien que le
+    premier traitement après un redémarrage n'attend ni le lancement des
+    processus ni les imports. `on_ready` est appelé (sans argument) quand
+    tous les processus sont prêts. Retourne les futures du préchauffage.
+    """
+    remaining = [MAX_JOB_WORKERS]
+
+    def done(future):
+        with _lock:
+            remaining[0] -= 1
+            ready = remaining[0] == 0
+        if ready and on_ready is not None:
+            on_ready()
+
+    with _lock:
+        futures = [_submit(warm_worker) for _ in range(MAX_JOB_WORKERS)]
+    for future in futures:
+        future.add_done_callback(done)
+    return futures
+
+
+def warm_worker():
+    # openpyxl n'est importé qu'à l'usage (voir app.ingestion, app.export)
+    import openpyxl
+    from app.export import header_styles
+
+    header_styles()
+    return os.getpid()
+
+
+def _write_status(directory, status):
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(status, f, ensure_ascii=False, default=str)
+
+    atomic_write(os.path.join(directory, STATUS_NAME), write)
+
+
+def _read_status(directory):
+    try:
+        with open(os.path.join(directory, STATUS_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def submit_job(files, trade_date, intraday=False, formats=("xlsx",), job_dir=JOB_DIR, run_log=RUN_LOG):
+    """
+    Place le traitement des fichiers grid (couples (nom, bytes)) de la journée
+    `trade_date` dans la file des processus de traitement et retourne
+    l'identifiant du traitement, sans attendre son exécution. Le traitement
+    enregistre l'historique et écrit le fichier traité dans chacun des
+    `formats` (voir app.export.EXPORT_FORMATS) ; en mode `intraday`, les fichiers s'ajoutent à l'état de la journée (voir
+    app.intraday). Lève JobQueueFull si MAX_PENDING_JOBS traitements sont déjà
+    en attente ou en cours.
+    """
+    purge_expired(job_dir)
+    with _lock:
+        pending = sum(not future.done() for future in _futures.values())
+        if pending >= MAX_PENDING_JOBS:
+            raise JobQueueFull(f"{pending} traitements sont déjà en cours ou en attente.")
+        job_id = uuid.uuid4().hex[:12]
+        directory = os.path.join(job_dir, job_id)
+        os.makedirs(directory)
+        _write_status(directory, {
+            "job_id": job_id,
+            "state": QUEUED,
+            "trade_date": trade_date.strftime("%Y-%m-%d"),
+            "files": [name for name, _ in files],
+            "intraday": intraday,
+            "formats": list(formats),
+            "submitted_at": datetime.now().isoformat(timespec="seconds"),
+            "stage": None,
+            "stages_started": 0,
+            "messages": [],
+            "notices": [],
+        })
+        future = _submit(run_job, directory, files, trade_date, intraday, formats)
+        future.add_done_callback(partial(_job_done, directory, run_log))
+        _futures[job_id] = future
+    return job_id
+
+
+def _job_done(directory, run_log, future):
+    # Exécuté dans le processus de l'application : seul à écrire dans le journal
+    try:
+        append_run(future.result(), run_log)
+    except Exception as e:
+        status = _read_status(directory) or {}
+        status.update(state=FAILED, messages=status.get("messages", []) + [_failure_message(e)],
+                      finished_at=datetime.now().isoformat(timespec="seconds"))
+        _write_status(directory, status)
+
+
+def _process_day(files, trade_date, intraday, profile, messages, notices, history_dir, state_dir):
+    # Traitement d'une journée et enregistrement dans l'historique ; None en cas d'échec
+    if intraday:
+        summary = append_grid_files(files, trade_date, state_dir, report_error=messages.append, profile=profile,
+                                    report_info=notices.append)
+        if summary is None:
+            return None, None
+        if not summary["rows"]:
+            # Aucune ligne nouvelle : fichier de toute la journée, historique inchangé
+            return day_output(trade_date, state_dir, profile), summary
+        # Seules les lignes de la mise à jour sont assemblées, enregistrées et exportées
+        processed, replaced = update_output(trade_date, summary["update"], state_dir, profile)
+        with profile.stage("historique", rows_in=len(processed)):
+            save_update(trade_date, summary["update"], processed, replaced, state_dir, history_dir)
+        notices.append("Le fichier traité ne contient que les lignes ajoutées ou modifiées par cette mise à "
+                       "jour ; la journée complète est enregistrée dans l'historique.")
+        return processed, summary
+    processed = process_grid_files(files, trade_date, report_error=messages.append, profile=profile,
+                                   report_info=notices.append)
+    if processed is not None:
+        with profile.stage("historique", rows_in=len(processed)):
+            save_day(processed, history_dir)
+    return processed, None
+
+
+def run_job(directory, files, trade_date, intraday=False, formats=("xlsx",),
+            history_dir=HISTORY_DIR, state_dir=INTRADAY_DIR):
+    """
+    Exécute un traitement soumis par submit_job (dans un processus de la file)
+    en tenant status.json à jour à chaque étape. Retourne le profil du traitement.
+    """
+    status = _read_status(directory)
+    status.update(state=RUNNING, started_at=datetime.now().isoformat(timespec="seconds"))
+    _write_status(directory, status)
+
+    def on_stage(name):
+        status.update(stage=name, stages_started=status["stages_started"] + 1)
+        _write_status(directory, status)
+
+    profile = RunProfile(listener=on_stage, source="app", trade_date=status["trade_date"], files=len(files))
+    messages, notices = status["messages"], status["notices"]
+    try:
+        processed, summary = _process_day(files, trade_date, intraday, profile, messages, notices,
+                                          history_dir, state_dir)
+        if intraday:
+            status["summary"] = summary
+        if processed is not None:
+            with profile.stage("export", rows_in=len(processed)):
+                for fmt in formats:
+                    atomic_write(os.path.join(directory, OUTPUT_NAME + EXPORT_FORMATS[fmt]),
+                                 lambda tmp: write_output(processed, tmp, fmt))
+                atomic_write(os.path.join(directory, RESULT_PREVIEW), lambda tmp: write_preview(processed, tmp))
+            status["rows"] = len(processed)
+        status["state"] = DONE if processed is not None else FAILED
+    except Exception as e:
+        messages.append(f"Erreur lors du traitement : {e}")
+        status["state"] = FAILED
+    status["finished_at"] = datetime.now().isoformat(timespec="seconds")
+    _write_status(directory, status)
+    return profile.to_dict()
+
+
+def submit_multi_date_job(groups, intraday=False, formats=("xlsx",), job_dir=JOB_DIR, run_log=RUN_LOG):
+    """
+    Comme submit_job pour plusieurs journées d'un même envoi : `groups` associe
+    à chaque date AAAAMMJJ ses fichiers (voir app.trade_dates.group_by_date).
+    Chaque journée est traitée par un processus de la file, en parallèle, et
+    enregistrée une fois dans l'historique ; les fichiers traités sont réunis
+    dans une archive zip (voir job_archive_path).
+    """
+    purge_expired(job_dir)
+    with _lock:
+        pending = sum(not future.done() for future in _futures.values())
+        if pending + len(groups) > MAX_PENDING_JOBS:
+            raise JobQueueFull(f"{pending} traitements sont déjà en cours ou en attente.")
+        job_id = uuid.uuid4().hex[:12]
+        directory = os.path.join(job_dir, job_id)
+        os.makedirs(os.path.join(directory, DAYS_DIR))
+        _write_status(directory, {
+            "job_id": job_id,
+            "state": RUNNING,
+            "trade_date": ", ".join(sorted(groups)),
+            "files": [name for files in groups.values() for name, _ in files],
+            "intraday": intraday,
+            "formats": list(formats),
+            "submitted_at": datetime.now().isoformat(timespec="seconds"),
+            "days": {key: {"state": QUEUED, "files": len(files)} for key, files in groups.items()},
+            "stage": None,
+            "stages_started": 0,
+            "messages": [],
+            "notices": [],
+        })
+        for key, files in groups.items():
+            future = _submit(run_day, directory, key, files, intraday, formats)
+            future.add_done_callback(partial(_day_done, directory, key, run_log))
+            _futures[f"{job_id}-{key}"] = future
+    return job_id
+
+
+def run_day(directory, key, files, intraday=False, formats=("xlsx",),
+            history_dir=HISTORY_DIR, state_dir=INTRADAY_DIR):
+    """
+    Journée `key` d'un traitement soumis par submit_multi_date_job : fichiers
+    traités dans days/ du dossier du traitement. L'état est tenu par le
+    processus de l'application (voir _day_done).
+    Retourne (lignes ou None, messages, informations, profil).
+    """
+    profile = RunProfile(source="app", trade_date=key, files=len(files))
+    messages, notices = [], []
+    rows = None
+    try:
+        processed, _ = _process_day(files, pd.to_datetime(key, format="%Y%m%d"), intraday, profile, messages,
+                                    notices, history_dir, state_dir)
+        if processed is not None:
+            with profile.stage("export", rows_in=len(processed)):
+                for fmt in formats:
+                    atomic_write(os.path.join(directory, DAYS_DIR, key + EXPORT_FORMATS[fmt]),
+                                 lambda tmp: write_output(processed, tmp, fmt))
+            rows = len(processed)
+    except Exception as e:
+        messages.append(f"Erreur lors du traitement : {e}")
+    return rows, messages, notices, profile.to_dict()
+
+
+def _day_done(directory, key, run_log, future):
+    # Exécuté dans le processus de l'application, une journée à la fois
+    try:
+        rows, messages, notices, run = future.result()
+        append_run(run, run_log)
+    except Exception as e:
+        rows, messages, notices = None, [_failure_message(e)], []
+    with _lock:
+        status = _read_status(directory)
+        status["days"][key].update(state=DONE if rows is not None else FAILED, rows=rows)
+        status["messages"] += [f"{key} : {message}" for message in messages]
+        status["notices"] += [f"{key} : {notice}" for notice in notices]
+        if all(day["state"] in (DONE, FAILED) for day in status["days"].values()):
+            done = [day for day, info in status["days"].items() if info["state"] == DONE]
+            if done:
+                _write_archive(directory, done, status["formats"])
+            status.update(state=DONE if done else FAILED, rows=sum(status["days"][day]["rows"] for day in done),
+                          finished_at=datetime.now().isoformat(timespec="seconds"))
+        _write_status(directory, status)
+
+
+def _write_archive(directory, keys, formats):
+    # Fichiers déjà compressés (xlsx, parquet) : archive sans recompression
+    def write(tmp_path):
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_STORED) as archive:
+            for key in keys:
+                for fmt in formats:
+                    name = key + EXPORT_FORMATS[fmt]
+                    archive.write(os.path.join(directory, DAYS_DIR, name), name)
+
+    atomic_write(os.path.join(directory, ARCHIVE_NAME), write)
+
+
+def job_status(job_id, job_dir=JOB_DIR):
+    """
+    État d'un traitement (contenu de status.json), avec "progress" entre 0 et
+    1, ou None s'il est inconnu ou expiré. Un traitement resté en attente ou
+    en cours sans processus de ce serveur pour l'exécuter (serveur redémarré
+    entre-temps) est marqué en échec.
+    """
+    directory = os.path.join(job_dir, os.path.basename(job_id))
+    status = _read_status(directory)
+    if status is None:
+        return None
+    if status["state"] in (QUEUED, RUNNING):
+        status = _fail_if_orphaned(directory, status)
+        if status is None:
+            return None
+    if status["state"] == DONE:
+        status["progress"] = 1.0
+    elif "days" in status:
+        finished = sum(day["state"] in (DONE, FAILED) for day in status["days"].values())
+        status["progress"] = finished / (len(status["days"]) + 1)
+    else:
+        stages = INTRADAY_STAGES if status.get("intraday") else JOB_STAGES
+        status["progress"] = min(status["stages_started"] / (len(stages) + 1), 1.0)
+    return status
+
+
+def _fail_if_orphaned(directory, status):
+    # Sous verrou : submit_job écrit l'état et inscrit la future sous ce même verrou
+    job_id = os.path.basename(directory)
+    with _lock:
+        if any(name.split("-")[0] == job_id for name in _futures):
+            return status
+        status = _read_status(directory)
+        if status is None or status["state"] not in (QUEUED, RUNNING):
+            return status
+        for day in status.get("days", {}).values():
+            if day["state"] not in (DONE, FAILED):
+                day["state"] = FAILED
+        message = "Traitement interrompu par un redémarrage du serveur : relancez-le."
+        status.update(state=FAILED, messages=status["messages"] + [message],
+                      finished_at=datetime.now().isoformat(timespec="seconds"))
+        _write_status(directory, status)
+    return status
+
+
+def job_output_path(job_id, fmt="xlsx", job_dir=JOB_DIR):
+    """
+    Chemin du fichier traité au format `fmt` d'un traitement terminé.
+    """
+    return os.path.join(job_dir, os.path.basename(job_id), OUTPUT_NAME + EXPORT_FORMATS[fmt])
+
+
+def job_archive_path(job_id, job_dir=JOB_DIR):
+    """
+    Chemin de l'archive zip des fichiers traités d'un traitement de plusieurs dates.
+    """
+    return os.path.join(job_dir, os.path.basename(job_id), ARCHIVE_NAME)
+
+
+def job_preview_path(job_id, job_dir=JOB_DIR):
+    """
+    Chemin du fichier d'aperçu d'un traitement terminé (voir app.preview).
+    """
+    return os.path.join(job_dir, os.path.basename(job_id), RESULT_PREVIEW)
+
+
+def list_jobs(job_ids, job_dir=JOB_DIR, limit=10):
+    """
+    États des derniers traitements parmi `job_ids` (ceux d'une session), du
+    plus récent au plus ancien.
+    """
+    statuses = [job_status(job_id, job_dir) for job_id in set(job_ids)]
+    statuses = [status for status in statuses if status is not None]
+    return sorted(statuses, key=lambda status: status["submitted_at"], reverse=True)[:limit]
+
+
+def purge_expired(job_dir=JOB_DIR, ttl=JOB_TTL_SECONDS):
+    """
+    Supprime les traitements soumis il y a plus de `ttl` secondes, sauf ceux
+    encore en cours dans ce processus.
+    """
+    if not os.path.isdir(job_dir):
+        return
+    limit = time.time() - ttl
+    with _lock:
+        # Clés "job_id" ou "job_id-AAAAMMJJ" (une par date, voir submit_multi_date_job)
+        active = {name.split("-")[0] for name, future in _futures.items() if not future.done()}
+    for entry in os.scandir(job_dir):
+        if entry.is_dir() and entry.name not in active and entry.stat().st_mtime < limit:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            for name in [name for name in _futures if name.split("-")[0] == entry.name]:
+                _futures.pop(name, None)
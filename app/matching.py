@@ -0,0 +1,278 @@
+import numpy as np
+import pandas as pd
+
+from app.tickers import UNKNOWN_MONTH, parse_tickers
+
+# ------------------------
+# Détection des paires de Roll
+# ------------------------
+
+SHORT_WINDOW = 120      # secondes, fenêtre prioritaire
+EXTENDED_WINDOW = 10000  # secondes, fenêtre étendue
+TOLERANCE = 0.05        # écart relatif toléré sur Size et Price
+GROUPED_TICKER_LEN = 7  # ticker déjà groupé (roll L0)
+# Structures à plus de deux legs (butterfly, strip) : legs exécutées ensemble
+MULTI_LEG_WINDOW = 5    # secondes autour de la première leg
+MIN_MULTI_LEGS = 3
+MAX_MULTI_LEGS = 8
+
+
+def time_to_seconds(times):
+    """
+    Convertit une série de datetime.time en secondes depuis minuit (NaN si absente).
+    """
+    return np.array(
+        [t.hour * 3600 + t.minute * 60 + t.second + t.microsecond / 1e6 if hasattr(t, "hour") else np.nan
+         for t in times],
+        dtype=float,
+    )
+
+
+def encode_tickers(tickers):
+    """
+    Codes entiers des tickers (tels qu'écrits en texte), de leur racine et
+    indicateur de ticker groupé, à partir de la table des tickers distincts
+    (voir app.tickers). Retourne (codes ticker, codes racine, groupé).
+    """
+    codes, parsed = parse_tickers(tickers)
+    text_codes, _ = pd.factorize(np.array([p.text for p in parsed], dtype=object))
+    root_codes, _ = pd.factorize(np.array([p.root for p in parsed], dtype=object))
+    grouped = np.array([len(p.text) == GROUPED_TICKER_LEN for p in parsed])
+    return text_codes[codes], root_codes[codes], grouped[codes]
+
+
+def match_roll_pairs(tickers, sizes, prices, seconds, assigned=None, initiators=None, first_roll=1):
+    """
+    Associe les lignes deux à deux en Roll, avec les mêmes règles que l'ancienne
+    boucle O(n²) : pour chaque ligne i (dans l'ordre), on retient la première ligne
+    j > i libre, de même préfixe de ticker (3 caractères), de ticker différent,
+    dont Size et Price sont à ±5% de ceux de i, en privilégiant un écart de temps
+    <= 120 sec puis <= 10000 sec. Les tickers de 7 caractères sont des rolls déjà
+    groupés (L0).
+
+    Les candidats sont regroupés par préfixe puis triés par heure : la
+    recherche dans la fenêtre courte se limite donc à la fenêtre de temps par
+    recherche dichotomique. Dans la fenêtre étendue, les candidats encore
+    libres de chaque préfixe (voir _free_list) sont parcourus dans
+    l'ordre d'origine jusqu'au premier qui convient.
+
+    Paramètres : tableaux alignés (tickers, éventuellement en catégories,
+    sizes/prices en float, seconds = heure en secondes depuis minuit). Les
+    comparaisons de tickers et de préfixes portent sur des codes entiers
+    (voir encode_tickers).
+    Pour un traitement par blocs (voir app.streaming) : `assigned` marque les
+    lignes déjà appariées par un bloc précédent, seules les `initiators`
+    premières lignes cherchent un partenaire (les suivantes ne sont que
+    candidates) et la numérotation des rolls commence à `first_roll`.
+    Avant de chercher une paire, chaque ligne i tente d'ouvrir une structure de
+    MIN_MULTI_LEGS legs ou plus (voir _structure_legs), numérotée comme un roll
+    et dont les legs vont de L1 à Lk par échéance.
+    Retourne deux tableaux d'entiers : numéro de roll (0 si aucun) et leg
+    (0 pour L0, 1 pour L1, 2 pour L2..., -1 si aucun).
+    """
+    contracts = contract_index(tickers)
+    tickers, prefixes, grouped = encode_tickers(tickers)
+    sizes = np.asarray(sizes, dtype=float)
+    prices = np.asarray(prices, dtype=float)
+    seconds = np.asarray(seconds, dtype=float)
+    n = len(tickers)
+
+    roll_numbers = np.zeros(n, dtype=np.int64)
+    legs = np.full(n, -1, dtype=np.int64)
+    if assigned is None:
+        assigned = np.zeros(n, dtype=bool)
+    else:
+        assigned = np.array(assigned, dtype=bool)
+
+    # Index par préfixe : positions triées par heure (les heures manquantes ne
+    # peuvent jamais être appariées)
+    dated = np.flatnonzero(~np.isnan(seconds))
+    dated = dated[np.lexsort((seconds[dated], prefixes[dated]))]
+    starts = np.flatnonzero(np.diff(prefixes[dated], prepend=-1))
+    buckets, free = {}, {}
+    for positions in np.split(dated, starts[1:]):
+        if len(positions):
+            buckets[prefixes[positions[0]]] = (positions, seconds[positions])
+            # Candidats de la fenêtre étendue : lignes libres dans l'ordre d'origine
+            free[prefixes[positions[0]]] = _free_list(np.sort(positions[~assigned[positions]]),
+                                                      tickers, sizes, prices, seconds)
+
+    roll_counter = first_roll - 1
+    for i in range(n if initiators is None else initiators):
+        if assigned[i]:
+            continue
+
+        if grouped[i]:
+            roll_counter += 1
+            roll_numbers[i] = roll_counter
+            legs[i] = 0
+            assigned[i] = True
+            continue
+
+        if np.isnan(seconds[i]):
+            continue
+        bucket_positions, bucket_seconds = buckets[prefixes[i]]
+        # i n'est plus candidate pour les lignes suivantes
+        bucket_free = free[prefixes[i]]
+        bucket_free[-1] += 1
+
+        members = _structure_legs(i, bucket_positions, bucket_seconds,
+                                  grouped, contracts, sizes, prices, seconds, assigned)
+        if members is not None:
+            roll_counter += 1
+            roll_numbers[members] = roll_counter
+            legs[members] = np.arange(1, len(members) + 1)
+            assigned[members] = True
+            bucket_free[-1] += len(members) - 1
+            continue
+
+        chosen_j = _first_candidate(i, SHORT_WINDOW, bucket_positions, bucket_seconds,
+                                    tickers, sizes, prices, seconds, assigned)
+        if chosen_j is None:
+            chosen_j = _first_free_candidate(i, EXTENDED_WINDOW, bucket_free,
+                                             tickers, sizes, prices, seconds, assigned)
+        if chosen_j is None:
+            continue
+        bucket_free[-1] += 1
+
+        roll_counter += 1
+        roll_numbers[i] = roll_numbers[chosen_j] = roll_counter
+        legs[i] = 1
+        legs[chosen_j] = 2
+        assigned[i] = assigned[chosen_j] = True
+
+    return roll_numbers, legs
+
+
+def contract_index(tickers):
+    """
+    Rang de l'échéance de chaque ticker en mois (année sur un chiffre × 12 +
+    mois), -1 si le mois n'est pas reconnu.
+    """
+    codes, parsed = parse_tickers(tickers)
+    index = np.array([p.year * 12 + p.month - 1 if p.month != UNKNOWN_MONTH else -1 for p in parsed],
+                     dtype=np.int64)
+    return index[codes]
+
+
+def _structure_legs(i, bucket_positions, bucket_seconds, grouped, contracts, sizes, prices, seconds, assigned):
+    """
+    Structure calendaire d'au moins MIN_MULTI_LEGS legs (butterfly, strip)
+    ouverte par la ligne i : parmi les lignes j > i libres du même préfixe, à
+    MULTI_LEG_WINDOW secondes au plus et de Size et Price à ±5% de ceux de i,
+    on garde la première ligne de chaque échéance, puis la plus longue suite
+    d'échéances régulièrement espacées contenant celle de i.
+    Retourne les positions des legs par échéance croissante, ou None.
+    """
+    if grouped[i] or contracts[i] < 0:
+        return None
+    lo = np.searchsorted(bucket_seconds, seconds[i] - MULTI_LEG_WINDOW, side="left")
+    hi = np.searchsorted(bucket_seconds, seconds[i] + MULTI_LEG_WINDOW, side="right")
+    if hi - lo < MIN_MULTI_LEGS:
+        return None
+    candidates = bucket_positions[lo:hi]
+    mask = (
+        (candidates > i)
+        & ~assigned[candidates]
+        & ~grouped[candidates]
+        & (contracts[candidates] >= 0)
+        & (contracts[candidates] != contracts[i])
+        & ~(np.abs(sizes[i] - sizes[candidates]) > TOLERANCE * sizes[i])
+        & ~(np.abs(prices[i] - prices[candidates]) > TOLERANCE * prices[i])
+    )
+    if mask.sum() < MIN_MULTI_LEGS - 1:
+        return None
+    by_contract = {}
+    for j in np.sort(candidates[mask]):
+        by_contract.setdefault(int(contracts[j]), int(j))
+    chain = _contract_chain(int(contracts[i]), by_contract)
+    if chain is None:
+        return None
+    return [i if contract == contracts[i] else by_contract[contract] for contract in chain]
+
+
+def _contract_chain(start, by_contract):
+    """
+    Plus longue suite d'échéances régulièrement espacées (MIN_MULTI_LEGS à
+    MAX_MULTI_LEGS) contenant `start` parmi `start` et les clés de
+    `by_contract` ; à longueur égale, le plus petit pas. None si aucune.
+    """
+    available = set(by_contract) | {start}
+    best = None
+    for step in sorted({abs(contract - start) for contract in by_contract}):
+        first = start
+        while first - step in available:
+            first -= step
+        chain = list(range(first, first + step * MAX_MULTI_LEGS, step))
+        chain = chain[:next((k for k, c in enumerate(chain) if c not in available), len(chain))]
+        if start in chain and len(chain) >= MIN_MULTI_LEGS and (best is None or len(chain) > len(best)):
+            best = chain
+    return best
+
+
+def _free_list(positions, tickers, sizes, prices, seconds):
+    # [positions dans l'ordre d'origine, puis leurs colonnes, nombre de
+    # positions devenues inutilisables (appariées ou déjà traitées)]
+    return [positions, tickers[positions], sizes[positions], prices[positions], seconds[positions], 0]
+
+
+def _first_free_candidate(i, window, bucket_free, tickers, sizes, prices, seconds, assigned):
+    """
+    Même résultat que _first_candidate, en parcourant les candidats libres du
+    préfixe (`bucket_free`, voir _free_list) dans l'ordre d'origine, par blocs
+    de taille croissante jusqu'au premier bloc contenant un candidat : le coût
+    dépend de la distance au partenaire et non du nombre de lignes de la fenêtre.
+    """
+    if 2 * bucket_free[-1] > len(bucket_free[0]):
+        # Liste compactée dès que la moitié des positions est inutilisable
+        positions = bucket_free[0]
+        keep = (positions > i) & ~assigned[positions]
+        bucket_free[:] = [column[keep] for column in bucket_free[:-1]] + [0]
+    positions, free_tickers, free_sizes, free_prices, free_seconds, _ = bucket_free
+    start = np.searchsorted(positions, i, side="right")
+    block = 128
+    lo, hi = seconds[i] - window, seconds[i] + window
+    while start < len(positions):
+        end = start + block
+        candidates = positions[start:end]
+        candidate_seconds = free_seconds[start:end]
+        mask = (
+            ~assigned[candidates]
+            & (candidate_seconds >= lo)
+            & (candidate_seconds <= hi)
+            & (free_tickers[start:end] != tickers[i])
+            & ~(np.abs(sizes[i] - free_sizes[start:end]) > TOLERANCE * sizes[i])
+            & ~(np.abs(prices[i] - free_prices[start:end]) > TOLERANCE * prices[i])
+        )
+        if mask.any():
+            return int(candidates[mask.argmax()])
+        start = end
+        block *= 2
+    return None
+
+
+def _first_candidate(i, window, bucket_positions, bucket_seconds,
+                     tickers, sizes, prices, seconds, assigned):
+    """
+    Retourne la première position j > i (ordre d'origine) satisfaisant les
+    critères du Roll dans la fenêtre de temps donnée, ou None.
+    """
+    lo = np.searchsorted(bucket_seconds, seconds[i] - window, side="left")
+    hi = np.searchsorted(bucket_seconds, seconds[i] + window, side="right")
+    if lo >= hi:
+        return None
+    candidates = bucket_positions[lo:hi]
+    size_i = sizes[i]
+    price_i = prices[i]
+    # Les comparaisons avec NaN valent False : comme dans la boucle d'origine,
+    # une Size manquante n'exclut pas le candidat
+    mask = (
+        (candidates > i)
+        & ~assigned[candidates]
+        & (tickers[candidates] != tickers[i])
+        & ~(np.abs(size_i - sizes[candidates]) > TOLERANCE * size_i)
+        & ~(np.abs(price_i - prices[candidates]) > TOLERANCE * price_i)
+    )
+    if not mask.any():
+        return None
+    return int(candidates[mask].min())
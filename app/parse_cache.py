@@ -0,0 +1,79 @@
+import hashlib
+import os
+import uuid
+
+import pandas as pd
+
+# ------------------------
+# Cache disque des fichiers grid déjà lus
+# ------------------------
+
+# Partagé entre l'application Streamlit et le script : les fichiers sont stockés
+# au format Feather, nommés par l'empreinte de leur contenu
+CACHE_DIR = "data/cache/grid"
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+def content_key(data, salt=b""):
+    """
+    Empreinte du contenu d'un fichier (et du schéma de lecture via `salt`).
+    """
+    return hashlib.blake2b(data + salt, digest_size=20).hexdigest()
+
+
+def _cache_path(key, cache_dir):
+    return os.path.join(cache_dir, f"{key}.feather")
+
+
+def cache_get(key, cache_dir=CACHE_DIR):
+    """
+    Retourne le DataFrame en cache pour `key`, ou None. Un accès rafraîchit la
+    date de modification du fichier, utilisée pour l'éviction LRU.
+    """
+    path = _cache_path(key, cache_dir)
+    try:
+        df = pd.read_feather(path)
+        os.utime(path)
+    except Exception:
+        return None
+    return df
+
+
+def cache_put(key, df, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+    """
+    Enregistre `df` sous `key` (écriture atomique), puis supprime les entrées
+    les moins récemment utilisées au-delà de `max_bytes`.
+    Un DataFrame non sérialisable en Feather n'est simplement pas mis en cache.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _cache_path(key, cache_dir)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        df.reset_index(drop=True).to_feather(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    evict(cache_dir, max_bytes)
+
+
+def evict(cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, suffix=".feather"):
+    """
+    Supprime les fichiers (d'extension `suffix`) les plus anciennement
+    utilisés jusqu'à repasser sous `max_bytes`.
+    """
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(suffix):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
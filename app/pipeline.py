@@ -0,0 +1,254 @@
+import pandas as pd
+import numpy as np
+
+from app.matching import match_roll_pairs
+from app.assembly import build_roll_rows, excel_row_numbers
+from app.classification import classify_roll_clients
+from app.closing_prices import fill_closing_prices
+from app.compact import compact_trades, expand_compact
+from app.dedup import drop_duplicate_trades
+from app.ingestion import MAX_WORKERS, read_grid_files
+from app.tickers import contract_order
+from app.profiling import RunProfile
+
+# ------------------------
+# Chaîne de traitement commune (application Streamlit, traitement par lot)
+# ------------------------
+
+# Les lignes d'avant 8h sont traitées après les autres
+MORNING = 8 * 3600
+
+# Colonnes du fichier traité, dans l'ordre
+OUTPUT_COLUMNS = [
+    'Time', 'Level', 'Ticker', 'Notional', 'Size', 'Price', 'Closing1d',
+    'Structure_ID', 'Structure', 'Volume', '1DChg', 'UndTkr', '1PtVal',
+    'Exch', 'FutName', 'UndCmpName', 'UndPrc', 'Date'
+]
+
+
+def process_grid_files(files, trade_date, report_error=print, max_workers=MAX_WORKERS, profile=None,
+                       report_info=None):
+    """
+    Lit les fichiers grid (couples (nom, chemin ou bytes)), retire les trades
+    en double entre fichiers (voir app.dedup) puis applique le traitement de la
+    journée `trade_date`. Les erreurs sont transmises à `report_error` (st.error
+    dans l'application, print en ligne de commande), le nombre de doublons
+    retirés par fichier à `report_info` (report_error par défaut).
+    Chaque étape est mesurée dans `profile` (voir app.profiling) s'il est fourni.
+    Retourne le DataFrame final, ou None si aucun fichier n'est exploitable.
+    """
+    profile = profile or RunProfile()
+    report_info = report_info or report_error
+    with profile.stage("lecture", rows_in=len(files)) as stage:
+        dataframes, errors = read_grid_files(files, max_workers=max_workers)
+        stage.rows_out = sum(len(df) for df in dataframes)
+    for name, e in errors:
+        report_error(f"Erreur lors du chargement de {name}: {e}")
+    if not dataframes:
+        report_error("Aucun fichier valide n'a été chargé.")
+        return None
+
+    with profile.stage("dédoublonnage", rows_in=stage.rows_out) as stage:
+        dataframes, dropped, _ = drop_duplicate_trades(dataframes)
+        stage.rows_out = sum(len(df) for df in dataframes)
+    loaded = [name for name, _ in files]
+    for name, _ in errors:
+        loaded.remove(name)
+    for name, count in zip(loaded, dropped):
+        if count:
+            report_info(f"{name} : {count} trade(s) déjà présent(s) dans un autre fichier ignoré(s).")
+    return process_frames(dataframes, trade_date, report_error, profile)
+
+
+def process_frames(dataframes, trade_date, report_error=print, profile=None):
+    """
+    Traitement d'une journée à partir des DataFrames lus : détection des Roll,
+    lignes de synthèse, formules Excel et Roll-Client, une étape nommée à la fois.
+    """
+    profile = profile or RunProfile()
+    rows_in = sum(len(df) for df in dataframes)
+
+    with profile.stage("préparation", rows_in=rows_in) as stage:
+        final_df = prepare_trades(dataframes, trade_date)
+        if final_df is None:
+            report_error("La colonne 'Time' est introuvable dans les fichiers.")
+            return None
+        stage.rows_out = len(final_df)
+
+    with profile.stage("appariement", rows_in=len(final_df)) as stage:
+        final_df = assign_structures(final_df, trade_date)
+        stage.rows_out = int(final_df['Structure'].eq('Leg').sum())
+
+    return assemble_day(final_df, trade_date, profile)
+
+
+def assemble_day(final_df, trade_date, profile=None):
+    """
+    Construit le fichier traité à partir des lignes de la journée dont les
+    Structure_ID et Structure sont attribués : tri, lignes de synthèse des Roll,
+    formules Excel et Roll-Client.
+    """
+    profile = profile or RunProfile()
+    with profile.stage("tri", rows_in=len(final_df)) as stage:
+        df_roll_sorted, df_screen_sorted, df_outright_sorted = split_by_structure(final_df)
+        stage.rows_out = len(final_df)
+
+    with profile.stage("synthèse", rows_in=len(df_roll_sorted)) as stage:
+        # Insertion des lignes résumé pour les Roll (Merge Roll) avec calcul "Level"
+        df_roll_final = build_roll_rows(df_roll_sorted, trade_date.strftime('%Y%m%d'))
+        stage.rows_out = len(df_roll_final)
+
+    with profile.stage("formules") as stage:
+        # Assemblage final
+        final_sorted = pd.concat([df_roll_final, df_screen_sorted, df_outright_sorted], ignore_index=True)
+        final_sorted = expand_compact(final_sorted)
+        stage.rows_in = len(final_sorted)
+        final_sorted = add_formula_columns(final_sorted)
+        stage.rows_out = len(final_sorted)
+
+    with profile.stage("roll-client", rows_in=len(final_sorted)) as stage:
+        # Détection des Roll-Client : les 2 legs ont le même Price ou le même Notional
+        final_sorted = classify_roll_clients(final_sorted)
+        final_sorted = reorder_columns(final_sorted)
+        stage.rows_out = len(final_sorted)
+    return final_sorted
+
+
+def prepare_trades(dataframes, trade_date):
+    """
+    Concatène les fichiers, les normalise (voir compact_trades), trie par heure
+    et initialise les colonnes de la journée. Retourne None si la colonne
+    'Time' est absente.
+    """
+    # Concaténation de tous les fichiers
+    final_df = pd.concat(dataframes, ignore_index=True)
+
+    # Tri initial par heure si la colonne 'Time' existe
+    if 'Time' not in final_df.columns:
+        return None
+    final_df = compact_trades(final_df)
+    final_df['sort_order'] = np.where(final_df['seconds'] >= MORNING, 0, 1)
+    final_df = final_df.sort_values(by=['sort_order', 'seconds']).drop(columns=['sort_order']).reset_index(drop=True)
+    # Inversion de l'ordre des lignes
+    final_df = final_df.iloc[::-1].reset_index(drop=True)
+
+    # Saisie de la date et initialisation des colonnes
+    final_df['Date'] = trade_date
+    final_df['Structure_ID'] = ""
+    final_df['Price'] = pd.to_numeric(final_df['Price'], errors='coerce')
+    final_df['Size'] = pd.to_numeric(final_df['Size'], errors='coerce')
+    return final_df
+
+
+def assign_structures(final_df, trade_date):
+    """
+    Détection des paires de Roll puis attribution des Structure_ID et Structure
+    (Leg, Roll Screen, Outright).
+    """
+    # Séparation des lignes selon la présence de Price
+    df_price_ok = final_df[final_df['Price'].notna()]
+
+    # Détection combinée des paires de Roll (priorité à 120 sec, sinon seuil étendu)
+    roll_numbers, legs = match_roll_pairs(
+        df_price_ok['Ticker'].to_numpy(),
+        df_price_ok['Size'].to_numpy(dtype=float),
+        df_price_ok['Price'].to_numpy(dtype=float),
+        df_price_ok['seconds'].to_numpy(),
+    )
+    matched = legs >= 0
+    date_code = trade_date.strftime('%Y%m%d')
+    final_df.loc[df_price_ok.index[matched], 'Structure_ID'] = [
+        f"{date_code}-R-{r}-L{leg}" for r, leg in zip(roll_numbers[matched], legs[matched])
+    ]
+    return label_structures(final_df, date_code)
+
+
+def label_structures(final_df, date_code):
+    """
+    Complète les Structure_ID des lignes non appariées (Screen sans prix,
+    Outright sinon) et crée la colonne "Structure".
+    """
+    # Attribution des labels "Screen" et "Outright"
+    final_df.loc[final_df['Price'].isna(), 'Structure_ID'] = f"{date_code}-S"
+    final_df.loc[final_df['Structure_ID'] == "", 'Structure_ID'] = f"{date_code}-O"
+
+    # Création de la colonne "Structure"
+    def extract_Structure(struct_code):
+        if 'R' in struct_code:
+            return 'Leg'
+        elif 'S' in struct_code:
+            return 'Screen'
+        elif 'O' in struct_code:
+            return 'Outright'
+        else:
+            return 'Autre'
+    final_df['Structure'] = final_df['Structure_ID'].apply(extract_Structure)
+    final_df['Structure'] = final_df['Structure'].replace("Screen", "Roll Screen")
+    return final_df
+
+
+def split_by_structure(final_df):
+    """
+    Regroupe les lignes par catégorie et retourne (rolls, screens, outrights)
+    triés : les legs par roll puis par échéance, les autres par heure.
+    """
+    # Regroupement par catégorie et tri global
+    order_mapping = {'Leg': 0, 'Screen': 1, 'Outright': 2, 'Autre': 3}
+    final_df['sort_order'] = final_df['Structure'].map(order_mapping)
+    final_df = final_df.sort_values(by='sort_order').drop(columns=['sort_order'])
+    roll_mask = final_df['Structure_ID'].str.contains("-R-")
+    screen_mask = final_df['Structure_ID'].str.contains("-S")
+    outright_mask = final_df['Structure_ID'].str.contains("-O")
+    df_roll = final_df[roll_mask].copy()
+    df_screen = final_df[screen_mask].copy()
+    df_outright = final_df[outright_mask].copy()
+
+    df_roll_sorted = sort_roll_legs(df_roll)
+    df_screen_sorted = df_screen.sort_values(by='Time')
+    df_outright_sorted = df_outright.sort_values(by='Time')
+    return df_roll_sorted, df_screen_sorted, df_outright_sorted
+
+
+def sort_roll_legs(df_roll):
+    """
+    Tri personnalisé des legs (colonne Structure_ID renseignée) : par numéro de
+    roll puis par échéance du ticker (année, puis mois, voir app.tickers).
+    Ajoute les colonnes d'aide au tri.
+    """
+    extracted_counter: pd.Series = df_roll['Structure_ID'].str.extract(r'-R-(\d+)-L', expand=False)
+    df_roll['roll_counter'] = pd.to_numeric(extracted_counter, errors='coerce').fillna(0).astype(int)
+    df_roll['contract_year'], df_roll['contract_month'] = contract_order(df_roll['Ticker'])
+    return df_roll.sort_values(by=['roll_counter', 'contract_year', 'contract_month'])
+
+
+def add_formula_columns(final_sorted, first_row=2):
+    """
+    Colonne "Closing1d" (formule BDH) après "Price" pour les Roll et Outright,
+    et formule "Level" des Outright ; les numéros de ligne sont ceux du classeur
+    exporté, dont `final_sorted` commence à la ligne `first_row`. Les cours
+    présents dans le fichier local (voir app.closing_prices) remplacent les
+    formules.
+    """
+    # Insertion de la colonne "Closing1d" juste après "Price"
+    excel_rows = excel_row_numbers(final_sorted, first_row)
+    closing_mask = final_sorted["Structure"].isin(["Roll", "Outright"])
+    closing_formulas = '=BDH(L' + excel_rows + '&" Index", "PX_CLOSE_1D",R' + excel_rows + ',R' + excel_rows + ')'
+    price_idx = final_sorted.columns.get_loc("Price")
+    final_sorted.insert(price_idx+1, "Closing1d", closing_formulas.where(closing_mask, ""))
+
+    # Insertion de la formule dans la colonne "Level" pour les "Outright"
+    # On insère ici une formule Excel qui calcule (Price/Closing1d - 1)
+    outright_mask = final_sorted["Structure"] == "Outright"
+    if outright_mask.any():
+        if "Level" in final_sorted.columns:
+            level = final_sorted["Level"].astype(object)
+        else:
+            level = pd.Series(np.nan, index=final_sorted.index, dtype=object)
+        final_sorted["Level"] = level.where(~outright_mask, '=(F' + excel_rows + '/G' + excel_rows + ')')
+    return fill_closing_prices(final_sorted)
+
+
+def reorder_columns(df):
+    # Garder les colonnes restantes à la fin s’il y en a
+    other_columns = [col for col in df.columns if col not in OUTPUT_COLUMNS]
+    return df[OUTPUT_COLUMNS + other_columns]
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from app.history import to_columnar
+from app.tickers import ticker_field
+
+# ------------------------
+# Aperçu paginé du fichier traité
+# ------------------------
+
+# Le fichier traité est écrit une fois en Parquet (par groupes de lignes) ;
+# l'aperçu ne relit que les colonnes de filtre puis les groupes de la page
+PREVIEW_ROW_GROUP = 10000
+PREVIEW_PAGE_ROWS = 200
+PREVIEW_STRUCTURES = ['Roll', 'Roll Client', 'Leg', 'Roll Screen', 'Outright']
+ROOT_COLUMN = 'Racine'
+
+
+def write_preview(df, path):
+    """
+    Enregistre le fichier traité pour l'aperçu, avec la racine du ticker
+    (voir app.tickers) comme colonne de filtre. Les formules Excel n'y
+    figurent pas (valeurs manquantes).
+    """
+    table = to_columnar(df)
+    table[ROOT_COLUMN] = ticker_field(df['Ticker'], 'root')
+    table.to_parquet(path, index=False, row_group_size=PREVIEW_ROW_GROUP)
+
+
+def preview_summary(path):
+    """
+    Nombre de lignes par Structure et par racine de ticker, calculé sur les
+    seules colonnes de filtre. Retourne (comptes par Structure, comptes par racine).
+    """
+    keys = pq.read_table(path, columns=['Structure', ROOT_COLUMN]).to_pandas()
+    by_structure = keys['Structure'].value_counts().reindex(PREVIEW_STRUCTURES, fill_value=0)
+    by_root = keys[ROOT_COLUMN].value_counts().sort_index()
+    return by_structure, by_root
+
+
+def _filtered_rows(parquet, structures, roots):
+    # Positions des lignes retenues, à partir des seules colonnes de filtre
+    keys = parquet.read(columns=['Structure', ROOT_COLUMN]).to_pandas()
+    mask = np.ones(len(keys), dtype=bool)
+    if structures:
+        mask &= keys['Structure'].isin(structures).to_numpy()
+    if roots:
+        mask &= keys[ROOT_COLUMN].isin(roots).to_numpy()
+    return np.flatnonzero(mask)
+
+
+def preview_count(path, structures=(), roots=()):
+    """
+    Nombre de lignes dont la Structure est dans `structures` et la racine
+    dans `roots` (tout si vide).
+    """
+    return len(_filtered_rows(pq.ParquetFile(path), structures, roots))
+
+
+def preview_page(path, structures=(), roots=(), page=0, page_size=PREVIEW_PAGE_ROWS):
+    """
+    Lignes de la page `page` (à partir de 0) parmi celles retenues par les
+    filtres (voir preview_count).
+    Retourne (DataFrame de la page, nombre total de lignes retenues).
+    """
+    parquet = pq.ParquetFile(path)
+    rows = _filtered_rows(parquet, structures, roots)
+    selected = rows[page * page_size:(page + 1) * page_size]
+    columns = [name for name in parquet.schema_arrow.names if name != ROOT_COLUMN]
+    if not len(selected):
+        return pd.DataFrame(columns=columns), len(rows)
+
+    # Seuls les groupes de lignes contenant la page sont lus
+    sizes = [parquet.metadata.row_group(i).num_rows for i in range(parquet.num_row_groups)]
+    bounds = np.cumsum([0] + sizes)
+    row_groups = np.searchsorted(bounds, selected, side='right') - 1
+    needed = np.unique(row_groups)
+    starts = dict(zip(needed, np.cumsum([0] + [sizes[g] for g in needed])))
+    local = selected - bounds[row_groups] + np.array([starts[g] for g in row_groups])
+    table = parquet.read_row_groups(needed.tolist(), columns=columns)
+    return table.take(local).to_pandas(), len(rows)
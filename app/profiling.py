@@ -0,0 +1,221 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ------------------------
+# Mesure des étapes du traitement
+# ------------------------
+
+# Une ligne JSON par traitement (application, traitement par lot)
+RUN_LOG = "data/processed/run_log.jsonl"
+# Une ligne JSON par démarrage de l'application (voir StartupProfile)
+STARTUP_LOG = "data/processed/startup_log.jsonl"
+
+
+def rss_bytes():
+    """
+    Mémoire résidente actuelle du processus (None si indisponible : hors Linux).
+    Une lecture de /proc/self/statm : assez léger pour rester actif en production.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def reset_peak_rss():
+    """
+    Remet à la mémoire résidente actuelle le pic suivi par le noyau (VmHWM),
+    pour mesurer le pic d'une étape avec stage_peak_rss_bytes(). Retourne
+    False si c'est impossible (hors Linux, /proc en lecture seule).
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def stage_peak_rss_bytes():
+    """
+    Pic de mémoire résidente depuis le dernier reset_peak_rss() (VmHWM de
+    /proc/self/status ; None si indisponible).
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        return None
+    return None
+
+
+def peak_rss_bytes():
+    """
+    Pic de mémoire résidente du processus depuis son démarrage (None si
+    indisponible). Ne redescend jamais : il ne dit rien d'une étape en
+    particulier, seulement du processus entier.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Octets sous macOS, kilo-octets sous Linux
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageRecord:
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.seconds = None
+        self.rss = None
+        self.peak_rss = None
+
+    def to_dict(self):
+        return {
+            "stage": self.name,
+            "seconds": round(self.seconds, 4),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rss_mb": _mb(self.rss),
+            "peak_rss_mb": _mb(self.peak_rss),
+        }
+
+
+class RunProfile:
+    """
+    Durée, lignes en entrée/sortie et mémoire résidente de chaque étape d'un
+    traitement (à la fin de l'étape et pic pendant l'étape), et pic mémoire du
+    processus depuis son démarrage pour le traitement entier. Les étapes ne
+    s'imbriquent pas : chacune remet à zéro le pic suivi par le noyau.
+
+    with profile.stage("appariement", rows_in=len(df)) as stage:
+        ...
+        stage.rows_out = len(resultat)
+
+    `listener`, s'il est fourni, est appelé avec le nom de chaque étape au
+    moment où elle commence (suivi de l'avancement, voir app.jobs).
+    """
+
+    def __init__(self, listener=None, **context):
+        self.listener = listener
+        self.context = context
+        self.stages = []
+        self.started_at = datetime.now()
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        record = StageRecord(name, rows_in)
+        if self.listener is not None:
+            self.listener(name)
+        peak_tracked = reset_peak_rss()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.seconds = time.perf_counter() - start
+            record.rss = rss_bytes()
+            if peak_tracked:
+                record.peak_rss = stage_peak_rss_bytes()
+            self.stages.append(record)
+
+    def to_dict(self):
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "total_seconds": round(time.perf_counter() - self._start, 4),
+            "process_peak_rss_mb": _mb(peak_rss_bytes()),
+            **self.context,
+            "stages": [record.to_dict() for record in self.stages],
+        }
+
+
+class StartupProfile:
+    """
+    Démarrage à froid d'un processus de l'application : secondes écoulées
+    entre le début de la première exécution du script (`started`, valeur de
+    time.perf_counter()) et la fin de chacune des étapes `expected`, mesurées
+    dans n'importe quel ordre et depuis n'importe quel thread. Une ligne est
+    ajoutée à `path` (même format que RunProfile.to_dict()) dès que toutes les
+    étapes sont connues.
+    """
+
+    def __init__(self, started, expected, path=STARTUP_LOG):
+        self.started = started
+        self.expected = list(expected)
+        self.path = path
+        self.started_at = datetime.now()
+        self.seconds = {}
+        self.written = False
+        self._lock = threading.Lock()
+
+    def record(self, name, at=None):
+        # `at` : instant de fin de l'étape (time.perf_counter()), maintenant par défaut
+        with self._lock:
+            if name in self.seconds:
+                return
+            self.seconds[name] = (time.perf_counter() if at is None else at) - self.started
+            if self.written or any(stage not in self.seconds for stage in self.expected):
+                return
+            self.written = True
+        append_run(self.to_dict(), self.path)
+
+    def to_dict(self):
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "total_seconds": round(max(self.seconds.values(), default=0.0), 4),
+            "pid": os.getpid(),
+            "stages": [{"stage": name, "seconds": round(self.seconds[name], 4)}
+                       for name in self.expected if name in self.seconds],
+        }
+
+
+def _mb(value):
+    return None if value is None else round(value / 1024 ** 2, 1)
+
+
+def append_run(run, path=RUN_LOG):
+    """
+    Ajoute un profil (RunProfile.to_dict()) au journal JSONL, une ligne par traitement.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    line = json.dumps(run, ensure_ascii=False, default=str)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+def last_run(path=RUN_LOG):
+    """
+    Dernier profil du journal (None si le journal est vide ou absent), lu
+    depuis la fin du fichier sans parcourir tout le journal.
+    """
+    try:
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            tail = b""
+            while position > 0 and tail.count(b"\n") < 2:
+                step = min(64 * 1024, position)
+                position -= step
+                f.seek(position)
+                tail = f.read(step) + tail
+    except FileNotFoundError:
+        return None
+    lines = [line for line in tail.splitlines() if line.strip()]
+    if not lines:
+        return None
+    return json.loads(lines[-1])
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from app.history import HISTORY_DIR, date_key, partition_path, read_manifest
+from app.tickers import ticker_field
+
+# ------------------------
+# Requêtes sur l'historique (plusieurs dates)
+# ------------------------
+
+# Exemple : tous les Roll ZVL de décembre 2024 de Size >= 500
+#   query_history("2024-12-01", "2024-12-31", roots=["ZVL"], structures=["Roll"], min_size=500)
+# Les partitions et groupes de lignes sont choisis d'après l'index du manifeste
+# (voir app.history.row_group_index) : seuls ceux pouvant contenir des lignes
+# retenues sont lus.
+
+
+def _group_matches(group, roots, structures, min_size, min_notional):
+    if roots and not set(roots) & set(group["roots"]):
+        return False
+    if structures and not set(structures) & set(group["structures"]):
+        return False
+    if min_size is not None and (group["max_size"] is None or group["max_size"] < min_size):
+        return False
+    if min_notional is not None and (group["max_notional"] is None or group["max_notional"] < min_notional):
+        return False
+    return True
+
+
+def plan_query(start=None, end=None, roots=(), structures=(), min_size=None, min_notional=None,
+               history_dir=HISTORY_DIR):
+    """
+    Partitions et groupes de lignes à lire pour une requête (voir
+    query_history) : {AAAAMMJJ: [numéros de groupes] ou None pour tous (partition
+    non indexée, voir app.history.index_history)}.
+    """
+    manifest = read_manifest(history_dir, start, end)
+    first = date_key(start) if start is not None else None
+    last = date_key(end) if end is not None else None
+    plan = {}
+    for key in sorted(manifest):
+        if (first is not None and key < first) or (last is not None and key > last):
+            continue
+        groups = manifest[key].get("row_groups")
+        if groups is None:
+            plan[key] = None
+            continue
+        selected = [i for i, group in enumerate(groups)
+                    if _group_matches(group, roots, structures, min_size, min_notional)]
+        if selected:
+            plan[key] = selected
+    return plan
+
+
+def query_history(start=None, end=None, roots=(), structures=(), min_size=None, min_notional=None,
+                  columns=None, history_dir=HISTORY_DIR):
+    """
+    Lignes de l'historique entre `start` et `end` (inclus, optionnels) dont la
+    racine de ticker est dans `roots`, la Structure dans `structures` (tout si
+    vide), Size >= `min_size` et Notional >= `min_notional` (si donnés).
+    `columns` : colonnes retournées (toutes par défaut).
+    """
+    filter_columns = ([name for name, used in (('Ticker', roots), ('Structure', structures),
+                                               ('Size', min_size is not None),
+                                               ('Notional', min_notional is not None)) if used])
+    frames, empty = [], pd.DataFrame(columns=columns or [])
+    for key, groups in plan_query(start, end, roots, structures, min_size, min_notional, history_dir).items():
+        parquet = pq.ParquetFile(partition_path(key, history_dir))
+        names = parquet.schema_arrow.names
+        wanted = names if columns is None else [name for name in columns if name in names]
+        if groups is None:
+            groups = list(range(parquet.num_row_groups))
+        # Colonnes de filtre d'abord ; les autres colonnes des seules lignes retenues ensuite
+        keys = parquet.read_row_groups(groups, columns=[n for n in filter_columns if n in names]).to_pandas()
+        mask = np.ones(len(keys), dtype=bool)
+        if roots:
+            mask &= np.isin(ticker_field(keys['Ticker'], 'root'), list(roots))
+        if structures:
+            mask &= keys['Structure'].isin(structures).to_numpy()
+        if min_size is not None:
+            mask &= (pd.to_numeric(keys['Size'], errors='coerce') >= min_size).to_numpy()
+        if min_notional is not None:
+            mask &= (pd.to_numeric(keys['Notional'], errors='coerce') >= min_notional).to_numpy()
+        table = parquet.read_row_groups(groups, columns=wanted)
+        if mask.all():
+            frames.append(table.to_pandas())
+        elif mask.any():
+            frames.append(table.take(np.flatnonzero(mask)).to_pandas())
+        else:
+            empty = table.slice(0, 0).to_pandas()
+    if not frames:
+        return empty
+    return pd.concat(frames, ignore_index=True)
+
+
+def history_roots(history_dir=HISTORY_DIR):
+    """
+    Racines de ticker présentes dans l'historique indexé, triées.
+    """
+    roots = set()
+    for entry in read_manifest(history_dir).values():
+        for group in entry.get("row_groups", []):
+            roots.update(group["roots"])
+    return sorted(roots)
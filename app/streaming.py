@@ -0,0 +1,305 @@
+import os
+import sys
+import tempfile
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from app.assembly import build_roll_rows
+from app.classification import classify_roll_clients
+from app.compact import parse_times
+from app.dedup import drop_duplicate_chunk, merge_sorted
+from app.export import OUTPUT_NUMBER_FORMATS, write_csv_chunks, write_excel_chunks
+from app.ingestion import GRID_SCHEMA, iter_grid_chunks
+from app.matching import EXTENDED_WINDOW, match_roll_pairs, time_to_seconds
+from app.pipeline import OUTPUT_COLUMNS, add_formula_columns, sort_roll_legs
+from app.profiling import RunProfile
+
+# ------------------------
+# Mode streaming : mémoire bornée par la fenêtre de temps des Roll
+# ------------------------
+
+# python -m app.streaming AAAAMMJJ sortie.xlsx|sortie.csv fichier1.xlsx [fichier2.xlsx ...]
+CHUNK_ROWS = 10000
+# Un seau couvre la fenêtre étendue : les legs d'un Roll sont dans le même
+# seau ou dans le seau voisin
+BUCKET_SECONDS = EXTENDED_WINDOW
+# Les lignes d'avant 8h sont traitées en premier (voir prepare_trades)
+MORNING = 8 * 3600
+
+
+class _Spill:
+    """
+    Blocs de lignes écrits sur disque, rangés par (nature, seau) ; le seau None
+    regroupe les lignes sans heure.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.parts = defaultdict(list)
+        self._count = 0
+
+    def put(self, kind, bucket, df, owner=None):
+        path = os.path.join(self.directory, f"{self._count}.pkl")
+        self._count += 1
+        df.to_pickle(path)
+        self.parts[kind, bucket].append((owner, path))
+
+    def discard(self, owner):
+        # Retire les blocs d'un fichier dont la lecture a échoué en cours de route
+        for key, parts in self.parts.items():
+            for part_owner, path in parts:
+                if part_owner == owner:
+                    os.remove(path)
+            self.parts[key] = [(o, path) for o, path in parts if o != owner]
+
+    def buckets(self, kind):
+        return sorted(bucket for k, bucket in self.parts if k == kind and bucket is not None)
+
+    def take(self, kind, bucket):
+        frames = []
+        for _, path in self.parts.pop((kind, bucket), []):
+            frames.append(pd.read_pickle(path))
+            os.remove(path)
+        if not frames:
+            return None
+        return pd.concat(frames, ignore_index=True)
+
+
+def stream_grid_files(files, trade_date, destination, report_error=print,
+                      chunk_rows=CHUNK_ROWS, spill_dir=None, profile=None):
+    """
+    Équivalent de process_grid_files suivi de write_excel pour les journées
+    trop lourdes pour la mémoire : les fichiers sont lus par blocs de
+    `chunk_rows` lignes et rangés sur disque (dans `spill_dir`) par seau de
+    BUCKET_SECONDS ; les Roll sont ensuite appariés seau par seau, avec au plus
+    trois seaux en mémoire. Le pic mémoire dépend donc du volume d'une fenêtre
+    de temps, pas de celui de la journée.
+
+    Le fichier écrit dans `destination` (classeur xlsx, ou CSV sans formules si
+    le nom finit par .csv) contient les mêmes lignes que le traitement en mémoire ; seules les lignes Roll Screen ou Outright de même
+    heure peuvent y apparaître dans un autre ordre.
+    Retourne le nombre de lignes écrites, ou None si aucun fichier n'est exploitable.
+    """
+    profile = profile or RunProfile()
+    date_code = trade_date.strftime('%Y%m%d')
+    with tempfile.TemporaryDirectory(dir=spill_dir) as directory:
+        spill = _Spill(directory)
+        with profile.stage("lecture", rows_in=len(files)) as stage:
+            loaded, has_time, rows = _spill_trades(files, spill, chunk_rows, report_error)
+            stage.rows_out = rows
+        if not loaded:
+            report_error("Aucun fichier valide n'a été chargé.")
+            return None
+        if not has_time:
+            report_error("La colonne 'Time' est introuvable dans les fichiers.")
+            return None
+
+        with profile.stage("appariement", rows_in=rows):
+            _match_rolls(spill)
+
+        with profile.stage("export") as stage:
+            written = []
+            chunks = _output_chunks(spill, trade_date, date_code)
+            if str(destination).lower().endswith(".csv"):
+                write_csv_chunks(_counted(chunks, written), OUTPUT_COLUMNS, destination)
+            else:
+                write_excel_chunks(_counted(chunks, written), OUTPUT_COLUMNS, destination,
+                                   number_formats=OUTPUT_NUMBER_FORMATS)
+            stage.rows_out = sum(written)
+    return sum(written)
+
+
+def _bucket(seconds):
+    # Seaux alignés sur 8h : négatifs avant 8h, NaN sans heure
+    return np.floor((seconds - MORNING) / BUCKET_SECONDS)
+
+
+def _spill_trades(files, spill, chunk_rows, report_error):
+    """
+    Lit les fichiers par blocs, sans les trades déjà présents dans un fichier
+    précédent (voir app.dedup.drop_duplicate_chunk) : les lignes sans prix
+    ('screen') et avec prix ('priced') sont rangées sur disque par seau. `seq` conserve la position
+    de la ligne dans la concaténation des fichiers.
+    Retourne (fichiers lus, présence de la colonne Time, lignes lues).
+    """
+    loaded = 0
+    has_time = False
+    rows = 0
+    # Clés des trades retenus des fichiers lus (voir app.dedup), triées
+    known = np.array([], dtype=np.uint64)
+    for file_index, (name, source) in enumerate(files):
+        offset = 0
+        file_has_time = False
+        file_keys, file_hashes, dropped = [], np.array([], dtype=np.uint64), 0
+        try:
+            for chunk in iter_grid_chunks(source, chunk_rows):
+                file_has_time = file_has_time or 'Time' in chunk.columns
+                # Trades déjà présents dans un fichier précédent, comme process_grid_files
+                chunk, chunk_dropped, chunk_keys, file_hashes = drop_duplicate_chunk(chunk, known, file_hashes)
+                dropped += chunk_dropped
+                file_keys.append(chunk_keys)
+                chunk = chunk.reindex(columns=list(GRID_SCHEMA))
+                chunk['seq'] = file_index * 2 ** 32 + offset + np.arange(len(chunk))
+                offset += len(chunk)
+                chunk['Time'] = parse_times(chunk['Time']).dt.time
+                chunk['Price'] = pd.to_numeric(chunk['Price'], errors='coerce')
+                chunk['Size'] = pd.to_numeric(chunk['Size'], errors='coerce')
+                chunk['seconds'] = time_to_seconds(chunk['Time'])
+
+                buckets = _bucket(chunk['seconds'].to_numpy())
+                priced = chunk['Price'].notna().to_numpy()
+                for kind, mask in (('priced', priced), ('screen', ~priced)):
+                    part, part_buckets = chunk[mask], buckets[mask]
+                    undated = np.isnan(part_buckets)
+                    if undated.any():
+                        spill.put(kind, None, part[undated], file_index)
+                    for bucket in np.unique(part_buckets[~undated]):
+                        spill.put(kind, int(bucket), part[part_buckets == bucket], file_index)
+        except Exception as e:
+            spill.discard(file_index)
+            report_error(f"Erreur lors du chargement de {name}: {e}")
+            continue
+        # Les clés d'un fichier illisible ne comptent pas : seulement une fois le fichier lu en entier
+        known = merge_sorted(known, np.concatenate([known[:0]] + file_keys))
+        if dropped:
+            report_error(f"{name} : {dropped} trade(s) déjà présent(s) dans un autre fichier ignoré(s).")
+        loaded += 1
+        has_time = has_time or file_has_time
+        rows += offset
+    return loaded, has_time, rows
+
+
+def _processing_order(df):
+    # Ordre du traitement en mémoire : heure décroissante, puis position décroissante
+    df = df.sort_values(['seconds', 'seq'], ascending=False, kind='stable').reset_index(drop=True)
+    df['roll'] = 0
+    df['leg'] = -1
+    return df
+
+
+def _match_rolls(spill):
+    """
+    Apparie les lignes avec prix dans l'ordre du traitement en mémoire : lignes
+    sans heure, puis seaux d'avant 8h, puis seaux à partir de 8h, heures
+    décroissantes. Les lignes d'un seau ne peuvent être appariées qu'à des
+    lignes du seau suivant ou, avant 8h, du premier seau de 8h : ces seaux
+    sont les seuls chargés en plus du seau courant.
+    Les Roll complets sont rangés dans l'ordre de leur numéro ('roll'), les
+    lignes restantes par seau ('outright').
+    """
+    counter = 0
+    undated = spill.take('priced', None)
+    if undated is not None:
+        # Sans heure, seuls les rolls groupés (L0) sont possibles
+        undated = _processing_order(undated)
+        counter = _match_block(undated, [], counter)
+        _emit(spill, -1, None, undated, [])
+
+    buckets = spill.buckets('priced')
+    available = set(buckets)
+    order = sorted((b for b in buckets if b < 0), reverse=True) + sorted((b for b in buckets if b >= 0), reverse=True)
+    loaded = {}
+
+    def load(bucket):
+        if bucket not in loaded:
+            loaded[bucket] = _processing_order(spill.take('priced', bucket))
+        return loaded[bucket]
+
+    for step, bucket in enumerate(order):
+        partner_buckets = [bucket - 1] if bucket - 1 >= 0 or bucket < 0 else []
+        if bucket < 0:
+            partner_buckets.append(0)
+        partners = [load(b) for b in partner_buckets if b in available]
+        current = load(bucket)
+        counter = _match_block(current, partners, counter)
+        _emit(spill, step, bucket, current, partners)
+        del loaded[bucket]
+
+
+def _match_block(current, partners, counter):
+    """
+    Cherche un partenaire pour chaque ligne de `current` parmi les lignes
+    suivantes de `current` et de `partners` ; met à jour les colonnes roll/leg.
+    Retourne le dernier numéro de roll attribué.
+    """
+    frames = [current] + partners
+    roll_numbers, legs = match_roll_pairs(
+        np.concatenate([f['Ticker'].to_numpy(dtype=object) for f in frames]),
+        np.concatenate([f['Size'].to_numpy(dtype=float) for f in frames]),
+        np.concatenate([f['Price'].to_numpy(dtype=float) for f in frames]),
+        np.concatenate([f['seconds'].to_numpy(dtype=float) for f in frames]),
+        assigned=np.concatenate([f['leg'].to_numpy() >= 0 for f in frames]),
+        initiators=len(current),
+        first_roll=counter + 1,
+    )
+    start = 0
+    for f in frames:
+        stop = start + len(f)
+        matched = legs[start:stop] >= 0
+        f['roll'] = np.where(matched, roll_numbers[start:stop], f['roll'].to_numpy())
+        f['leg'] = np.where(matched, legs[start:stop], f['leg'].to_numpy())
+        start = stop
+    return max(counter, int(roll_numbers.max(initial=0)))
+
+
+def _emit(spill, step, bucket, current, partners):
+    # Rolls ouverts par le seau courant (avec leur seconde leg, où qu'elle soit)
+    opened = current[current['leg'].isin([0, 1])]
+    second_legs = [f[(f['leg'] >= 2) & f['roll'].isin(opened['roll'])] for f in [current] + partners]
+    rolls = pd.concat([opened] + second_legs, ignore_index=True)
+    if len(rolls):
+        spill.put('roll', step, rolls)
+    outrights = current[current['leg'] < 0]
+    if len(outrights):
+        spill.put('outright', bucket, outrights)
+
+
+def _output_chunks(spill, trade_date, date_code):
+    """
+    Blocs du classeur final, dans l'ordre du traitement en mémoire : Roll par
+    numéro, puis Roll Screen et Outright par heure (lignes sans heure en fin).
+    """
+    first_row = 2
+    for step in spill.buckets('roll'):
+        legs = spill.take('roll', step).sort_values(['roll', 'leg'], kind='stable')
+        legs['Date'] = trade_date
+        legs['Structure_ID'] = [f"{date_code}-R-{r}-L{leg}" for r, leg in zip(legs['roll'], legs['leg'])]
+        legs['Structure'] = 'Leg'
+        legs = sort_roll_legs(legs.drop(columns=['seq', 'seconds', 'roll', 'leg']))
+        chunk = build_roll_rows(legs, date_code).reset_index(drop=True)
+        chunk = classify_roll_clients(add_formula_columns(chunk, first_row))
+        first_row += len(chunk)
+        yield chunk.reindex(columns=OUTPUT_COLUMNS)
+
+    for kind, suffix, structure in (('screen', 'S', 'Roll Screen'), ('outright', 'O', 'Outright')):
+        for bucket in spill.buckets(kind) + [None]:
+            rows = spill.take(kind, bucket)
+            if rows is None:
+                continue
+            rows = rows.sort_values(['seconds', 'seq'], kind='stable').reset_index(drop=True)
+            rows['Date'] = trade_date
+            rows['Structure_ID'] = f"{date_code}-{suffix}"
+            rows['Structure'] = structure
+            chunk = add_formula_columns(rows, first_row)
+            first_row += len(chunk)
+            yield chunk.reindex(columns=OUTPUT_COLUMNS)
+
+
+def _counted(chunks, written):
+    for chunk in chunks:
+        written.append(len(chunk))
+        yield chunk
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print("Usage : python -m app.streaming AAAAMMJJ sortie.xlsx|sortie.csv fichier1.xlsx [fichier2.xlsx ...]")
+        sys.exit(1)
+    paths = sys.argv[3:]
+    written = stream_grid_files([(os.path.basename(path), path) for path in paths],
+                                pd.to_datetime(sys.argv[1], format="%Y%m%d"), sys.argv[2])
+    if written is None:
+        sys.exit(1)
+    print(f"{written} lignes écrites dans {sys.argv[2]}")
@@ -0,0 +1,71 @@
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+# ------------------------
+# Lecture des tickers de futures (racine, mois, année)
+# ------------------------
+
+# Codes mois des futures, de janvier (F) à décembre (Z)
+MONTH_CODES = "FGHJKMNQUVXZ"
+# Mois d'un ticker sans code mois reconnu : placé après les autres échéances
+UNKNOWN_MONTH = 99
+ROOT_LEN = 3
+
+
+class FuturesTicker(NamedTuple):
+    text: str       # ticker tel qu'écrit ("nan" si absent)
+    root: str       # 3 premiers caractères (préfixe commun aux legs d'un Roll)
+    month: int      # 1 à 12, UNKNOWN_MONTH sinon
+    year: int       # dernier chiffre de l'année, 0 s'il n'est pas numérique
+    contract: str   # code échéance (2 derniers caractères, ex. "H5"), NaN hors texte
+
+
+@lru_cache(maxsize=65536)
+def parse_ticker(ticker):
+    """
+    Décompose un ticker ("ZVLH5" : racine ZVL, mars, année 5). Le résultat
+    est mémorisé : le coût dépend du nombre de tickers distincts.
+    """
+    text = str(ticker)
+    is_text = isinstance(ticker, str)
+    month_code = text[-2] if is_text and len(text) >= 2 else ""
+    month = MONTH_CODES.index(month_code) + 1 if month_code and month_code in MONTH_CODES else UNKNOWN_MONTH
+    year = int(text[-1]) if text[-1:].isdigit() and text[-1:].isascii() else 0
+    return FuturesTicker(text, text[:ROOT_LEN], month, year, text[-2:] if is_text else np.nan)
+
+
+def parse_tickers(tickers):
+    """
+    Analyse une colonne de tickers une fois par valeur distincte (catégories
+    d'une colonne catégorielle). Retourne (codes, tickers analysés) :
+    parsed[codes[k]] décrit la ligne k, le code -1 (ticker absent) désigne le
+    dernier élément.
+    """
+    if isinstance(getattr(tickers, 'dtype', None), pd.CategoricalDtype):
+        codes, distinct = np.asarray(tickers.cat.codes), list(tickers.cat.categories)
+    else:
+        codes, distinct = pd.factorize(np.asarray(tickers, dtype=object))
+        distinct = list(distinct)
+    return codes, [parse_ticker(t) for t in distinct] + [parse_ticker(np.nan)]
+
+
+def ticker_field(tickers, field):
+    """
+    Valeur de `field` (voir FuturesTicker) pour chaque ligne de `tickers`.
+    """
+    codes, parsed = parse_tickers(tickers)
+    values = np.array([getattr(p, field) for p in parsed], dtype=object)
+    return values[codes]
+
+
+def contract_order(tickers):
+    """
+    Clé de tri des échéances : (année, mois) en entiers pour chaque ligne.
+    """
+    codes, parsed = parse_tickers(tickers)
+    years = np.array([p.year for p in parsed], dtype=np.int64)
+    months = np.array([p.month for p in parsed], dtype=np.int64)
+    return years[codes], months[codes]
@@ -0,0 +1,119 @@
+import datetime
+import io
+import os
+import re
+import zipfile
+from itertools import islice
+
+import pandas as pd
+
+# ------------------------
+# Date de trade des fichiers chargés (plusieurs dates en un envoi)
+# ------------------------
+
+# AAAAMMJJ dans le nom du fichier ou d'un dossier (data/raw/AAAAMMJJ/...)
+DATE_IN_NAME = re.compile(r"(?<!\d)(\d{8})(?!\d)")
+# Date d'une cellule Time texte "AAAA-MM-JJ HH:MM:SS" ou "MM/JJ/AAAA HH:MM:SS"
+DATE_IN_TIME = r"(\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}/\d{4})"
+# Lignes lues pour trouver la date dans la colonne Time
+PEEK_ROWS = 50
+# Origine de la date retenue pour un fichier
+FROM_NAME, FROM_TRADES, FROM_DEFAULT = "nom", "trades", "date choisie"
+
+
+def expand_uploads(files):
+    """
+    Remplace chaque archive zip de `files` (couples (nom, bytes)) par les
+    fichiers xlsx qu'elle contient, nommés par leur chemin dans l'archive
+    (par exemple 20241216/grid1_x.xlsx).
+    """
+    expanded = []
+    for name, data in files:
+        if not name.lower().endswith(".zip"):
+            expanded.append((name, data))
+            continue
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            for member in archive.infolist():
+                base = os.path.basename(member.filename)
+                if (member.is_dir() or not base.lower().endswith(".xlsx") or base.startswith("~$")
+                        or member.filename.startswith("__MACOSX/")):
+                    continue
+                expanded.append((f"{name}/{member.filename}", archive.read(member)))
+    return expanded
+
+
+def date_from_name(name):
+    """
+    Date AAAAMMJJ présente dans le chemin `name` (la plus proche du fichier),
+    ou None.
+    """
+    for part in reversed(re.split(r"[\\/]", name)):
+        for candidate in DATE_IN_NAME.findall(part):
+            try:
+                datetime.datetime.strptime(candidate, "%Y%m%d")
+            except ValueError:
+                continue
+            return candidate
+    return None
+
+
+def date_from_trades(df):
+    """
+    Date des trades quand la colonne Time porte aussi la date (cellules
+    date-heure ou texte "AAAA-MM-JJ HH:MM:SS", "MM/JJ/AAAA HH:MM:SS") et
+    qu'elle est unique ; sinon None.
+    """
+    if 'Time' not in df.columns:
+        return None
+    values = df['Time'].dropna()
+    dates = {v.strftime("%Y%m%d") for v in values if isinstance(v, datetime.datetime)}
+    # Partie date des textes ; peu de valeurs distinctes à convertir
+    texts = values[values.map(lambda v: isinstance(v, str))].str.extract(DATE_IN_TIME, expand=False).dropna()
+    for text in texts.unique():
+        parsed = pd.to_datetime(text, errors="coerce")
+        if not pd.isna(parsed):
+            dates.add(parsed.strftime("%Y%m%d"))
+    return dates.pop() if len(dates) == 1 else None
+
+
+def peek_times(data, rows=PEEK_ROWS):
+    """
+    Premières valeurs de la colonne Time d'un fichier grid (bytes), sans lire
+    le reste du fichier.
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        lines = wb.worksheets[0].iter_rows(values_only=True)
+        header = list(next(lines, ()))
+        if 'Time' not in header:
+            return pd.DataFrame()
+        position = header.index('Time')
+        values = [line[position] for line in islice(lines, rows) if position < len(line)]
+    finally:
+        wb.close()
+    return pd.DataFrame({'Time': pd.Series(values, dtype=object)})
+
+
+def group_by_date(files, default_date):
+    """
+    Répartit les fichiers (couples (nom, bytes), archives zip développées) par
+    date de trade : date du nom du fichier ou de son dossier, sinon date des
+    trades, sinon `default_date`.
+    Retourne ({AAAAMMJJ: [(nom, bytes)]}, {nom: origine de la date}).
+    """
+    default_key = pd.Timestamp(default_date).strftime("%Y%m%d")
+    groups, origins = {}, {}
+    for name, data in expand_uploads(files):
+        key, origins[name] = date_from_name(name), FROM_NAME
+        if key is None:
+            try:
+                key, origins[name] = date_from_trades(peek_times(data)), FROM_TRADES
+            except Exception:
+                # Fichier illisible : l'erreur sera signalée par le traitement
+                key = None
+        if key is None:
+            key, origins[name] = default_key, FROM_DEFAULT
+        groups.setdefault(key, []).append((name, data))
+    return dict(sorted(groups.items())), origins
@@ -0,0 +1,158 @@
+import argparse
+import os
+import sys
+import time
+import zipfile
+
+from app.batch import (OUTPUT_DIR, RAW_DIR, find_date_folders, inputs_fingerprint, output_paths, process_date,
+                       read_batch_manifest, record_date)
+from app.export import EXPORT_FORMATS
+from app.history import HISTORY_DIR
+from app.ingestion import MAX_WORKERS
+from app.profiling import RUN_LOG, RunProfile, append_run
+
+# ------------------------
+# Surveillance de data/raw : traitement des dates dès l'arrivée des fichiers
+# ------------------------
+
+# python -m app.watch [--raw-dir data/raw] [--out-dir data/processed] [--interval 1] [--settle 3]
+#                     [--format xlsx parquet arrow csv]
+# Intervalle entre deux parcours de `raw_dir`, en secondes
+WATCH_INTERVAL = 1.0
+# Délai sans modification des fichiers d'une date avant son traitement : une
+# copie en cours change encore de taille ou de date de modification
+SETTLE_SECONDS = 3.0
+
+
+def scan_raw_dir(raw_dir=RAW_DIR):
+    """
+    Signature de chaque date de `raw_dir` : {AAAAMMJJ: ((fichier, taille, mtime), ...)},
+    obtenue sans lire les fichiers.
+    """
+    signatures = {}
+    for key, paths in find_date_folders(raw_dir).items():
+        try:
+            signatures[key] = tuple((path, st.st_size, st.st_mtime_ns) for path, st in
+                                    ((path, os.stat(path)) for path in paths))
+        except FileNotFoundError:
+            # Fichier renommé ou supprimé pendant le parcours : repris au suivant
+            continue
+    return signatures
+
+
+def is_complete(path):
+    """
+    Un fichier xlsx est une archive zip dont le répertoire central est écrit en
+    dernier : un fichier en cours de copie n'en est pas une.
+    """
+    try:
+        return zipfile.is_zipfile(path)
+    except OSError:
+        return False
+
+
+class FolderWatcher:
+    """
+    Traite chaque date de `raw_dir` dont les fichiers ont changé, une fois
+    qu'ils sont restés SETTLE_SECONDS sans modification et sont complets.
+    Les dates déjà à jour dans le manifeste du traitement par lot (voir
+    app.batch) sont ignorées au démarrage ; les fichiers déjà lus sont repris
+    du cache (voir app.parse_cache).
+    """
+
+    def __init__(self, raw_dir=RAW_DIR, output_dir=OUTPUT_DIR, history_dir=HISTORY_DIR, formats=("xlsx",),
+                 settle=SETTLE_SECONDS, log=print, run_log=RUN_LOG):
+        self.raw_dir = raw_dir
+        self.output_dir = output_dir
+        self.history_dir = history_dir
+        self.formats = formats
+        self.settle = settle
+        self.log = log
+        self.run_log = run_log
+        self.seen = {}
+        self.changed_at = {}
+        self.done = {}
+        os.makedirs(raw_dir, exist_ok=True)
+        os.makedirs(output_dir, exist_ok=True)
+        manifest = read_batch_manifest(output_dir)
+        for key, signature in scan_raw_dir(raw_dir).items():
+            paths = [path for path, _, _ in signature]
+            outputs = output_paths(key, output_dir, formats).values()
+            if (manifest.get(key, {}).get("fingerprint") == inputs_fingerprint(paths)
+                    and all(os.path.exists(path) for path in outputs)):
+                self.seen[key] = self.done[key] = signature
+
+    def poll(self, now=None):
+        """
+        Un parcours de `raw_dir` ; traite les dates prêtes.
+        Retourne {AAAAMMJJ: "ok" | "échec"} pour les dates traitées.
+        """
+        now = time.monotonic() if now is None else now
+        status = {}
+        for key, signature in scan_raw_dir(self.raw_dir).items():
+            if signature != self.seen.get(key):
+                self.seen[key] = signature
+                self.changed_at[key] = now
+            if signature == self.done.get(key) or now - self.changed_at[key] < self.settle:
+                continue
+            paths = [path for path, _, _ in signature]
+            if not all(is_complete(path) for path in paths):
+                continue
+            status[key] = self.process(key, paths)
+            # En cas d'échec, la date n'est retentée qu'après une modification de ses fichiers
+            self.done[key] = signature
+        return status
+
+    def process(self, key, paths):
+        fingerprint = inputs_fingerprint(paths)
+        profile = RunProfile(source="watch", trade_date=key, files=len(paths))
+        try:
+            rows, messages = process_date(key, paths, self.output_dir, self.history_dir, profile, self.formats,
+                                          max_workers=MAX_WORKERS)
+        except Exception as e:
+            rows, messages = None, [f"Erreur lors du traitement : {e}"]
+        run = profile.to_dict()
+        append_run(run, self.run_log)
+        for message in messages:
+            self.log(f"{key} : {message}")
+        if rows is None:
+            return "échec"
+        record_date(key, paths, fingerprint, rows, self.output_dir)
+        self.log(f"{key} : {rows} lignes ({run['total_seconds']:.1f} s)")
+        return "ok"
+
+    def run(self, interval=WATCH_INTERVAL):
+        """
+        Parcourt `raw_dir` toutes les `interval` secondes, jusqu'à interruption.
+        """
+        while True:
+            self.poll()
+            time.sleep(interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Traitement des dossiers data/raw/AAAAMMJJ dès l'arrivée des fichiers")
+    parser.add_argument("--raw-dir", default=RAW_DIR)
+    parser.add_argument("--out-dir", default=OUTPUT_DIR)
+    parser.add_argument("--history-dir", default=None,
+                        help="historique Parquet (par défaut <out-dir>/history)")
+    parser.add_argument("--interval", type=float, default=WATCH_INTERVAL, help="secondes entre deux parcours")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                        help="secondes sans modification avant de traiter une date")
+    parser.add_argument("--format", nargs="+", choices=list(EXPORT_FORMATS), default=["xlsx"], dest="formats",
+                        help="formats du fichier traité (hors xlsx, formules Bloomberg laissées vides)")
+    args = parser.parse_args(argv)
+
+    history_dir = args.history_dir or os.path.join(args.out_dir, "history")
+    run_log = os.path.join(args.out_dir, os.path.basename(RUN_LOG))
+    watcher = FolderWatcher(args.raw_dir, args.out_dir, history_dir, args.formats, args.settle, run_log=run_log)
+    print(f"Surveillance de {args.raw_dir} (Ctrl+C pour arrêter)")
+    try:
+        watcher.run(args.interval)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
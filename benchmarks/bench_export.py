@@ -0,0 +1,83 @@
+"""
+Benchmark de l'export xlsx : ancienne méthode (to_excel + relecture openpyxl +
+réécriture cellule par cellule) contre l'écriture en une passe (write_excel).
+
+Usage : python benchmarks/bench_export.py [nombre_de_lignes]
+"""
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.assembly import excel_row_numbers
+from app.export import write_excel
+
+from reference import postprocess_excel as legacy_postprocess_excel
+
+
+def make_output_frame(n_rows, seed=0):
+    """
+    DataFrame ayant la forme de la sortie de process_files (colonnes, formules).
+    """
+    rng = np.random.default_rng(seed)
+    structure = rng.choice(['Roll', 'Leg', 'Roll Screen', 'Outright'], size=n_rows, p=[0.1, 0.2, 0.3, 0.4])
+    excel_rows = excel_row_numbers(pd.DataFrame(index=range(n_rows)))
+    closing = ('=BDH(L' + excel_rows + '&" Index", "PX_CLOSE_1D",R' + excel_rows + ',R' + excel_rows + ')')
+    level = pd.Series(rng.normal(1.2, 0.1, n_rows), dtype=object)
+    level[structure != 'Roll'] = np.nan
+    level[structure == 'Outright'] = ('=(F' + excel_rows + '/G' + excel_rows + ')')[structure == 'Outright']
+    return pd.DataFrame({
+        'Time': [f"{h:02d}:{m:02d}:00" for h, m in zip(rng.integers(6, 19, n_rows), rng.integers(0, 60, n_rows))],
+        'Level': level,
+        'Ticker': rng.choice(['ZVLH5', 'ZVLM5', 'CJEH5', 'FMIZ4H5'], size=n_rows),
+        'Notional': rng.integers(1_000_000, 500_000_000, n_rows).astype(float),
+        'Size': rng.integers(1, 5000, n_rows),
+        'Price': rng.uniform(100, 9000, n_rows).round(2),
+        'Closing1d': closing.where(pd.Series(np.isin(structure, ['Roll', 'Outright'])), ""),
+        'Structure_ID': [f"20241216-R-{k}" for k in range(n_rows)],
+        'Structure': structure,
+        'Volume': rng.integers(0, 30000, n_rows),
+        '1DChg': rng.normal(0, 10, n_rows),
+        'UndTkr': 'M1IN',
+        '1PtVal': 100,
+        'Exch': 'GR',
+        'FutName': 'MSCI India        Jun25',
+        'UndCmpName': 'MSCI India Net Total Return US',
+        'UndPrc': rng.uniform(100, 9000, n_rows),
+        'Date': pd.Timestamp('2024-12-16'),
+    })
+
+
+def one_pass_excel(final_sorted):
+    download_buffer = io.BytesIO()
+    write_excel(final_sorted, download_buffer, number_formats={"Level": "0.000"})
+    return download_buffer
+
+
+def measure(func, df):
+    start = time.perf_counter()
+    func(df)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func(df)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    df = make_output_frame(n_rows)
+    print(f"{n_rows} lignes")
+    for label, func in [("to_excel + relecture", legacy_postprocess_excel), ("une passe", one_pass_excel)]:
+        elapsed, peak = measure(func, df)
+        print(f"{label:<22} {elapsed:8.2f} s   pic mémoire {peak / 1024 ** 2:8.1f} Mo")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark des requêtes sur l'historique : une année de journées synthétiques
+traitées puis enregistrées (app.history.save_day), interrogée avec
+app.query.query_history et, pour comparaison, en chargeant toutes les
+partitions de la période (load_history) puis en filtrant avec pandas.
+Les deux méthodes doivent retourner les mêmes lignes.
+
+Usage : python benchmarks/bench_query.py [--days 250] [--rows 5000] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.history import load_history, read_manifest, save_day
+from app.pipeline import process_frames
+from app.query import plan_query, query_history
+from app.tickers import ticker_field
+
+from synthetic import generate_grid
+
+FIRST_DAY = '2024-01-01'
+
+# (libellé, paramètres de query_history) ; les dates sont relatives à la première journée
+QUERIES = [
+    ("ZVL, Roll, Size >= 500, un mois", dict(roots=["ZVL"], structures=["Roll"], min_size=500, months=(5, 5))),
+    ("HLC et FMI, un trimestre", dict(roots=["HLC", "FMI"], months=(0, 2))),
+    ("Outright, Notional >= 2e8, l'année", dict(structures=["Outright"], min_notional=2e8)),
+    ("Roll Screen, une journée", dict(structures=["Roll Screen"], months=(3, 3), days=1)),
+]
+
+
+def build_history(history_dir, days, rows):
+    for number, trade_date in enumerate(pd.bdate_range(FIRST_DAY, periods=days)):
+        output = process_frames([generate_grid(rows, seed=number)], trade_date, report_error=lambda message: None)
+        save_day(output, history_dir)
+
+
+def query_bounds(spec):
+    months = spec.pop("months", None)
+    days = spec.pop("days", None)
+    if months is None:
+        return None, None
+    start = pd.Timestamp(FIRST_DAY) + pd.DateOffset(months=months[0])
+    if days:
+        return start, start + pd.DateOffset(days=days - 1)
+    end = start + pd.DateOffset(months=months[1] - months[0] + 1) - pd.DateOffset(days=1)
+    return start, end
+
+
+def full_scan(start, end, roots=(), structures=(), min_size=None, min_notional=None, history_dir=None):
+    # Méthode de référence : tout charger puis filtrer
+    df = load_history(start, end, history_dir)
+    if df.empty:
+        return df
+    mask = np.ones(len(df), dtype=bool)
+    if roots:
+        mask &= np.isin(ticker_field(df['Ticker'], 'root'), roots)
+    if structures:
+        mask &= df['Structure'].isin(structures).to_numpy()
+    if min_size is not None:
+        mask &= (df['Size'] >= min_size).to_numpy()
+    if min_notional is not None:
+        mask &= (df['Notional'] >= min_notional).to_numpy()
+    return df[mask].reset_index(drop=True)
+
+
+def best_of(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=250)
+    parser.add_argument("--rows", type=int, default=5000, help="lignes grid par journée")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as history_dir:
+        start_time = time.perf_counter()
+        build_history(history_dir, args.days, args.rows)
+        manifest = read_manifest(history_dir)
+        total_groups = sum(len(entry["row_groups"]) for entry in manifest.values())
+        print(f"{args.days} journées, {sum(entry['rows'] for entry in manifest.values())} lignes, "
+              f"{total_groups} groupes de lignes ({time.perf_counter() - start_time:.0f} s de préparation)")
+
+        for label, spec in QUERIES:
+            spec = dict(spec)
+            start, end = query_bounds(spec)
+            plan = plan_query(start, end, history_dir=history_dir, **spec)
+            groups = sum(len(selected) for selected in plan.values())
+            result, indexed = best_of(lambda: query_history(start, end, history_dir=history_dir, **spec),
+                                      args.repeat)
+            expected, scan = best_of(lambda: full_scan(start, end, history_dir=history_dir, **spec), args.repeat)
+            if len(result) or len(expected):
+                pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+            print(f"{label:<36} {len(result):>8} lignes   {len(plan):>4} partitions / {groups:>5} groupes lus   "
+                  f"index {indexed * 1000:8.1f} ms   chargement complet {scan * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+"""
+Benchmark de montée en charge : temps et pic mémoire de chaque étape
+(lecture, traitement, Roll-Client, export xlsx, historique) sur des fichiers
+grid synthétiques de 1 000 à 1 000 000 de lignes.
+
+Jusqu'à --check-max-rows lignes, la sortie de chaque étape est comparée à
+celle du code de référence (benchmarks/reference.py) : DataFrame final,
+cellules du classeur xlsx et contenu de l'historique.
+
+L'appariement seul (assign_structures) est ensuite mesuré de 50 000 à
+400 000 lignes : son temps par ligne doit rester à peu près constant.
+
+Usage : python benchmarks/bench_scaling.py [--sizes 1000 10000 ...] [--roll-share 0.3]
+                                           [--rows-per-file 50000] [--check-max-rows 2000]
+                                           [--match-sizes 50000 100000 ...]
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+import pandas as pd
+from openpyxl import load_workbook
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.classification import classify_roll_clients
+from app.export import OUTPUT_NUMBER_FORMATS, write_excel
+from app.history import load_history, save_day, to_columnar
+from app.ingestion import read_grid_files
+from app.pipeline import assign_structures, prepare_trades, process_frames
+
+import reference
+from synthetic import generate_grid, write_grid_files
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+DEFAULT_MATCH_SIZES = [50_000, 100_000, 200_000, 400_000]
+TRADE_DATE = pd.to_datetime('2024-12-16')
+
+
+class NamedBytesIO(io.BytesIO):
+    # Équivalent des fichiers chargés dans Streamlit (attribut name)
+    def __init__(self, data, name):
+        super().__init__(data)
+        self.name = name
+
+
+def measure(func):
+    """
+    Exécute `func` deux fois : la première pour le temps, la seconde sous
+    tracemalloc pour le pic mémoire (processus principal uniquement).
+    Retourne (résultat, secondes, octets).
+    """
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def run_stages(paths, history_dir):
+    """
+    Mesure chaque étape de la chaîne actuelle ; retourne (sortie finale, mesures).
+    """
+    files = [(os.path.basename(path), path) for path in paths]
+    timings = []
+
+    dataframes, elapsed, peak = measure(lambda: read_grid_files(files, use_cache=False)[0])
+    timings.append(("lecture", elapsed, peak))
+
+    output, elapsed, peak = measure(lambda: process_frames(dataframes, TRADE_DATE))
+    timings.append(("traitement", elapsed, peak))
+
+    # Roll-Client seul, sur les lignes de synthèse remises à 'Roll'
+    unclassified = output.assign(Structure=output['Structure'].replace('Roll Client', 'Roll'))
+    _, elapsed, peak = measure(lambda: classify_roll_clients(unclassified.copy()))
+    timings.append(("roll-client", elapsed, peak))
+
+    workbook, elapsed, peak = measure(lambda: _excel_bytes(output))
+    timings.append(("export", elapsed, peak))
+
+    _, elapsed, peak = measure(lambda: save_day(output, history_dir))
+    timings.append(("historique", elapsed, peak))
+    return output, workbook, timings
+
+
+def _excel_bytes(df):
+    buffer = io.BytesIO()
+    write_excel(df, buffer, number_formats=OUTPUT_NUMBER_FORMATS)
+    return buffer.getvalue()
+
+
+def _cells(workbook):
+    ws = load_workbook(io.BytesIO(workbook)).active
+    return [[(cell.value, cell.number_format) for cell in row] for row in ws.iter_rows()]
+
+
+def _nulls_as_none(df):
+    # Parquet restitue les textes manquants en None
+    df = df.copy()
+    for name in df.columns:
+        if df[name].dtype == object:
+            df[name] = df[name].where(df[name].notna(), None)
+    return df
+
+
+def check_against_reference(paths, output, workbook, history_dir, work_dir):
+    """
+    Compare les sorties de la chaîne actuelle à celles du code de référence.
+    Retourne (liste des différences, temps de référence par étape).
+    """
+    differences = []
+    uploads = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            uploads.append(NamedBytesIO(f.read(), os.path.basename(path)))
+
+    start = time.perf_counter()
+    with warnings.catch_warnings():
+        # Le code de référence déclenche des FutureWarning de pandas
+        warnings.simplefilter("ignore", FutureWarning)
+        expected = reference.process_files(uploads, TRADE_DATE)
+    ref_timings = [("process_files", time.perf_counter() - start)]
+    # OpenInt n'est plus lu (colonne inutilisée)
+    expected = expected.drop(columns=['OpenInt'], errors='ignore')
+    try:
+        pd.testing.assert_frame_equal(expected, output)
+    except AssertionError as e:
+        differences.append(f"traitement : {e}")
+
+    start = time.perf_counter()
+    expected_workbook = reference.postprocess_excel(expected).getvalue()
+    ref_timings.append(("postprocess_excel", time.perf_counter() - start))
+    if _cells(expected_workbook) != _cells(workbook):
+        differences.append("export : cellules ou formats différents")
+
+    start = time.perf_counter()
+    reference.save_processed_data(expected, os.path.join(work_dir, "processed_data.csv"))
+    ref_timings.append(("save_processed_data", time.perf_counter() - start))
+    try:
+        pd.testing.assert_frame_equal(_nulls_as_none(to_columnar(expected)),
+                                      _nulls_as_none(load_history(history_dir=history_dir)))
+    except AssertionError as e:
+        differences.append(f"historique : {e}")
+    return differences, ref_timings
+
+
+def match_scaling(sizes, roll_share, seed):
+    """
+    Temps de l'appariement seul (assign_structures) pour chaque taille, sur
+    les lignes déjà préparées.
+    """
+    print("\nappariement seul (assign_structures)")
+    for n_rows in sizes:
+        trades = prepare_trades([generate_grid(n_rows, roll_share=roll_share, seed=seed)], TRADE_DATE)
+        start = time.perf_counter()
+        assign_structures(trades, TRADE_DATE)
+        elapsed = time.perf_counter() - start
+        print(f"  {n_rows:>9} lignes {elapsed:9.2f} s   {elapsed / n_rows * 1e6:7.1f} µs par ligne")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de montée en charge de la chaîne de traitement")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--roll-share", type=float, default=0.3)
+    parser.add_argument("--rows-per-file", type=int, default=50_000)
+    parser.add_argument("--check-max-rows", type=int, default=2_000,
+                        help="taille maximale comparée au code de référence (quadratique)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--match-sizes", type=int, nargs="*", default=DEFAULT_MATCH_SIZES,
+                        help="tailles de la mesure de l'appariement seul (aucune pour l'omettre)")
+    args = parser.parse_args()
+
+    failed = False
+    for n_rows in args.sizes:
+        grid = generate_grid(n_rows, roll_share=args.roll_share, seed=args.seed)
+        with tempfile.TemporaryDirectory() as work_dir:
+            paths = write_grid_files(grid, os.path.join(work_dir, "raw"), args.rows_per_file)
+            history_dir = os.path.join(work_dir, "history")
+            output, workbook, timings = run_stages(paths, history_dir)
+
+            print(f"\n{n_rows} lignes ({len(paths)} fichier(s), {len(output)} lignes en sortie)")
+            for stage, elapsed, peak in timings:
+                print(f"  {stage:<12} {elapsed:9.2f} s   pic mémoire {peak / 1024 ** 2:9.1f} Mo")
+
+            if n_rows <= args.check_max_rows:
+                differences, ref_timings = check_against_reference(paths, output, workbook, history_dir, work_dir)
+                print("  référence : " + ", ".join(f"{name} {elapsed:.2f} s" for name, elapsed in ref_timings))
+                for difference in differences:
+                    print(f"  DIFFÉRENCE {difference[:2000]}")
+                print("  sortie identique à la référence" if not differences else "  sortie DIFFÉRENTE de la référence")
+                failed = failed or bool(differences)
+    match_scaling(args.match_sizes, args.roll_share, args.seed)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
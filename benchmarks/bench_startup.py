@@ -0,0 +1,83 @@
+"""
+Benchmark du démarrage à froid de l'application, chaque mesure dans un
+nouveau processus Python :
+- import de streamlit_app (ce que paie la première page après un redémarrage) ;
+- premier traitement soumis (app.jobs.submit_job) juste après le démarrage,
+  sans puis avec préchauffage des processus de traitement (app.jobs.warm_pool).
+
+Les traitements s'exécutent dans un dossier temporaire (data/processed y est
+créé) sur un fichier grid synthétique.
+
+Usage : python benchmarks/bench_startup.py [--repeat 5] [--rows 2000]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SCRIPT = """
+import time
+start = time.perf_counter()
+import streamlit_app
+print(time.perf_counter() - start)
+"""
+
+# Processus de l'application : préchauffage éventuel puis premier traitement
+FIRST_JOB_SCRIPT = """
+import sys, threading, time
+import pandas as pd
+from app.jobs import DONE, FAILED, job_status, submit_job, warm_pool
+data = open(sys.argv[1], "rb").read()
+ready = threading.Event()
+if sys.argv[2] == "warm":
+    warm_pool(on_ready=ready.set)
+    ready.wait()
+start = time.perf_counter()
+job_id = submit_job([("grid1_bench.xlsx", data)], pd.Timestamp("2024-12-16"))
+while job_status(job_id)["state"] not in (DONE, FAILED):
+    time.sleep(0.01)
+print(time.perf_counter() - start)
+"""
+
+
+def run_child(script, *args, cwd=None):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.environ.get("PYTHONPATH", "")]))
+    result = subprocess.run([sys.executable, "-c", script, *args], cwd=cwd or ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def summary(timings):
+    timings = sorted(timings)
+    return f"min {timings[0]:.3f} s   médiane {timings[len(timings) // 2]:.3f} s"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--rows", type=int, default=2000, help="lignes du fichier grid traité")
+    args = parser.parse_args()
+
+    from synthetic import generate_grid, write_grid_files
+
+    print(f"import de streamlit_app          {summary([run_child(IMPORT_SCRIPT) for _ in range(args.repeat)])}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        grid, = write_grid_files(generate_grid(args.rows), os.path.join(work_dir, "raw"))
+        results = {}
+        for mode in ("cold", "warm"):
+            timings = []
+            for number in range(args.repeat):
+                # Dossier de travail neuf : ni historique ni cache de lecture
+                run_dir = os.path.join(work_dir, f"{mode}-{number}")
+                os.makedirs(run_dir)
+                timings.append(run_child(FIRST_JOB_SCRIPT, grid, mode, cwd=run_dir))
+            results[mode] = timings
+        print(f"premier traitement, à froid      {summary(results['cold'])}")
+        print(f"premier traitement, préchauffé   {summary(results['warm'])}")
+
+
+if __name__ == "__main__":
+    main()
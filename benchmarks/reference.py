@@ -0,0 +1,313 @@
+"""
+Version de référence (figée) de la chaîne de traitement, telle qu'avant les
+optimisations : process_files, detect_roll_clients_by_notional,
+postprocess_excel et save_processed_data.
+
+Sert uniquement aux comparaisons des benchmarks : toute étape optimisée doit
+produire la même sortie. Seuls changements : st.error est remplacé par
+`report_error` et le dossier de save_processed_data suit `filename`.
+Ne pas modifier.
+"""
+import io
+import os
+
+import pandas as pd
+from openpyxl import load_workbook
+
+
+def process_files(uploaded_files, trade_date, report_error=print):
+    dataframes = []
+    for uploaded_file in uploaded_files:
+        try:
+            df = pd.read_excel(uploaded_file, engine="openpyxl")
+            dataframes.append(df)
+        except Exception as e:
+            report_error(f"Erreur lors du chargement de {uploaded_file.name}: {e}")
+    if not dataframes:
+        report_error("Aucun fichier valide n'a été chargé.")
+        return None
+
+    # Concaténation de tous les fichiers
+    final_df = pd.concat(dataframes, ignore_index=True)
+
+    # Tri initial par heure si la colonne 'Time' existe
+    if 'Time' in final_df.columns:
+        final_df['Time'] = pd.to_datetime(final_df['Time'], format='%H:%M:%S', errors='coerce').dt.time
+        final_df['sort_order'] = final_df['Time'].apply(lambda x: 0 if x >= pd.Timestamp("08:00:00").time() else 1)
+        final_df = final_df.sort_values(by=['sort_order', 'Time']).drop(columns=['sort_order']).reset_index(drop=True)
+        # Inversion de l'ordre des lignes
+        final_df = final_df.iloc[::-1].reset_index(drop=True)
+    else:
+        report_error("La colonne 'Time' est introuvable dans les fichiers.")
+        return None
+
+    # Saisie de la date et initialisation des colonnes
+    final_df['Date'] = trade_date
+    final_df['Structure_ID'] = ""
+    final_df['Price'] = pd.to_numeric(final_df['Price'], errors='coerce')
+    final_df['Size'] = pd.to_numeric(final_df['Size'], errors='coerce')
+
+    # Séparation des lignes selon la présence de Price
+    df_price_na = final_df[final_df['Price'].isna()].copy()
+    df_price_ok = final_df[final_df['Price'].notna()].copy()
+    df_price_ok['DateTime'] = df_price_ok.apply(lambda row: pd.Timestamp.combine(trade_date, row['Time']), axis=1)
+
+    # Détection combinée des paires de Roll (priorité à 120 sec, sinon seuil étendu)
+    roll_counter = 0
+    for i in range(len(df_price_ok)):
+        if df_price_ok.iloc[i]['Structure_ID'] != "":
+            continue
+        row_i = df_price_ok.iloc[i]
+
+        # Vérification : si le ticker a exactement 7 caractères, c'est déjà un roll groupé
+        if len(str(row_i['Ticker'])) == 7:
+            roll_counter += 1
+            roll_code = f"{trade_date.strftime('%Y%m%d')}-R-{roll_counter}-L0"
+            idx_i = df_price_ok.index[i]
+            final_df.loc[idx_i, 'Structure_ID'] = roll_code
+            df_price_ok.loc[idx_i, 'Structure_ID'] = roll_code
+            continue
+
+        ticker_prefix_i = str(row_i['Ticker'])[:3]
+        size_i = row_i['Size']
+        price_i = row_i['Price']
+        time_i = row_i['DateTime']
+
+        candidate_j_120 = None
+        candidate_j_extended = None
+
+        for j in range(i+1, len(df_price_ok)):
+            if df_price_ok.iloc[j]['Structure_ID'] != "":
+                continue
+            row_j = df_price_ok.iloc[j]
+            if str(row_j['Ticker'])[:3] != ticker_prefix_i:
+                continue
+            if str(row_j['Ticker']) == str(row_i['Ticker']):
+                continue
+            if abs(size_i - row_j['Size']) > 0.05 * size_i:
+                continue
+            if abs(price_i - row_j['Price']) > 0.05 * price_i:
+                continue
+
+            time_diff = abs((row_j['DateTime'] - time_i).total_seconds())
+            if time_diff <= 120:
+                candidate_j_120 = j
+                break
+            elif time_diff <= 10000 and candidate_j_extended is None:
+                candidate_j_extended = j
+
+        if candidate_j_120 is not None:
+            chosen_j = candidate_j_120
+        elif candidate_j_extended is not None:
+            chosen_j = candidate_j_extended
+        else:
+            continue
+
+        roll_counter += 1
+        roll_code_leg1 = f"{trade_date.strftime('%Y%m%d')}-R-{roll_counter}-L1"
+        roll_code_leg2 = f"{trade_date.strftime('%Y%m%d')}-R-{roll_counter}-L2"
+        idx_i = df_price_ok.index[i]
+        idx_j = df_price_ok.index[chosen_j]
+        final_df.loc[idx_i, 'Structure_ID'] = roll_code_leg1
+        final_df.loc[idx_j, 'Structure_ID'] = roll_code_leg2
+        df_price_ok.loc[idx_i, 'Structure_ID'] = roll_code_leg1
+        df_price_ok.loc[idx_j, 'Structure_ID'] = roll_code_leg2
+
+    # Attribution des labels "Screen" et "Outright"
+    final_df.loc[final_df['Price'].isna(), 'Structure_ID'] = f"{trade_date.strftime('%Y%m%d')}-S"
+    final_df.loc[final_df['Structure_ID'] == "", 'Structure_ID'] = f"{trade_date.strftime('%Y%m%d')}-O"
+
+    # Création de la colonne "Structure"
+    def extract_Structure(struct_code):
+        if 'R' in struct_code:
+            return 'Leg'
+        elif 'S' in struct_code:
+            return 'Screen'
+        elif 'O' in struct_code:
+            return 'Outright'
+        else:
+            return 'Autre'
+    final_df['Structure'] = final_df['Structure_ID'].apply(extract_Structure)
+    final_df['Structure'] = final_df['Structure'].replace("Screen", "Roll Screen")
+
+    # Regroupement par catégorie et tri global
+    order_mapping = {'Leg': 0, 'Screen': 1, 'Outright': 2, 'Autre': 3}
+    final_df['sort_order'] = final_df['Structure'].map(order_mapping)
+    final_df = final_df.sort_values(by='sort_order').drop(columns=['sort_order'])
+    roll_mask = final_df['Structure_ID'].str.contains("-R-")
+    screen_mask = final_df['Structure_ID'].str.contains("-S")
+    outright_mask = final_df['Structure_ID'].str.contains("-O")
+    df_roll = final_df[roll_mask].copy()
+    df_screen = final_df[screen_mask].copy()
+    df_outright = final_df[outright_mask].copy()
+
+    # Tri personnalisé des Roll selon le ticker
+    extracted_counter: pd.Series = df_roll['Structure_ID'].str.extract(r'-R-(\d+)-L', expand=False)
+    df_roll['roll_counter'] = pd.to_numeric(extracted_counter, errors='coerce').fillna(0).astype(int)
+    extracted_ticker_digit: pd.Series = df_roll['Ticker'].astype(str).str[-1]
+    df_roll['ticker_last_digit'] = pd.to_numeric(extracted_ticker_digit, errors='coerce').fillna(0).astype(int)
+    df_roll['ticker_penult'] = df_roll['Ticker'].str[-2]
+    order_map_letters = {'H': 1, 'M': 2, 'U': 3, 'Z': 4}
+    df_roll['ticker_penult_order'] = df_roll['ticker_penult'].map(order_map_letters).fillna(99)
+    df_roll_sorted = df_roll.sort_values(by=['roll_counter', 'ticker_last_digit', 'ticker_penult_order'])
+    df_screen_sorted = df_screen.sort_values(by='Time')
+    df_outright_sorted = df_outright.sort_values(by='Time')
+    final_sorted = pd.concat([df_roll_sorted, df_screen_sorted, df_outright_sorted], ignore_index=True)
+    final_sorted = final_sorted.drop(columns=['roll_counter', 'ticker_last_digit', 'ticker_penult', 'ticker_penult_order'], errors='ignore')
+
+    # Insertion des lignes résumé pour les Roll (Merge Roll) avec calcul "Level"
+    summary_rows = []
+    for r in df_roll_sorted['roll_counter'].unique():
+        group = df_roll_sorted[df_roll_sorted['roll_counter'] == r]
+        if len(group) >= 2:
+            row1 = group.iloc[0]
+            row2 = group.iloc[1]
+            summary = {
+                'Time': row1['Time'],
+                'Level': (row2['Price'] / row1['Price'] - 1) * 100,
+                'Ticker': row1['Ticker'] + row2['Ticker'][-2:],
+                'Notional': (row1['Notional'] + row2['Notional']) / 2,
+                'Size': row1['Size'],
+                'Price': row1['Price'],
+                'Volume': row1['Volume'],
+                '1DChg': row1['1DChg'],
+                'UndTkr': row1['UndTkr'],
+                '1PtVal': row1['1PtVal'],
+                'Exch': row1['Exch'],
+                'UndCmpName': row1['UndCmpName'],
+                'UndPrc': row1['UndPrc'],
+                'Date': row1['Date'],
+                'FutName': row1['FutName'] + row2['FutName'][-5:],
+                'Structure_ID': f"{trade_date.strftime('%Y%m%d')}-R-{r}",
+                'Structure': "Roll",
+                'roll_counter': r,
+                'order': 0
+            }
+            summary_rows.append(summary)
+    df_summary = pd.DataFrame(summary_rows)
+    legs_rows = []
+    for _, row in df_roll_sorted.iterrows():
+        row_copy = row.copy()
+        row_copy['order'] = 1 if row_copy['Structure_ID'].endswith("-L1") else 2
+        legs_rows.append(row_copy)
+    df_legs = pd.DataFrame(legs_rows)
+    df_roll_final = pd.concat([df_summary, df_legs], ignore_index=True)
+    df_roll_final = df_roll_final.sort_values(by=['roll_counter', 'order'])
+    df_roll_final = df_roll_final.drop(columns=['roll_counter', 'order', 'ticker_last_digit', 'ticker_penult', 'ticker_penult_order'], errors='ignore')
+    mask_l0 = df_roll_final['Structure_ID'].str.contains("-L0", na=False)
+    df_roll_final.loc[mask_l0, 'Structure_ID'] = df_roll_final.loc[mask_l0, 'Structure_ID'].str.replace("-L0", "", regex=False)
+    df_roll_final.loc[mask_l0, 'Structure'] = "Roll"
+
+    # Formatage de la date au format "MM/DD/YYYY"
+    final_df['Date'] = pd.to_datetime(final_df['Date']).dt.strftime('%m/%d/%Y')
+
+    # Assemblage final
+    final_sorted = pd.concat([df_roll_final, df_screen_sorted, df_outright_sorted], ignore_index=True)
+
+    # Insertion de la colonne "Closing1d" juste après "Price"
+    price_idx = final_sorted.columns.get_loc("Price")
+    final_sorted.insert(price_idx+1, "Closing1d", "")
+    for i, row in final_sorted.iterrows():
+        excel_row = i + 2  # Excel commence à la ligne 2 (après l'en-tête)
+        if row["Structure"] in ["Roll", "Outright"]:
+            final_sorted.at[i, "Closing1d"] = f'=BDH(L{excel_row}&" Index", "PX_CLOSE_1D",R{excel_row},R{excel_row})'
+        else:
+            final_sorted.at[i, "Closing1d"] = ""
+
+    # Insertion de la formule dans la colonne "Level" pour les "Outright"
+    # On insère ici une formule Excel qui calcule (Price/Closing1d - 1)
+    for i, row in final_sorted.iterrows():
+        if row["Structure"] == "Outright":
+            excel_row = i + 2
+            final_sorted.at[i, "Level"] = f'=(F{excel_row}/G{excel_row})'
+
+    # Détection des Roll-Client : on vérifie uniquement les lignes de type Leg pour déterminer si les 2 legs ont le même Price
+    roll_groups = final_sorted[final_sorted['Structure'].isin(['Roll', 'Leg'])].groupby(
+        final_sorted['Structure_ID'].str.extract(r'(\d{8}-R-\d+)')[0]
+    )
+    for roll_id, group in roll_groups:
+        # Récupérer uniquement les lignes de type Leg
+        group_legs = group[group['Structure'] == 'Leg']
+        summary_row = group[group['Structure'] == 'Roll']
+        if len(group_legs) == 2 and group_legs['Price'].nunique() == 1 and not summary_row.empty:
+            # Mise à jour uniquement de la ligne de synthèse (summary) ayant Structure "Roll"
+            # summary_indices = group[group['Structure'] == 'Roll'].index
+            final_sorted.loc[summary_row.index, 'Structure'] = 'Roll Client'
+
+    final_sorted = detect_roll_clients_by_notional(final_sorted)
+    final_sorted = reorder_columns(final_sorted)
+    return final_sorted
+
+def reorder_columns(df):
+    desired_order = [
+        'Time', 'Level', 'Ticker', 'Notional', 'Size', 'Price', 'Closing1d',
+        'Structure_ID', 'Structure', 'Volume', '1DChg', 'UndTkr', '1PtVal',
+        'Exch', 'FutName', 'UndCmpName', 'UndPrc', 'Date'
+    ]
+    # Garder les colonnes restantes à la fin s’il y en a
+    other_columns = [col for col in df.columns if col not in desired_order]
+    return df[desired_order + other_columns]
+
+def detect_roll_clients_by_notional(df):
+    """
+    Parcourt le DataFrame et transforme les lignes de structure 'Roll'
+    en 'Roll Client' si les deux 'Leg' associées partagent le même 'Notional'.
+    """
+    df = df.copy()
+    # Extraire l'ID commun aux Legs/Roll
+    df['RollGroup'] = df['Structure_ID'].str.extract(r'(\d{8}-R-\d+)')
+
+    roll_groups = df[df['Structure'].isin(['Roll', 'Leg'])].groupby('RollGroup')
+
+    for roll_id, group in roll_groups:
+        legs = group[group['Structure'] == 'Leg']
+        roll = group[group['Structure'] == 'Roll']
+        if len(legs) == 2 and legs['Notional'].nunique() == 1 and not roll.empty:
+            df.loc[roll.index, 'Structure'] = 'Roll Client'
+
+    df = df.drop(columns=['RollGroup'])
+    return df
+
+def postprocess_excel(final_sorted):
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        final_sorted.to_excel(writer, index=False, sheet_name='Sheet1')
+    output.seek(0)
+
+    wb = load_workbook(output)
+    ws = wb.active
+    closing1d_col_idx = final_sorted.columns.get_loc("Closing1d") + 1  # openpyxl est 1-indexé
+    for row_num in range(4, ws.max_row + 1):
+        cell = ws.cell(row=row_num, column=closing1d_col_idx)
+        if isinstance(cell.value, str) and cell.value.startswith("="):
+            ws.cell(row=row_num, column=closing1d_col_idx).value = f'=BDH(L{row_num}&" Index", "PX_CLOSE_1D",R{row_num},R{row_num})'
+    level_col_idx = final_sorted.columns.get_loc("Level") + 1 if "Level" in final_sorted.columns else None
+    if level_col_idx:
+        for row_num in range(2, ws.max_row + 1):
+            cell = ws.cell(row=row_num, column=level_col_idx)
+            cell.number_format = "0.000"
+    download_buffer = io.BytesIO()
+    wb.save(download_buffer)
+    download_buffer.seek(0)
+    return download_buffer
+
+def save_processed_data(new_data, filename="data/processed/processed_data.csv"):
+    """
+    Pour une date donnée, si des données existent déjà dans le fichier de sauvegarde,
+    on supprime les lignes correspondantes avant d'ajouter les nouvelles.
+    """
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    if os.path.exists(filename):
+        try:
+            old_data = pd.read_csv(filename)
+        except Exception as e:
+            old_data = pd.DataFrame()
+    else:
+        old_data = pd.DataFrame()
+    # Récupérer la date traitée (toutes les lignes de new_data concernent la même date)
+    processed_date = new_data['Date'].iloc[0]
+    if 'Date' in old_data.columns:
+        old_data = old_data[old_data['Date'] != processed_date]
+    combined = pd.concat([old_data, new_data], ignore_index=True)
+    combined.to_csv(filename, index=False)
+    return combined
@@ -0,0 +1,189 @@
+"""
+Générateur de fichiers grid Bloomberg synthétiques, avec les mêmes colonnes
+que les fichiers de data/raw et une part contrôlée de paires de Roll.
+
+Usage : python benchmarks/synthetic.py nombre_de_lignes dossier [lignes_par_fichier]
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+GRID_COLUMNS = ['Time', 'Ticker', 'Notional', 'Size', 'Price', 'Volume', '1DChg',
+                'UndTkr', '1PtVal', 'Exch', 'FutName', 'UndCmpName', 'UndPrc']
+
+# (racine du ticker, UndTkr, FutName sans l'échéance, UndCmpName, 1PtVal, niveau de l'indice)
+INSTRUMENTS = [
+    ('ZVL', 'M1IN', 'MSCI India        ', 'MSCI India Net Total Return US', 100, 1133.53),
+    ('ZTW', 'M1MS', 'MSCI Emer Mkts As ', 'MSCI EM Asia Net Total Return', 100, 699.53),
+    ('MUR', 'NDEUCHF', 'MSCI China Future ', 'MSCI China Net Total Return US', 50, 509.53),
+    ('CJE', 'M1CN', 'MSCI CH NTR USD F ', 'MSCI CHINA Net Total Return US', 50, 507.21),
+    ('FMI', 'M1JP', 'MSCI Japan Index  ', 'MSCI Japan Net Total Return US', 10, 8626.01),
+    ('FPO', 'NDEUSTW', 'MSCI Taiwan       ', 'MSCI Emerging Markets Taiwan N', 100, 835.43),
+    ('ZSI', 'M1PCJ', 'MSCI Pacific ex J ', 'MSCI Pacific ex Japan Net Tota', 10, 8155.10),
+    ('ZVW', 'M1PH', 'MSCI Philippines  ', 'MSCI Philippines Net Total Ret', 50, 418.12),
+    ('RBE', 'MXEF', 'MSCI EM Index     ', 'MSCI Emerging Markets Index', 50, 1095.78),
+    ('FFA', 'NDDUEAFE', 'MSCI EAFE USD NTR ', 'MSCI EAFE Net Total Return USD', 10, 8250.59),
+    ('ZUL', 'M1LA', 'MSCI Eme Mkt Lat  ', 'MSCI EM Latin America Net Tota', 100, 490.54),
+    ('HLC', 'M1HK', 'MSCI Hong Kong    ', 'MSCI Hong Kong Net USD Index', 1, 56115.62),
+]
+
+# Échéances successives (code mois H/M/U/Z, chiffre de l'année, libellé FutName)
+CONTRACTS = [('Z', '4', 'Dec24'), ('H', '5', 'Mar25'), ('M', '5', 'Jun25'), ('U', '5', 'Sep25')]
+
+SESSION_START = 6 * 3600
+SESSION_END = 23 * 3600
+
+
+def generate_grid(n_rows, roll_share=0.3, screen_share=0.3, grouped_share=0.01, seed=0, strip_share=0.0):
+    """
+    DataFrame de `n_rows` lignes au format des fichiers grid, trié par heure
+    décroissante comme les extractions Bloomberg.
+
+    `roll_share` : part des lignes formant une paire de Roll (deux legs de la
+    même racine sur deux échéances successives, taille et prix voisins, à moins
+    de 90 s d'intervalle) ; `screen_share` : part des lignes sans prix ;
+    `grouped_share` : part des tickers de roll groupé à 7 caractères (FPOZ4H5) ;
+    `strip_share` : part des lignes formant une structure de trois legs sur trois
+    échéances successives (voir _strip_rows), en plus des `n_rows` lignes.
+    """
+    rng = np.random.default_rng(seed)
+    n_pairs = int(n_rows * roll_share) // 2
+    n_grouped = int(n_rows * grouped_share)
+    n_single = n_rows - 2 * n_pairs - n_grouped
+    if n_single < 0:
+        raise ValueError("roll_share + grouped_share ne peut pas dépasser 1")
+
+    # Paires de Roll : échéance proche puis échéance suivante
+    pair_instrument = rng.integers(0, len(INSTRUMENTS), n_pairs)
+    pair_contract = rng.integers(0, len(CONTRACTS) - 1, n_pairs)
+    pair_seconds = rng.integers(SESSION_START, SESSION_END - 90, n_pairs)
+    pair_size = _sizes(rng, n_pairs)
+    pair_spread = 1 + rng.uniform(0.002, 0.02, n_pairs)
+    pair_screen = rng.random(n_pairs) < screen_share
+
+    instrument = np.concatenate([
+        pair_instrument, pair_instrument,
+        rng.integers(0, len(INSTRUMENTS), n_single + n_grouped),
+    ])
+    contract = np.concatenate([
+        pair_contract, pair_contract + 1,
+        rng.integers(0, len(CONTRACTS), n_single),
+        rng.integers(0, len(CONTRACTS) - 1, n_grouped),
+    ])
+    seconds = np.concatenate([
+        pair_seconds, pair_seconds + rng.integers(0, 91, n_pairs),
+        rng.integers(SESSION_START, SESSION_END, n_single + n_grouped),
+    ])
+    far_size = np.where(rng.random(n_pairs) < 0.8, pair_size, np.round(pair_size * rng.uniform(0.97, 1.03, n_pairs)))
+    size = np.concatenate([pair_size, far_size, _sizes(rng, n_single + n_grouped)]).astype('int64')
+    is_grouped = np.zeros(n_rows, dtype=bool)
+    is_grouped[n_rows - n_grouped:] = True
+
+    level = np.array([inst[5] for inst in INSTRUMENTS])[instrument]
+    und_prc = np.round(level * (1 + rng.normal(0, 0.002, n_rows)), 2)
+    price = np.round(und_prc * (1 + rng.normal(0, 0.003, n_rows)), 4)
+    price[n_pairs:2 * n_pairs] = np.round(price[:n_pairs] * pair_spread, 4)
+    price[is_grouped] = np.round(level[is_grouped] * rng.uniform(0.002, 0.02, n_grouped), 4)
+    screen = np.concatenate([pair_screen, pair_screen, rng.random(n_single + n_grouped) < screen_share])
+    price[screen] = np.nan
+
+    roots = np.array([inst[0] for inst in INSTRUMENTS], dtype=object)[instrument]
+    codes = np.array([month + year for month, year, _ in CONTRACTS], dtype=object)
+    ticker = roots + codes[contract]
+    ticker[is_grouped] = ticker[is_grouped] + codes[contract[is_grouped] + 1]
+    point_value = np.array([inst[4] for inst in INSTRUMENTS])[instrument]
+    notional = np.round(size * np.where(screen, und_prc, price) * point_value).astype('int64')
+    labels = np.array([label for _, _, label in CONTRACTS], dtype=object)
+
+    df = pd.DataFrame({
+        'Time': [f"{s // 3600:02d}:{s % 3600 // 60:02d}:{s % 60:02d}" for s in seconds.tolist()],
+        'Ticker': ticker,
+        'Notional': notional,
+        'Size': size,
+        'Price': price,
+        'Volume': rng.integers(100, 40000, n_rows),
+        '1DChg': np.where(screen, 0.0, np.round(rng.normal(0, 8, n_rows), 2)),
+        'UndTkr': np.array([inst[1] for inst in INSTRUMENTS], dtype=object)[instrument],
+        '1PtVal': point_value,
+        'Exch': 'GR',
+        'FutName': np.array([inst[2] for inst in INSTRUMENTS], dtype=object)[instrument] + labels[contract],
+        'UndCmpName': np.array([inst[3] for inst in INSTRUMENTS], dtype=object)[instrument],
+        'UndPrc': und_prc,
+    }, columns=GRID_COLUMNS)
+    n_strips = int(n_rows * strip_share) // 3
+    if n_strips:
+        strips, strip_seconds = _strip_rows(n_strips, seed)
+        df = pd.concat([df, strips], ignore_index=True)
+        seconds = np.concatenate([seconds, strip_seconds])
+    order = np.argsort(-seconds, kind='stable')
+    return df.iloc[order].reset_index(drop=True)
+
+
+def _strip_rows(n_strips, seed):
+    # Structures de trois legs (même taille, prix voisins, à moins de 3 s) ;
+    # générateur distinct pour ne pas changer les autres lignes
+    rng = np.random.default_rng([seed, 1])
+    instrument = np.repeat(rng.integers(0, len(INSTRUMENTS), n_strips), 3)
+    contract = np.tile(np.arange(3), n_strips) + np.repeat(rng.integers(0, len(CONTRACTS) - 2, n_strips), 3)
+    seconds = np.repeat(rng.integers(SESSION_START, SESSION_END - 3, n_strips), 3) + rng.integers(0, 4, 3 * n_strips)
+    size = np.repeat(_sizes(rng, n_strips), 3).astype('int64')
+    level = np.array([inst[5] for inst in INSTRUMENTS])[instrument]
+    und_prc = np.round(level * (1 + rng.normal(0, 0.002, 3 * n_strips)), 2)
+    price = np.round(np.repeat(und_prc[::3], 3) * (1 + 0.005 * np.tile(np.arange(3), n_strips)), 4)
+    point_value = np.array([inst[4] for inst in INSTRUMENTS])[instrument]
+    codes = np.array([month + year for month, year, _ in CONTRACTS], dtype=object)
+    labels = np.array([label for _, _, label in CONTRACTS], dtype=object)
+    strips = pd.DataFrame({
+        'Time': [f"{s // 3600:02d}:{s % 3600 // 60:02d}:{s % 60:02d}" for s in seconds.tolist()],
+        'Ticker': np.array([inst[0] for inst in INSTRUMENTS], dtype=object)[instrument] + codes[contract],
+        'Notional': np.round(size * price * point_value).astype('int64'),
+        'Size': size,
+        'Price': price,
+        'Volume': rng.integers(100, 40000, 3 * n_strips),
+        '1DChg': np.round(rng.normal(0, 8, 3 * n_strips), 2),
+        'UndTkr': np.array([inst[1] for inst in INSTRUMENTS], dtype=object)[instrument],
+        '1PtVal': point_value,
+        'Exch': 'GR',
+        'FutName': np.array([inst[2] for inst in INSTRUMENTS], dtype=object)[instrument] + labels[contract],
+        'UndCmpName': np.array([inst[3] for inst in INSTRUMENTS], dtype=object)[instrument],
+        'UndPrc': und_prc,
+    }, columns=GRID_COLUMNS)
+    return strips, seconds
+
+
+def _sizes(rng, n):
+    # Tailles de l'ordre de celles des fichiers réels (médiane ~400, queue longue)
+    return np.maximum(1, np.round(rng.lognormal(6.0, 1.0, n)))
+
+
+def write_grid_files(df, directory, rows_per_file=50_000, prefix="grid1_"):
+    """
+    Écrit `df` en un ou plusieurs fichiers xlsx (première feuille, en-tête en
+    ligne 1, prix manquants en cellules vides) et retourne leurs chemins.
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for part, start in enumerate(range(0, max(len(df), 1), rows_per_file)):
+        chunk = df.iloc[start:start + rows_per_file]
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("Sheet1")
+        ws.append(list(chunk.columns))
+        columns = [chunk[name].astype(object).where(chunk[name].notna(), None).tolist() for name in chunk.columns]
+        for row in zip(*columns):
+            ws.append(row)
+        path = os.path.join(directory, f"{prefix}{part:04d}.xlsx")
+        wb.save(path)
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+    rows_per_file = int(sys.argv[3]) if len(sys.argv) > 3 else 50_000
+    written = write_grid_files(generate_grid(int(sys.argv[1])), sys.argv[2], rows_per_file)
+    print(f"{len(written)} fichier(s) écrit(s) dans {sys.argv[2]}")
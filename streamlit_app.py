@@ -1,312 +1,56 @@
+import time
+SCRIPT_STARTED = time.perf_counter()  # début de l'exécution du script (voir startup_profile)
 import streamlit as st
 import pandas as pd
-from openpyxl import load_workbook
-import io
+from app.closing_prices import CLOSING_PRICES_PATH, import_price_exports, load_closing_prices
+from app.export import EXPORT_FORMATS
+from app.history import HISTORY_DIR, manifest_version, read_roll_aggregates, saved_dates
+from app.jobs import (DONE, FAILED, QUEUED, RUNNING, JobQueueFull, job_archive_path, job_output_path,
+                      job_preview_path, job_status, list_jobs, submit_job, submit_multi_date_job, warm_pool)
+from app.preview import PREVIEW_PAGE_ROWS, PREVIEW_STRUCTURES, preview_count, preview_page, preview_summary
+from app.profiling import STARTUP_LOG, StartupProfile, last_run
+from app.query import history_roots, query_history
+from app.trade_dates import FROM_DEFAULT, group_by_date
 import os
 import calendar
 from datetime import date, datetime
+IMPORTS_DONE = time.perf_counter()
 
 # ------------------------
 # Fonctions de traitement
 # ------------------------
 
-def process_files(uploaded_files, trade_date):
-    dataframes = []
-    for uploaded_file in uploaded_files:
-        try:
-            df = pd.read_excel(uploaded_file, engine="openpyxl")
-            dataframes.append(df)
-        except Exception as e:
-            st.error(f"Erreur lors du chargement de {uploaded_file.name}: {e}")
-    if not dataframes:
-        st.error("Aucun fichier valide n'a été chargé.")
-        return None
+DOWNLOAD_MIME_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+    "csv": "text/csv",
+}
+# Lignes affichées au plus pour une recherche dans l'historique
+HISTORY_QUERY_ROWS = 1000
+# Étapes du démarrage à froid, mesurées depuis SCRIPT_STARTED (voir app.profiling.StartupProfile)
+STARTUP_STAGES = ["imports", "premier affichage", "processus de traitement"]
 
-    # Concaténation de tous les fichiers
-    final_df = pd.concat(dataframes, ignore_index=True)
-
-    # Tri initial par heure si la colonne 'Time' existe
-    if 'Time' in final_df.columns:
-        final_df['Time'] = pd.to_datetime(final_df['Time'], format='%H:%M:%S', errors='coerce').dt.time
-        final_df['sort_order'] = final_df['Time'].apply(lambda x: 0 if x >= pd.Timestamp("08:00:00").time() else 1)
-        final_df = final_df.sort_values(by=['sort_order', 'Time']).drop(columns=['sort_order']).reset_index(drop=True)
-        # Inversion de l'ordre des lignes
-        final_df = final_df.iloc[::-1].reset_index(drop=True)
-    else:
-        st.error("La colonne 'Time' est introuvable dans les fichiers.")
-        return None
-
-    # Saisie de la date et initialisation des colonnes
-    final_df['Date'] = trade_date
-    final_df['Structure_ID'] = ""
-    final_df['Price'] = pd.to_numeric(final_df['Price'], errors='coerce')
-    final_df['Size'] = pd.to_numeric(final_df['Size'], errors='coerce')
-
-    # Séparation des lignes selon la présence de Price
-    df_price_na = final_df[final_df['Price'].isna()].copy()
-    df_price_ok = final_df[final_df['Price'].notna()].copy()
-    df_price_ok['DateTime'] = df_price_ok.apply(lambda row: pd.Timestamp.combine(trade_date, row['Time']), axis=1)
-
-    # Détection combinée des paires de Roll (priorité à 120 sec, sinon seuil étendu)
-    roll_counter = 0
-    for i in range(len(df_price_ok)):
-        if df_price_ok.iloc[i]['Structure_ID'] != "":
-            continue
-        row_i = df_price_ok.iloc[i]
-
-        # Vérification : si le ticker a exactement 7 caractères, c'est déjà un roll groupé
-        if len(str(row_i['Ticker'])) == 7:
-            roll_counter += 1
-            roll_code = f"{trade_date.strftime('%Y%m%d')}-R-{roll_counter}-L0"
-            idx_i = df_price_ok.index[i]
-            final_df.loc[idx_i, 'Structure_ID'] = roll_code
-            df_price_ok.loc[idx_i, 'Structure_ID'] = roll_code
-            continue
-
-        ticker_prefix_i = str(row_i['Ticker'])[:3]
-        size_i = row_i['Size']
-        price_i = row_i['Price']
-        time_i = row_i['DateTime']
-
-        candidate_j_120 = None
-        candidate_j_extended = None
-
-        for j in range(i+1, len(df_price_ok)):
-            if df_price_ok.iloc[j]['Structure_ID'] != "":
-                continue
-            row_j = df_price_ok.iloc[j]
-            if str(row_j['Ticker'])[:3] != ticker_prefix_i:
-                continue
-            if str(row_j['Ticker']) == str(row_i['Ticker']):
-                continue
-            if abs(size_i - row_j['Size']) > 0.05 * size_i:
-                continue
-            if abs(price_i - row_j['Price']) > 0.05 * price_i:
-                continue
-
-            time_diff = abs((row_j['DateTime'] - time_i).total_seconds())
-            if time_diff <= 120:
-                candidate_j_120 = j
-                break
-            elif time_diff <= 10000 and candidate_j_extended is None:
-                candidate_j_extended = j
-
-        if candidate_j_120 is not None:
-            chosen_j = candidate_j_120
-        elif candidate_j_extended is not None:
-            chosen_j = candidate_j_extended
-        else:
-            continue
-
-        roll_counter += 1
-        roll_code_leg1 = f"{trade_date.strftime('%Y%m%d')}-R-{roll_counter}-L1"
-        roll_code_leg2 = f"{trade_date.strftime('%Y%m%d')}-R-{roll_counter}-L2"
-        idx_i = df_price_ok.index[i]
-        idx_j = df_price_ok.index[chosen_j]
-        final_df.loc[idx_i, 'Structure_ID'] = roll_code_leg1
-        final_df.loc[idx_j, 'Structure_ID'] = roll_code_leg2
-        df_price_ok.loc[idx_i, 'Structure_ID'] = roll_code_leg1
-        df_price_ok.loc[idx_j, 'Structure_ID'] = roll_code_leg2
-
-    # Attribution des labels "Screen" et "Outright"
-    final_df.loc[final_df['Price'].isna(), 'Structure_ID'] = f"{trade_date.strftime('%Y%m%d')}-S"
-    final_df.loc[final_df['Structure_ID'] == "", 'Structure_ID'] = f"{trade_date.strftime('%Y%m%d')}-O"
-
-    # Création de la colonne "Structure"
-    def extract_Structure(struct_code):
-        if 'R' in struct_code:
-            return 'Leg'
-        elif 'S' in struct_code:
-            return 'Screen'
-        elif 'O' in struct_code:
-            return 'Outright'
-        else:
-            return 'Autre'
-    final_df['Structure'] = final_df['Structure_ID'].apply(extract_Structure)
-    final_df['Structure'] = final_df['Structure'].replace("Screen", "Roll Screen")
-
-    # Regroupement par catégorie et tri global
-    order_mapping = {'Leg': 0, 'Screen': 1, 'Outright': 2, 'Autre': 3}
-    final_df['sort_order'] = final_df['Structure'].map(order_mapping)
-    final_df = final_df.sort_values(by='sort_order').drop(columns=['sort_order'])
-    roll_mask = final_df['Structure_ID'].str.contains("-R-")
-    screen_mask = final_df['Structure_ID'].str.contains("-S")
-    outright_mask = final_df['Structure_ID'].str.contains("-O")
-    df_roll = final_df[roll_mask].copy()
-    df_screen = final_df[screen_mask].copy()
-    df_outright = final_df[outright_mask].copy()
-
-    # Tri personnalisé des Roll selon le ticker
-    extracted_counter: pd.Series = df_roll['Structure_ID'].str.extract(r'-R-(\d+)-L', expand=False)
-    df_roll['roll_counter'] = pd.to_numeric(extracted_counter, errors='coerce').fillna(0).astype(int)
-    extracted_ticker_digit: pd.Series = df_roll['Ticker'].astype(str).str[-1]
-    df_roll['ticker_last_digit'] = pd.to_numeric(extracted_ticker_digit, errors='coerce').fillna(0).astype(int)
-    df_roll['ticker_penult'] = df_roll['Ticker'].str[-2]
-    order_map_letters = {'H': 1, 'M': 2, 'U': 3, 'Z': 4}
-    df_roll['ticker_penult_order'] = df_roll['ticker_penult'].map(order_map_letters).fillna(99)
-    df_roll_sorted = df_roll.sort_values(by=['roll_counter', 'ticker_last_digit', 'ticker_penult_order'])
-    df_screen_sorted = df_screen.sort_values(by='Time')
-    df_outright_sorted = df_outright.sort_values(by='Time')
-    final_sorted = pd.concat([df_roll_sorted, df_screen_sorted, df_outright_sorted], ignore_index=True)
-    final_sorted = final_sorted.drop(columns=['roll_counter', 'ticker_last_digit', 'ticker_penult', 'ticker_penult_order'], errors='ignore')
-
-    # Insertion des lignes résumé pour les Roll (Merge Roll) avec calcul "Level"
-    summary_rows = []
-    for r in df_roll_sorted['roll_counter'].unique():
-        group = df_roll_sorted[df_roll_sorted['roll_counter'] == r]
-        if len(group) >= 2:
-            row1 = group.iloc[0]
-            row2 = group.iloc[1]
-            summary = {
-                'Time': row1['Time'],
-                'Level': (row2['Price'] / row1['Price'] - 1) * 100,
-                'Ticker': row1['Ticker'] + row2['Ticker'][-2:],
-                'Notional': (row1['Notional'] + row2['Notional']) / 2,
-                'Size': row1['Size'],
-                'Price': row1['Price'],
-                'Volume': row1['Volume'],
-                '1DChg': row1['1DChg'],
-                'UndTkr': row1['UndTkr'],
-                '1PtVal': row1['1PtVal'],
-                'Exch': row1['Exch'],
-                'UndCmpName': row1['UndCmpName'],
-                'UndPrc': row1['UndPrc'],
-                'Date': row1['Date'],
-                'FutName': row1['FutName'] + row2['FutName'][-5:],
-                'Structure_ID': f"{trade_date.strftime('%Y%m%d')}-R-{r}",
-                'Structure': "Roll",
-                'roll_counter': r,
-                'order': 0
-            }
-            summary_rows.append(summary)
-    df_summary = pd.DataFrame(summary_rows)
-    legs_rows = []
-    for _, row in df_roll_sorted.iterrows():
-        row_copy = row.copy()
-        row_copy['order'] = 1 if row_copy['Structure_ID'].endswith("-L1") else 2
-        legs_rows.append(row_copy)
-    df_legs = pd.DataFrame(legs_rows)
-    df_roll_final = pd.concat([df_summary, df_legs], ignore_index=True)
-    df_roll_final = df_roll_final.sort_values(by=['roll_counter', 'order'])
-    df_roll_final = df_roll_final.drop(columns=['roll_counter', 'order', 'ticker_last_digit', 'ticker_penult', 'ticker_penult_order'], errors='ignore')
-    mask_l0 = df_roll_final['Structure_ID'].str.contains("-L0", na=False)
-    df_roll_final.loc[mask_l0, 'Structure_ID'] = df_roll_final.loc[mask_l0, 'Structure_ID'].str.replace("-L0", "", regex=False)
-    df_roll_final.loc[mask_l0, 'Structure'] = "Roll"
-
-    # Formatage de la date au format "MM/DD/YYYY"
-    final_df['Date'] = pd.to_datetime(final_df['Date']).dt.strftime('%m/%d/%Y')
-
-    # Assemblage final
-    final_sorted = pd.concat([df_roll_final, df_screen_sorted, df_outright_sorted], ignore_index=True)
-
-    # Insertion de la colonne "Closing1d" juste après "Price"
-    price_idx = final_sorted.columns.get_loc("Price")
-    final_sorted.insert(price_idx+1, "Closing1d", "")
-    for i, row in final_sorted.iterrows():
-        excel_row = i + 2  # Excel commence à la ligne 2 (après l'en-tête)
-        if row["Structure"] in ["Roll", "Outright"]:
-            final_sorted.at[i, "Closing1d"] = f'=BDH(L{excel_row}&" Index", "PX_CLOSE_1D",R{excel_row},R{excel_row})'
-        else:
-            final_sorted.at[i, "Closing1d"] = ""
-
-    # Insertion de la formule dans la colonne "Level" pour les "Outright"
-    # On insère ici une formule Excel qui calcule (Price/Closing1d - 1)
-    for i, row in final_sorted.iterrows():
-        if row["Structure"] == "Outright":
-            excel_row = i + 2
-            final_sorted.at[i, "Level"] = f'=(F{excel_row}/G{excel_row})'
-
-    # Détection des Roll-Client : on vérifie uniquement les lignes de type Leg pour déterminer si les 2 legs ont le même Price
-    roll_groups = final_sorted[final_sorted['Structure'].isin(['Roll', 'Leg'])].groupby(
-        final_sorted['Structure_ID'].str.extract(r'(\d{8}-R-\d+)')[0]
-    )
-    for roll_id, group in roll_groups:
-        # Récupérer uniquement les lignes de type Leg
-        group_legs = group[group['Structure'] == 'Leg']
-        summary_row = group[group['Structure'] == 'Roll']
-        if len(group_legs) == 2 and group_legs['Price'].nunique() == 1 and not summary_row.empty:
-            # Mise à jour uniquement de la ligne de synthèse (summary) ayant Structure "Roll"
-            # summary_indices = group[group['Structure'] == 'Roll'].index
-            final_sorted.loc[summary_row.index, 'Structure'] = 'Roll Client'
-
-    final_sorted = detect_roll_clients_by_notional(final_sorted)
-    final_sorted = reorder_columns(final_sorted)
-    return final_sorted
-
-def reorder_columns(df):
-    desired_order = [
-        'Time', 'Level', 'Ticker', 'Notional', 'Size', 'Price', 'Closing1d',
-        'Structure_ID', 'Structure', 'Volume', '1DChg', 'UndTkr', '1PtVal',
-        'Exch', 'FutName', 'UndCmpName', 'UndPrc', 'Date'
-    ]
-    # Garder les colonnes restantes à la fin s’il y en a
-    other_columns = [col for col in df.columns if col not in desired_order]
-    return df[desired_order + other_columns]
-
-def detect_roll_clients_by_notional(df):
-    """
-    Parcourt le DataFrame et transforme les lignes de structure 'Roll'
-    en 'Roll Client' si les deux 'Leg' associées partagent le même 'Notional'.
-    """
-    df = df.copy()
-    # Extraire l'ID commun aux Legs/Roll
-    df['RollGroup'] = df['Structure_ID'].str.extract(r'(\d{8}-R-\d+)')
-
-    roll_groups = df[df['Structure'].isin(['Roll', 'Leg'])].groupby('RollGroup')
-
-    for roll_id, group in roll_groups:
-        legs = group[group['Structure'] == 'Leg']
-        roll = group[group['Structure'] == 'Roll']
-        if len(legs) == 2 and legs['Notional'].nunique() == 1 and not roll.empty:
-            df.loc[roll.index, 'Structure'] = 'Roll Client'
-
-    df = df.drop(columns=['RollGroup'])
-    return df
+# ------------------------
+# Ressources partagées par toutes les sessions d'un même processus
+# ------------------------
 
-def postprocess_excel(final_sorted):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        final_sorted.to_excel(writer, index=False, sheet_name='Sheet1')
-    output.seek(0)
+@st.cache_resource
+def startup_profile():
+    # Créé à la première exécution du script après un démarrage : c'est elle qui est mesurée
+    profile = StartupProfile(SCRIPT_STARTED, STARTUP_STAGES)
+    profile.record("imports", at=IMPORTS_DONE)
+    return profile
 
-    wb = load_workbook(output)
-    ws = wb.active
-    closing1d_col_idx = final_sorted.columns.get_loc("Closing1d") + 1  # openpyxl est 1-indexé
-    for row_num in range(4, ws.max_row + 1):
-        cell = ws.cell(row=row_num, column=closing1d_col_idx)
-        if isinstance(cell.value, str) and cell.value.startswith("="):
-            ws.cell(row=row_num, column=closing1d_col_idx).value = f'=BDH(L{row_num}&" Index", "PX_CLOSE_1D",R{row_num},R{row_num})'
-    level_col_idx = final_sorted.columns.get_loc("Level") + 1 if "Level" in final_sorted.columns else None
-    if level_col_idx:
-        for row_num in range(2, ws.max_row + 1):
-            cell = ws.cell(row=row_num, column=level_col_idx)
-            cell.number_format = "0.000"
-    download_buffer = io.BytesIO()
-    wb.save(download_buffer)
-    download_buffer.seek(0)
-    return download_buffer
+@st.cache_resource
+def job_workers(_profile):
+    # Processus de traitement démarrés et préchauffés une seule fois, avant le premier clic
+    return warm_pool(on_ready=lambda: _profile.record("processus de traitement"))
 
-def save_processed_data(new_data, filename="data/processed/processed_data.csv"):
-    """
-    Pour une date donnée, si des données existent déjà dans le fichier de sauvegarde,
-    on supprime les lignes correspondantes avant d'ajouter les nouvelles.
-    """
-    if not os.path.exists("data/processed"):
-        os.makedirs("data/processed")
-    if os.path.exists(filename):
-        try:
-            old_data = pd.read_csv(filename)
-        except Exception as e:
-            old_data = pd.DataFrame()
-    else:
-        old_data = pd.DataFrame()
-    # Récupérer la date traitée (toutes les lignes de new_data concernent la même date)
-    processed_date = new_data['Date'].iloc[0]
-    if 'Date' in old_data.columns:
-        old_data = old_data[old_data['Date'] != processed_date]
-    combined = pd.concat([old_data, new_data], ignore_index=True)
-    combined.to_csv(filename, index=False)
-    return combined
+@st.cache_resource(max_entries=4)
+def history_index(version, history_dir=HISTORY_DIR):
+    # Dates et racines de l'historique ; relues seulement quand le manifeste change (`version`)
+    return saved_dates(history_dir), history_roots(history_dir)
 
 # # ------------------------
 # # Fonctions pour le calendrier
@@ -362,32 +106,208 @@ def save_processed_data(new_data, filename="data/processed/processed_data.csv"):
 # Fonction principale
 # ------------------------
 
+def show_run_profile(run):
+    # Détail par étape du dernier traitement (journal data/processed/run_log.jsonl)
+    with st.expander("Profil du dernier traitement"):
+        startup = last_run(STARTUP_LOG)
+        if startup is not None:
+            st.caption(f"Dernier démarrage ({startup['started_at']}) : " + ", ".join(
+                f"{stage['stage']} {stage['seconds']:.2f} s" for stage in startup['stages']))
+        if run is None:
+            st.info("Aucun traitement enregistré pour l'instant.")
+            return
+        caption = f"{run['started_at']} — {run.get('trade_date', '')} — {run['total_seconds']:.2f} s au total"
+        if run.get('process_peak_rss_mb') is not None:
+            caption += f" — pic mémoire du processus depuis son démarrage : {run['process_peak_rss_mb']:.1f} Mo"
+        st.caption(caption)
+        stages = pd.DataFrame(run['stages']).rename(columns={
+            'stage': 'Étape', 'seconds': 'Durée (s)', 'rows_in': 'Lignes en entrée',
+            'rows_out': 'Lignes en sortie', 'rss_mb': "Mémoire en fin d'étape (Mo)",
+            'peak_rss_mb': "Pic pendant l'étape (Mo)",
+        })
+        st.dataframe(stages, hide_index=True)
+
+@st.fragment(run_every=1)
+def follow_job(job_id):
+    # Rafraîchi chaque seconde sans réexécuter le reste de la page
+    status = job_status(job_id)
+    if status is None or status["state"] not in (QUEUED, RUNNING):
+        st.rerun()
+    if "days" in status:
+        finished = sum(day["state"] in (DONE, FAILED) for day in status["days"].values())
+        label = f"{finished} journée(s) traitée(s) sur {len(status['days'])}"
+    elif status["state"] == QUEUED:
+        label = "En attente d'un processus de traitement..."
+    else:
+        label = f"Traitement en cours : {status['stage'] or 'démarrage'}"
+    st.progress(status["progress"], text=label)
+    st.caption("Vous pouvez quitter cette page et revenir plus tard par le même lien "
+               "ou par « Traitements récents ».")
+
+def show_job(job_id):
+    status = job_status(job_id)
+    if status is None:
+        st.warning("Ce traitement est introuvable ou a expiré.")
+        return
+    if status["state"] in (QUEUED, RUNNING):
+        follow_job(job_id)
+        return
+    for message in status["messages"]:
+        st.error(message)
+    for notice in status.get("notices", []):
+        st.info(notice)
+    summary = status.get("summary")
+    if summary:
+        st.info(f"{summary['rows']} nouvelle(s) ligne(s), {summary['rolls']} nouveau(x) Roll, "
+                f"{len(summary['skipped'])} fichier(s) déjà intégré(s) ignoré(s).")
+    if status["state"] == DONE and "days" in status:
+        st.success("Traitement terminé!")
+        st.dataframe(pd.DataFrame([{"Date": key, "Fichiers": day["files"], "Lignes": day.get("rows"),
+                                    "État": day["state"]} for key, day in status["days"].items()]),
+                     hide_index=True)
+        with open(job_archive_path(job_id), "rb") as f:
+            st.download_button(
+                label="Télécharger les fichiers traités (zip)",
+                data=f.read(),
+                file_name=f"{min(status['days'])}-{max(status['days'])}.zip",
+                mime="application/zip",
+                key="download-zip"
+            )
+    elif status["state"] == DONE:
+        st.success("Traitement terminé!")
+        # Formatage de la date au format YYYYMMDD pour nommer le fichier
+        filename_date = pd.to_datetime(status["trade_date"]).strftime("%Y%m%d")
+        for fmt in status.get("formats", ["xlsx"]):
+            with open(job_output_path(job_id, fmt), "rb") as f:
+                st.download_button(
+                    label=f"Télécharger le fichier traité ({fmt})",
+                    data=f.read(),
+                    file_name=f"{filename_date}{EXPORT_FORMATS[fmt]}",
+                    mime=DOWNLOAD_MIME_TYPES[fmt],
+                    key=f"download-{fmt}"
+                )
+        st.info("💡 Le fichier sera automatiquement téléchargé dans le dossier 'Téléchargements' par défaut de votre navigateur.")
+        show_preview(job_preview_path(job_id))
+
+@st.fragment
+def show_preview(path):
+    # Seule la page affichée est lue et envoyée au navigateur (voir app.preview)
+    by_structure, by_root = preview_summary(path)
+    st.dataframe(by_structure.rename("Lignes").to_frame().T, hide_index=True)
+    filter_col, root_col = st.columns(2)
+    structures = filter_col.multiselect("Structure", PREVIEW_STRUCTURES)
+    roots = root_col.multiselect("Racine du ticker", list(by_root.index))
+    pages = max(1, -(-preview_count(path, structures, roots) // PREVIEW_PAGE_ROWS))
+    page = st.number_input(f"Page (sur {pages})", min_value=1, max_value=pages, value=1)
+    page_df, total = preview_page(path, structures, roots, page - 1)
+    st.caption(f"{total} ligne(s) retenue(s), lignes {(page - 1) * PREVIEW_PAGE_ROWS + 1} "
+               f"à {min(page * PREVIEW_PAGE_ROWS, total)} ; les formules Excel ne sont visibles que dans le classeur.")
+    st.dataframe(page_df, hide_index=True)
+
+def show_recent_jobs():
+    # Seulement les traitements de cette session : les autres utilisateurs ne les voient pas
+    jobs = list_jobs(st.session_state.get("job_ids", []))
+    if not jobs:
+        return
+    with st.expander("Traitements récents"):
+        for status in jobs:
+            text_col, button_col = st.columns([4, 1])
+            text_col.write(f"{status['submitted_at']} — {status['trade_date']} — "
+                           f"{len(status['files'])} fichier(s) — {status['state']}")
+            if button_col.button("Afficher", key=f"job-{status['job_id']}"):
+                st.query_params["job"] = status["job_id"]
+                st.rerun()
+
+def show_history_query():
+    dates, roots = history_index(manifest_version())
+    if not dates:
+        return
+    with st.expander("Recherche dans l'historique"):
+        period = st.date_input("Période", value=(dates[0], dates[-1]), min_value=dates[0], max_value=dates[-1],
+                               key="history-period")
+        roots = st.multiselect("Racines de ticker", roots, key="history-roots")
+        structures = st.multiselect("Structures", PREVIEW_STRUCTURES, key="history-structures")
+        size_col, notional_col = st.columns(2)
+        min_size = size_col.number_input("Size minimale", min_value=0, value=0, key="history-size")
+        min_notional = notional_col.number_input("Notional minimal", min_value=0.0, value=0.0, key="history-notional")
+        if len(period) == 2 and st.button("Rechercher", key="history-search"):
+            result = query_history(period[0], period[1], roots, structures,
+                                   min_size or None, min_notional or None)
+            st.caption(f"{len(result)} ligne(s) ; {min(len(result), HISTORY_QUERY_ROWS)} affichée(s).")
+            st.dataframe(result.head(HISTORY_QUERY_ROWS), hide_index=True)
+
+def show_roll_aggregates():
+    dates, _ = history_index(manifest_version())
+    if not dates:
+        return
+    with st.expander("Synthèse des Roll par sous-jacent"):
+        period = st.date_input("Période", value=(dates[-1], dates[-1]), min_value=dates[0], max_value=dates[-1],
+                               key="aggregates-period")
+        if len(period) == 2:
+            aggregates = read_roll_aggregates(period[0], period[1])
+            aggregates['Date'] = aggregates['Date'].dt.date
+            st.dataframe(aggregates, hide_index=True)
+
+def show_closing_prices():
+    prices = load_closing_prices()
+    with st.expander("Cours de clôture locaux"):
+        st.caption(f"{0 if prices is None else len(prices)} cours dans {CLOSING_PRICES_PATH} : ils remplacent "
+                   "les formules BDH de Closing1d (et Level des Outright) pour les (UndTkr, Date) connus.")
+        exports = st.file_uploader("Exports de cours (colonnes ticker, Date, PX_CLOSE_1D)", type=["csv", "xlsx"],
+                                   accept_multiple_files=True, key="closing-prices")
+        if exports and st.button("Importer les cours"):
+            try:
+                count = import_price_exports([(f.name, f.getvalue()) for f in exports])
+                st.success(f"{count} cours importés.")
+            except ValueError as e:
+                st.error(f"Export de cours invalide : {e}")
+
 def main():
+    profile = startup_profile()
+    job_workers(profile)
     st.title("Application de traitement des fichiers Excel")
 
-    uploaded_files = st.file_uploader("Sélectionnez un ou plusieurs fichiers Excel", type=["xlsx"], accept_multiple_files=True)
-    trade_date = st.date_input("Sélectionnez la date")
+    uploaded_files = st.file_uploader("Sélectionnez un ou plusieurs fichiers Excel", type=["xlsx", "zip"],
+                                      accept_multiple_files=True,
+                                      help="Plusieurs dates possibles : date AAAAMMJJ dans le nom du fichier ou "
+                                           "de son dossier (archive zip de data/raw).")
+    trade_date = st.date_input("Sélectionnez la date", help="Pour les fichiers dont la date n'a pu être déduite.")
+    intraday = st.checkbox("Mode intrajournalier : ajouter les nouveaux fichiers à ceux déjà traités pour cette date")
+    formats = st.multiselect("Formats du fichier traité", list(EXPORT_FORMATS), default=["xlsx"],
+                             help="Hors xlsx, les formules Bloomberg (Closing1d, Level des Outright) sans cours local sont laissées vides.")
 
-    if uploaded_files and trade_date:
+    if uploaded_files and trade_date and formats:
         if st.button("Traiter les fichiers"):
-            with st.spinner("Traitement en cours..."):
-                processed_df = process_files(uploaded_files, pd.to_datetime(trade_date))
-                if processed_df is not None:
-                    # Sauvegarde dans data/processed (remplacement des données pour la date donnée)
-                    save_processed_data(processed_df)
-                    download_buffer = postprocess_excel(processed_df)
-                    st.success("Traitement terminé!")
-                    # Formatage de la date au format YYYYMMDD pour nommer le fichier
-                    filename_date = pd.to_datetime(trade_date).strftime("%Y%m%d")
-                    st.download_button(
-                        label="Télécharger le fichier traité",
-                        data=download_buffer,
-                        file_name=f"{filename_date}.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-                    st.info("💡 Le fichier sera automatiquement téléchargé dans le dossier 'Téléchargements' par défaut de votre navigateur.")
-                    st.dataframe(processed_df)
-
+            # Traitement dans un processus de la file : la page reste utilisable
+            groups, origins = group_by_date([(f.name, f.getvalue()) for f in uploaded_files], trade_date)
+            undated = [name for name, origin in origins.items() if origin == FROM_DEFAULT]
+            if len(groups) > 1 and undated:
+                st.info(f"{len(undated)} fichier(s) sans date reconnue traité(s) à la date choisie : "
+                        f"{', '.join(undated)}")
+            try:
+                if len(groups) == 1:
+                    key, files = next(iter(groups.items()))
+                    st.query_params["job"] = submit_job(files, pd.to_datetime(key, format="%Y%m%d"), intraday,
+                                                        formats)
+                else:
+                    st.query_params["job"] = submit_multi_date_job(groups, intraday, formats)
+            except JobQueueFull as e:
+                st.error(f"Trop de traitements en cours, réessayez dans quelques instants. ({e})")
+
+    job_id = st.query_params.get("job")
+    if job_id:
+        # Un traitement ouvert par son lien rejoint les traitements de la session
+        job_ids = st.session_state.setdefault("job_ids", [])
+        if job_id not in job_ids:
+            job_ids.append(job_id)
+        show_job(job_id)
+
+    show_recent_jobs()
+    show_roll_aggregates()
+    show_history_query()
+    show_closing_prices()
+    show_run_profile(last_run())
+    profile.record("premier affichage")
 
     # # ------------------------
     # # Affichage du calendrier en bas de page
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Code de référence et générateur synthétique des benchmarks
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(autouse=True)
+def work_dir(tmp_path, monkeypatch):
+    # data/cache, data/processed et les cours locaux sont relatifs au dossier courant
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
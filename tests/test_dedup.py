@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from synthetic import generate_grid, write_grid_files
+
+from app.dedup import drop_duplicate_chunk, drop_duplicate_trades, merge_sorted, trade_keys
+from app.export import write_output
+from app.pipeline import process_grid_files
+from app.streaming import stream_grid_files
+
+TRADE_DATE = pd.to_datetime("2024-12-16")
+
+
+def _overlapping_frames(seed):
+    # Deux exports qui se recouvrent, avec des lignes répétées dans chacun
+    grid = generate_grid(600, seed=seed, strip_share=0.05)
+    return [pd.concat([grid.iloc[:300], grid.iloc[20:40]], ignore_index=True),
+            pd.concat([grid.iloc[200:600], grid.iloc[20:40]], ignore_index=True)]
+
+
+def _chunked(frames, chunk_rows):
+    # Même parcours que le mode streaming (voir app.streaming._spill_trades)
+    known = np.array([], dtype=np.uint64)
+    kept, dropped = [], []
+    for df in frames:
+        file_hashes, file_keys, file_kept, file_dropped = np.array([], dtype=np.uint64), [], [], 0
+        for start in range(0, len(df), chunk_rows):
+            chunk, count, keys, file_hashes = drop_duplicate_chunk(df.iloc[start:start + chunk_rows],
+                                                                   known, file_hashes)
+            file_kept.append(chunk)
+            file_keys.append(keys)
+            file_dropped += count
+        known = merge_sorted(known, np.concatenate(file_keys))
+        kept.append(pd.concat(file_kept, ignore_index=True))
+        dropped.append(file_dropped)
+    return kept, dropped, known
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 53, 1000])
+def test_chunked_dedup_matches_batch(work_dir, chunk_rows):
+    frames = _overlapping_frames(seed=4)
+    expected, expected_dropped, expected_keys = drop_duplicate_trades(frames, cache_dir=str(work_dir / "hashes"))
+    kept, dropped, keys = _chunked(frames, chunk_rows)
+
+    assert dropped == expected_dropped == [0, 120]
+    assert np.array_equal(keys, np.sort(expected_keys))
+    for df, expected_df in zip(kept, expected):
+        pd.testing.assert_frame_equal(df, expected_df)
+
+
+def test_identical_rows_within_a_file_are_kept():
+    df = generate_grid(50, seed=1)
+    doubled = pd.concat([df, df], ignore_index=True)
+    assert len(np.unique(trade_keys(doubled))) == len(doubled)
+    kept, dropped, _ = drop_duplicate_trades([doubled, df], cache_dir=None)
+    assert dropped == [0, len(df)] and len(kept[0]) == len(doubled)
+
+
+def test_streaming_output_matches_batch(work_dir):
+    paths = [path for k, df in enumerate(_overlapping_frames(seed=4))
+             for path in write_grid_files(df, str(work_dir / "raw"), 10 ** 6, prefix=f"grid{k}_")]
+    files = [(os.path.basename(path), path) for path in paths]
+    batch_messages, stream_messages = [], []
+
+    write_output(process_grid_files(files, TRADE_DATE, report_error=batch_messages.append), "batch.csv", "csv")
+    stream_grid_files(files, TRADE_DATE, "stream.csv", report_error=stream_messages.append, chunk_rows=53)
+
+    # Même contenu ; les lignes Roll Screen ou Outright de même heure peuvent changer d'ordre
+    batch, stream = pd.read_csv("batch.csv"), pd.read_csv("stream.csv")
+    assert stream_messages == batch_messages
+    pd.testing.assert_frame_equal(stream.sort_values(list(stream.columns)).reset_index(drop=True),
+                                  batch.sort_values(list(batch.columns)).reset_index(drop=True),
+                                  check_dtype=False)
@@ -0,0 +1,54 @@
+import json
+import os
+
+import pandas as pd
+
+from synthetic import generate_grid
+
+from app import history
+from app.history import read_manifest, read_roll_aggregates, save_day
+from app.pipeline import process_frames
+
+DATES = ["20241216", "20241217", "20241218"]
+
+
+def _day(key, seed):
+    return process_frames([generate_grid(300, seed=seed)], pd.to_datetime(key, format="%Y%m%d"))
+
+
+def test_save_day_only_writes_its_date():
+    for seed, key in enumerate(DATES[:2]):
+        save_day(_day(key, seed), "history")
+    untouched = [os.path.join("history", history.MANIFEST_DIR, f"{DATES[0]}.json"),
+                 os.path.join("history", history.AGGREGATES_DIR, f"date={DATES[0]}.parquet")]
+    before = [os.stat(path).st_mtime_ns for path in untouched]
+    save_day(_day(DATES[2], 2), "history")
+    save_day(_day(DATES[1], 3), "history")
+    assert [os.stat(path).st_mtime_ns for path in untouched] == before
+    assert list(read_manifest("history")) == DATES
+    assert list(read_manifest("history", DATES[1], DATES[1])) == [DATES[1]]
+    aggregates = read_roll_aggregates(DATES[1], DATES[2], "history")
+    assert sorted(aggregates['Date'].dt.strftime("%Y%m%d").unique()) == DATES[1:]
+
+
+def test_legacy_files_are_split_on_save():
+    days = {key: _day(key, seed) for seed, key in enumerate(DATES)}
+    for key in DATES[:2]:
+        save_day(days[key], "history")
+    expected = read_roll_aggregates(history_dir="history")
+    # Historique à l'ancien format : un seul manifeste et une seule table d'agrégats
+    manifest = read_manifest("history")
+    with open(os.path.join("history", history.MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    expected.to_parquet(os.path.join("history", history.AGGREGATES_NAME), index=False)
+    for directory in (history.MANIFEST_DIR, history.AGGREGATES_DIR):
+        for name in os.listdir(os.path.join("history", directory)):
+            os.remove(os.path.join("history", directory, name))
+    assert read_manifest("history") == manifest
+    pd.testing.assert_frame_equal(read_roll_aggregates(history_dir="history"), expected)
+
+    save_day(days[DATES[2]], "history")
+    assert not os.path.exists(os.path.join("history", history.MANIFEST_NAME))
+    assert not os.path.exists(os.path.join("history", history.AGGREGATES_NAME))
+    assert list(read_manifest("history")) == DATES
+    pd.testing.assert_frame_equal(read_roll_aggregates(DATES[0], DATES[1], "history"), expected)
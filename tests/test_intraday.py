@@ -0,0 +1,110 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from synthetic import generate_grid, write_grid_files
+
+from app import intraday
+from app.history import date_key, partition_path, read_manifest, save_day, to_columnar
+from app.ingestion import restore_text_nulls
+from app.intraday import append_grid_files, day_dir, day_output, read_state, save_update, update_output
+from app.pipeline import process_grid_files
+
+TRADE_DATE = pd.to_datetime("2024-12-16")
+GRID_ROWS = 600
+
+
+def _slices(work_dir, seed, count):
+    # Fichiers d'une journée découpée par heure, du plus ancien au plus récent ;
+    # Volume sert d'identifiant de ligne
+    grid = generate_grid(GRID_ROWS, seed=seed)
+    grid['Volume'] = np.arange(len(grid)) + 100
+    paths = write_grid_files(grid, str(work_dir / "raw"), rows_per_file=-(-GRID_ROWS // count))
+    return [(os.path.basename(path), path) for path in reversed(paths)]
+
+
+def _incremental(files, state_dir):
+    for file in files:
+        assert append_grid_files([file], TRADE_DATE, state_dir, report_error=pytest.fail) is not None
+    return day_output(TRADE_DATE, state_dir)
+
+
+def _rolls(df):
+    # Volume de chaque leg -> Volume des legs de son Roll (vide hors Roll)
+    legs = df[df['Volume'].notna() & (df['Structure'] != 'Roll')]
+    roll_ids = legs['Structure_ID'].str.replace(r"-L\d+$", "", regex=True)
+    volumes = legs['Volume'].astype(int)
+    members = volumes.groupby(roll_ids).agg(frozenset)
+    return {volume: members[roll_id] if "-R-" in roll_id else frozenset()
+            for volume, roll_id in zip(volumes, roll_ids)}
+
+
+@pytest.mark.parametrize("seed, count", [(0, 2), (1, 3), (2, 4)])
+def test_incremental_output_is_stable(work_dir, seed, count):
+    files = _slices(work_dir, seed, count)
+    first = _incremental(files, "state-a")
+    pd.testing.assert_frame_equal(first, _incremental(files, "state-b"))
+
+
+def test_same_file_is_not_added_twice(work_dir):
+    files = _slices(work_dir, 0, 3)
+    before = _incremental(files, "state")
+    updates = read_state(day_dir(TRADE_DATE, "state"))["updates"]
+    summary = append_grid_files([files[1]], TRADE_DATE, "state", report_error=pytest.fail)
+    assert summary == {"rows": 0, "rolls": 0, "skipped": [files[1][0]], "update": updates}
+    assert read_state(day_dir(TRADE_DATE, "state"))["updates"] == updates
+    pd.testing.assert_frame_equal(before, day_output(TRADE_DATE, "state"))
+
+
+@pytest.mark.parametrize("seed, count", [(0, 2), (1, 3), (2, 4), (3, 3)])
+def test_divergence_from_batch_is_limited_to_pairs_across_files(work_dir, seed, count):
+    files = _slices(work_dir, seed, count)
+    incremental = _incremental(files, "state")
+    batch = process_grid_files(files, TRADE_DATE, report_error=pytest.fail)
+    assert len(incremental) == len(batch)
+    file_of = {int(volume): position for position, (_, path) in enumerate(files)
+               for volume in pd.read_excel(path)['Volume']}
+    incremental_rolls, batch_rolls = _rolls(incremental), _rolls(batch)
+    assert incremental_rolls.keys() == batch_rolls.keys()
+
+    def across_files(volume):
+        # Leg appariée, dans le traitement complet, à une leg d'un autre fichier
+        return len({file_of[other] for other in batch_rolls[volume]}) > 1
+
+    for volume in batch_rolls:
+        if incremental_rolls[volume] == batch_rolls[volume]:
+            continue
+        # Une paire n'est différente que si elle touche une paire du
+        # traitement complet entre deux fichiers, qu'une mise à jour ne voit pas
+        touched = incremental_rolls[volume] | batch_rolls[volume] | {volume}
+        assert any(across_files(other) for other in touched), volume
+
+
+@pytest.mark.parametrize("seed, count", [(0, 2), (1, 3), (2, 4)])
+def test_update_saves_only_changed_rows(work_dir, monkeypatch, seed, count):
+    files = _slices(work_dir, seed, count)
+    # La journée entière n'est enregistrée qu'à la première mise à jour
+    full_saves = []
+    monkeypatch.setattr(intraday, "save_day", lambda *args, **kwargs: full_saves.append(save_day(*args, **kwargs)))
+    exported = 0
+    for file in files:
+        summary = append_grid_files([file], TRADE_DATE, "state", report_error=pytest.fail)
+        changed, replaced = update_output(TRADE_DATE, summary["update"], "state")
+        # Nouvelles lignes et legs réappariées (les lignes de synthèse reprennent le Volume d'une leg)
+        assert changed['Volume'].nunique() == summary["rows"] + len(replaced)
+        save_update(TRADE_DATE, summary["update"], changed, replaced, "state", "history")
+        exported += len(changed)
+    assert len(full_saves) == 1
+    entry = read_manifest("history")[date_key(TRADE_DATE)]
+    assert entry["intraday_update"] == len(files)
+
+    # La partition complétée mise à jour par mise à jour contient les lignes de la journée entière
+    def rows(df):
+        df = restore_text_nulls(to_columnar(df.drop(columns=['Level', 'Closing1d'])))
+        return df.sort_values(list(df.columns), kind='stable').reset_index(drop=True)
+
+    saved = pd.read_parquet(partition_path(date_key(TRADE_DATE), "history"))
+    pd.testing.assert_frame_equal(rows(saved), rows(day_output(TRADE_DATE, "state")), check_dtype=False)
+    assert exported > len(saved)
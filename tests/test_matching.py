@@ -0,0 +1,106 @@
+import io
+import os
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import reference
+from synthetic import generate_grid, write_grid_files
+
+from app import matching
+from app.ingestion import read_grid_file
+from app.matching import MULTI_LEG_WINDOW, TOLERANCE, contract_index, match_roll_pairs
+from app.pipeline import prepare_trades, process_frames
+
+TRADE_DATE = pd.to_datetime("2024-12-16")
+# Petites journées : le code de référence est quadratique
+GRID_ROWS = 150
+
+
+def _grid(seed, strip_share=0.0):
+    # Paires de Roll, rolls groupés (L0) et lignes sans prix ; Volume sert d'identifiant de ligne
+    grid = generate_grid(GRID_ROWS, grouped_share=0.05, seed=seed, strip_share=strip_share)
+    grid['Volume'] = np.arange(len(grid)) + 100
+    return grid
+
+
+def _reference(paths):
+    uploads = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            upload = io.BytesIO(f.read())
+        upload.name = os.path.basename(path)
+        uploads.append(upload)
+    with warnings.catch_warnings():
+        # Le code de référence déclenche des FutureWarning de pandas
+        warnings.simplefilter("ignore", FutureWarning)
+        expected = reference.process_files(uploads, TRADE_DATE)
+    # OpenInt n'est plus lu (colonne inutilisée)
+    return expected.drop(columns=['OpenInt'], errors='ignore')
+
+
+def _current(paths):
+    return process_frames([read_grid_file(path) for path in paths], TRADE_DATE)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_matches_reference(work_dir, seed):
+    paths = write_grid_files(_grid(seed), str(work_dir / "raw"), rows_per_file=60)
+    pd.testing.assert_frame_equal(_reference(paths), _current(paths))
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_matches_reference_with_strips_as_pairs(work_dir, monkeypatch, seed):
+    # Sans détection des structures à plus de deux legs, les strips (legs
+    # simultanées) sont appariés deux à deux comme dans la boucle d'origine
+    monkeypatch.setattr(matching, "MIN_MULTI_LEGS", len(_grid(seed)) + 1)
+    paths = write_grid_files(_grid(seed, strip_share=0.2), str(work_dir / "raw"), rows_per_file=60)
+    pd.testing.assert_frame_equal(_reference(paths), _current(paths))
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_missing_times_are_never_matched(work_dir, seed):
+    # Le code de référence ne lit pas les heures manquantes : on le compare
+    # sur la journée sans ces lignes, qui ne changent pas les autres Structure_ID
+    grid = _grid(seed)
+    undated = np.random.default_rng(seed).random(len(grid)) < 0.1
+    undated &= grid['Ticker'].str.len() != matching.GROUPED_TICKER_LEN
+    assert undated.any()
+    paths = write_grid_files(grid[~undated], str(work_dir / "ref"), rows_per_file=60)
+    expected = _reference(paths)
+    grid.loc[undated, 'Time'] = None
+    current = _current(write_grid_files(grid, str(work_dir / "raw"), rows_per_file=60))
+
+    def structure_ids(df):
+        legs = df[df['Volume'].notna()]
+        return dict(zip(legs['Volume'].astype(int), legs['Structure_ID']))
+
+    current_ids = structure_ids(current)
+    assert all(current_ids.pop(volume).endswith(("-O", "-S")) for volume in grid.loc[undated, 'Volume'])
+    assert current_ids == structure_ids(expected)
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_strips_form_one_structure(seed):
+    # Autres lignes sans prix : aucune ne peut prendre une leg de strip avant sa première leg
+    grid = generate_grid(2000, roll_share=0.0, screen_share=1.0, seed=seed, strip_share=0.1)
+    trades = prepare_trades([grid], TRADE_DATE)
+    priced = trades[trades['Price'].notna()]
+    roll_numbers, legs = match_roll_pairs(priced['Ticker'].to_numpy(), priced['Size'].to_numpy(dtype=float),
+                                          priced['Price'].to_numpy(dtype=float), priced['seconds'].to_numpy())
+    structures = pd.DataFrame({'roll': roll_numbers, 'leg': legs, 'Ticker': priced['Ticker'].to_numpy(),
+                               'Size': priced['Size'].to_numpy(dtype=float),
+                               'Price': priced['Price'].to_numpy(dtype=float),
+                               'seconds': priced['seconds'].to_numpy()})
+    structures = structures[structures['roll'] > 0].groupby('roll').filter(lambda group: len(group) > 2)
+    assert structures['roll'].nunique() == int(2000 * 0.1) // 3
+    for _, group in structures.sort_values('leg').groupby('roll'):
+        assert group['leg'].tolist() == list(range(1, len(group) + 1))
+        assert group['Ticker'].str[:3].nunique() == 1
+        steps = np.diff(contract_index(group['Ticker'].to_numpy()))
+        assert (steps > 0).all() and len(set(steps)) == 1
+        assert group['seconds'].max() - group['seconds'].min() <= 2 * MULTI_LEG_WINDOW
+        for name in ('Size', 'Price'):
+            assert (np.abs(group[name] - group[name].iloc[0]) <= 2 * TOLERANCE * group[name].iloc[0]).all()
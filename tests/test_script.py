@@ -0,0 +1,35 @@
+import importlib.util
+import os
+
+import pandas as pd
+import pytest
+
+from synthetic import generate_grid, write_grid_files
+
+from app.ingestion import read_grid_file
+from app.pipeline import OUTPUT_COLUMNS, process_frames
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRADE_DATE = pd.to_datetime("2024-12-16")
+
+
+def _load_script():
+    # Nom de fichier avec un tiret : chargé par son chemin
+    pytest.importorskip("tkinter")
+    spec = importlib.util.spec_from_file_location("script_hugo", os.path.join(ROOT, "app", "script-hugo.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.mark.parametrize("strip_share", [0.0, 0.1])
+def test_script_columns_match_app(work_dir, strip_share):
+    script = _load_script()
+    paths = write_grid_files(generate_grid(300, seed=3, strip_share=strip_share), str(work_dir / "raw"), 100)
+    frames = [read_grid_file(path) for path in paths]
+
+    output = script.build_output(pd.concat(frames, ignore_index=True), TRADE_DATE.date())
+
+    assert set(output.columns) == set(OUTPUT_COLUMNS)
+    assert set(output.columns) == set(process_frames(frames, TRADE_DATE).columns)
+    assert not [name for name in output.columns if name.startswith('ticker_')]
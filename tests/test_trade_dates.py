@@ -0,0 +1,27 @@
+import pandas as pd
+
+from synthetic import generate_grid, write_grid_files
+
+from app.pipeline import process_grid_files
+from app.trade_dates import FROM_TRADES, group_by_date
+
+
+def _upload(df, directory):
+    path, = write_grid_files(df, directory, 10 ** 6)
+    with open(path, 'rb') as f:
+        return ("grid1.xlsx", f.read())
+
+
+def test_dated_time_cells_keep_their_clock(work_dir):
+    grid = generate_grid(200, seed=2)
+    dated = grid.assign(Time="2024-12-17 " + grid['Time'])
+    name, data = _upload(dated, str(work_dir / "dated"))
+
+    groups, origins = group_by_date([(name, data)], pd.Timestamp("2024-12-16"))
+    assert list(groups) == ["20241217"] and origins[name] == FROM_TRADES
+
+    trade_date = pd.to_datetime("2024-12-17")
+    output = process_grid_files(groups["20241217"], trade_date)
+    expected = process_grid_files([_upload(grid, str(work_dir / "plain"))], trade_date)
+    assert output['Time'].notna().all()
+    pd.testing.assert_frame_equal(output, expected)
@@ -0,0 +1,27 @@
+from synthetic import generate_grid, write_grid_files
+
+from app.batch import read_batch_manifest, run_batch
+from app.watch import FolderWatcher
+
+
+def _write_day(raw_dir, key, seed):
+    return write_grid_files(generate_grid(200, seed=seed), f"{raw_dir}/{key}", rows_per_file=100)
+
+
+def test_watcher_and_batch_keep_each_other_dates():
+    _write_day("raw", "20241216", 0)
+    _write_day("raw", "20241217", 1)
+    # Date arrivée dans le dossier surveillé après le démarrage du lot
+    watched = _write_day("incoming", "20241218", 2)
+    watcher = FolderWatcher("incoming", "out", "history", log=lambda message: None, run_log="runs.jsonl")
+    recorded = []
+
+    def log(message):
+        # La surveillance inscrit sa date entre les deux dates du lot
+        if not recorded:
+            recorded.append(watcher.process("20241218", watched))
+
+    status = run_batch("raw", "out", "history", workers=1, log=log, run_log="runs.jsonl")
+    assert recorded == ["ok"]
+    assert status == {"20241216": "ok", "20241217": "ok"}
+    assert sorted(read_batch_manifest("out")) == ["20241216", "20241217", "20241218"]